@@ -0,0 +1,11 @@
+# -*- coding=utf-8 -*-
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+
+def verify_cache():
+    from passa.internals.dependencies import verify_dependency_cache
+
+    checked, upgraded, deleted = verify_dependency_cache()
+    print("Checked {0} dependency cache entries ({1} upgraded, {2} dropped)"
+          .format(checked, upgraded, deleted))
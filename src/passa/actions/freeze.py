@@ -41,8 +41,22 @@ def open_for_output(filename):
         yield f
 
 
+def _targets_as_lines(targets):
+    lines = []
+    if targets.platforms:
+        lines.append("# Hashes only cover platforms: {}".format(
+            ", ".join(targets.platforms),
+        ))
+    if targets.python_versions:
+        lines.append("# Hashes only cover Python versions: {}".format(
+            ", ".join(targets.python_versions),
+        ))
+    return lines
+
+
 def freeze(project=None, default=True, dev=True, include_hashes=None, target=None):
     from requirementslib import Requirement
+    from passa.internals.targets import get_environment_mismatch, get_targets
 
     lockfile = project.lockfile
     if not lockfile:
@@ -65,6 +79,15 @@ def freeze(project=None, default=True, dev=True, include_hashes=None, target=Non
     if include_hashes is None:
         include_hashes = all(r.is_named for r in requirements)
 
+    targets = get_targets(lockfile)
+    if include_hashes and targets:
+        target_lines = _targets_as_lines(targets)
+        mismatch = get_environment_mismatch(targets)
+        if mismatch:
+            print("Warning: {}".format(mismatch), file=sys.stderr)
+    else:
+        target_lines = []
+
     sources = lockfile.meta.sources._data
 
     source_lines = list(vistir.misc.dedup(itertools.chain(
@@ -84,6 +107,9 @@ def freeze(project=None, default=True, dev=True, include_hashes=None, target=Non
     ))
 
     with open_for_output(target) as f:
+        for line in target_lines:
+            f.write(line)
+            f.write("\n")
         for line in source_lines:
             f.write(line)
             f.write("\n")
@@ -3,12 +3,25 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
 
-def lock(project=None):
+def lock(project=None, platforms=None, python_versions=None,
+         all_targets=False, instrument=None):
+    from passa.internals.targets import Targets
     from passa.models.lockers import BasicLocker
     from passa.operations.lock import lock
 
+    if all_targets and (platforms or python_versions):
+        raise ValueError("all_targets cannot be used with targets")
     project = project
     locker = BasicLocker(project)
+    if all_targets:
+        locker.targets = None
+    elif platforms or python_versions:
+        locker.targets = Targets(
+            platforms=tuple(platforms or ()),
+            python_versions=tuple(python_versions or ()),
+        )
+    if instrument:
+        locker.instrument_path = instrument
     success = lock(locker)
     if not success:
         return
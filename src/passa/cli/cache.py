@@ -0,0 +1,24 @@
+# -*- coding=utf-8 -*-
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from ..actions.cache import verify_cache
+from ._base import BaseCommand
+from .options import cache_action
+
+
+class Command(BaseCommand):
+
+    name = "cache"
+    description = "Maintain the local cache."
+    # The cache is not tied to a project.
+    default_arguments = []
+    arguments = [cache_action]
+
+    def run(self, options):
+        if options.action == "verify":
+            return verify_cache()
+
+
+if __name__ == "__main__":
+    Command.run_parser()
@@ -2,16 +2,37 @@
 
 from __future__ import absolute_import, print_function, unicode_literals
 
+import re
+
 from ..actions.lock import lock
 from ._base import BaseCommand
+from .options import instrument, targets_group
 
 
 class Command(BaseCommand):
     name = "lock"
     description = "Generate Pipfile.lock."
+    arguments = [targets_group, instrument]
 
     def run(self, options):
-        return lock(project=options.project)
+        if options.all_targets and (
+                options.platforms or options.python_versions):
+            self.parser.error(
+                "--all-targets cannot be used with --target-platform or "
+                "--target-python",
+            )
+        for version in options.python_versions:
+            if not re.match(r"^\d+\.\d+$", version):
+                self.parser.error("invalid Python version {0!r}".format(
+                    version,
+                ))
+        return lock(
+            project=options.project,
+            platforms=options.platforms,
+            python_versions=options.python_versions,
+            all_targets=options.all_targets,
+            instrument=options.instrument,
+        )
 
 
 if __name__ == "__main__":
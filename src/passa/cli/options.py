@@ -69,6 +69,19 @@ class ArgumentGroup(object):
         self.parser = parser
 
 
+cache_action = Option(
+    "action", choices=["verify"],
+    help="what to do; \"verify\" checks every dependency cache entry, "
+         "upgrading entries written by older versions, and dropping broken "
+         "ones",
+)
+
+instrument = Option(
+    "--instrument", metavar="file", default=None,
+    help="write where locking time goes to this file, as JSON "
+         "(default is $PASSA_INSTRUMENT_FILE)",
+)
+
 project = Option(
     "--project", metavar="project", default=os.getcwd(), type=Project,
     help="path to project root (directory containing Pipfile)",
@@ -150,7 +163,25 @@ strategy = Option(
     help="how dependency upgrading is handled",
 )
 
+target_platform = Option(
+    "--target-platform", dest="platforms", action="append", default=[],
+    metavar="platform",
+    help="only hash wheels for this platform tag, wildcards allowed (can be used multiple times)",
+)
+
+target_python = Option(
+    "--target-python", dest="python_versions", action="append", default=[],
+    metavar="X.Y",
+    help="only hash wheels for this Python version (can be used multiple times)",
+)
+
+all_targets = Option(
+    "--all-targets", action="store_true", default=False,
+    help="hash wheels for all platforms and Python versions, dropping targets in Pipfile.lock",
+)
+
 include_hashes_group = ArgumentGroup("include_hashes", is_mutually_exclusive=True, options=[include_hashes, no_include_hashes])
 dev_group = ArgumentGroup("dev", is_mutually_exclusive="True", options=[dev_only, default_only])
 package_group = ArgumentGroup("packages", options=[packages, editable, dev, no_sync])
 new_project_group = ArgumentGroup("new-project", options=[new_project, python_version])
+targets_group = ArgumentGroup("targets", options=[target_platform, target_python, all_targets])
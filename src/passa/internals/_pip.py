@@ -7,8 +7,12 @@ import io
 import itertools
 import distutils.log
 import os
+import subprocess
+import sys
+import threading
 
 import distlib.database
+import distlib.metadata
 import distlib.scripts
 import distlib.wheel
 import packaging.utils
@@ -17,7 +21,14 @@ import setuptools.dist
 import six
 import vistir
 
+try:
+    import pep517.build
+    import pep517.wrappers
+except ImportError:
+    pep517 = None
+
 from ..models.caches import CACHE_DIR
+from . import instruments
 from ._pip_shims import VCS_SUPPORT, build_wheel as _build_wheel, unpack_url
 from .utils import filter_sources
 
@@ -82,18 +93,74 @@ class _PipCommand(pip_shims.Command):
     name = "PipCommand"
 
 
+def _get_pool_maxsize():
+    try:
+        return int(os.environ.get("PASSA_MAX_CONNECTIONS_PER_HOST", ""))
+    except ValueError:
+        return 10   # Matches the default of requests.
+
+
 def _get_pip_session(trusted_hosts):
     cmd = _PipCommand()
     options, _ = cmd.parser.parse_args([])
     options.cache_dir = CACHE_DIR
     options.trusted_hosts = trusted_hosts
     session = cmd._build_session(options)
+
+    # Re-initialize the connection pools so a worker has enough connections to
+    # each host. We want to keep pip's adapters (they implement caching and
+    # insecure hosts), so only the pool managers are rebuilt.
+    maxsize = _get_pool_maxsize()
+    for adapter in set(session.adapters.values()):
+        try:
+            init_poolmanager = adapter.init_poolmanager
+        except AttributeError:
+            continue
+        init_poolmanager(adapter._pool_connections, maxsize)
+
+    session.hooks["response"].append(_record_response)
+    return session
+
+
+def _record_response(response, *args, **kwargs):
+    # Downloaded size is taken from the headers, so the response is not read
+    # here, and is left to be streamed if requested.
+    if getattr(response, "from_cache", False):
+        instruments.count("http.cached_responses")
+        return
+    instruments.count("http.requests")
+    try:
+        length = int(response.headers.get("Content-Length", ""))
+    except ValueError:
+        return
+    instruments.count("http.bytes", length)
+
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_session(sources):
+    """Get a shared pip session for the given Pipfile sources.
+
+    Sessions are registered by the source list and trusted hosts, so every
+    network operation against the same indexes reuses the same connections
+    (and TLS handshakes) during a run. The number of kept-alive connections to
+    each host can be configured with ``PASSA_MAX_CONNECTIONS_PER_HOST``.
+    """
+    index_urls, trusted_hosts = _get_pip_index_urls(sources)
+    key = (tuple(index_urls), tuple(sorted(trusted_hosts)))
+    with _SESSIONS_LOCK:
+        try:
+            session = _SESSIONS[key]
+        except KeyError:
+            session = _SESSIONS[key] = _get_pip_session(trusted_hosts)
     return session
 
 
 def _get_finder(sources):
     index_urls, trusted_hosts = _get_pip_index_urls(sources)
-    session = _get_pip_session(trusted_hosts)
+    session = get_session(sources)
     finder = pip_shims.PackageFinder(
         find_links=[],
         index_urls=index_urls,
@@ -134,22 +201,20 @@ class WheelBuildError(RuntimeError):
     pass
 
 
-def build_wheel(ireq, sources, hashes=None):
-    """Build a wheel file for the InstallRequirement object.
+# pip's build machinery (e.g. RequirementTracker) keeps process-wide state,
+# so only one artifact can be built (or have its metadata generated) at a
+# time. Downloading and unpacking happen outside the lock, each into a build
+# directory of its own (see `_prepare_wheel_building_kwargs()`), so they can
+# still run concurrently.
+_BUILD_LOCK = threading.Lock()
 
-    An artifact is downloaded (or read from cache). If the artifact is not a
-    wheel, build one out of it. The dynamically built wheel is ephemeral; do
-    not depend on its existence after the returned wheel goes out of scope.
 
-    If `hashes` is truthy, it is assumed to be a list of hashes (as formatted
-    in Pipfile.lock) to be checked against the download.
+def _prepare_source(ireq, finder, kwargs, hashes=None):
+    """Locate the artifact of an InstallRequirement, and fetch it.
 
-    Returns a `distlib.wheel.Wheel` instance. Raises a `WheelBuildError` (a
-    `RuntimeError` subclass) if the wheel cannot be built.
+    Wheels are only downloaded into the wheel download directory. Other kinds
+    of artifacts are also unpacked into `ireq.source_dir`.
     """
-    kwargs = _prepare_wheel_building_kwargs(ireq)
-    finder = _get_finder(sources)
-
     # Not for upgrade, hash not required. Hashes are not required here even
     # when we provide them, because pip skips local wheel cache if we set it
     # to True. Hashes are checked later if we need to download the file.
@@ -181,21 +246,122 @@ def build_wheel(ireq, sources, hashes=None):
             hashes=ireq.hashes(False), progress_bar="off",
         )
 
+
+def build_wheel(ireq, sources, hashes=None):
+    """Build a wheel file for the InstallRequirement object.
+
+    An artifact is downloaded (or read from cache). If the artifact is not a
+    wheel, build one out of it. The dynamically built wheel is ephemeral; do
+    not depend on its existence after the returned wheel goes out of scope.
+
+    If `hashes` is truthy, it is assumed to be a list of hashes (as formatted
+    in Pipfile.lock) to be checked against the download.
+
+    Returns a `distlib.wheel.Wheel` instance. Raises a `WheelBuildError` (a
+    `RuntimeError` subclass) if the wheel cannot be built.
+    """
+    kwargs = _prepare_wheel_building_kwargs(ireq)
+    finder = _get_finder(sources)
+    _prepare_source(ireq, finder, kwargs, hashes)
+
     if ireq.is_wheel:
         # If this is a wheel, use the downloaded thing.
         output_dir = kwargs["wheel_download_dir"]
         wheel_path = os.path.join(output_dir, ireq.link.filename)
     else:
         # Othereise we need to build an ephemeral wheel.
-        wheel_path = _build_wheel(
-            ireq, vistir.path.create_tracked_tempdir(prefix="ephem"),
-            finder, _get_wheel_cache(), kwargs,
-        )
-        if wheel_path is None or not os.path.exists(wheel_path):
-            raise WheelBuildError
+        with _BUILD_LOCK:
+            wheel_path = _build_wheel(
+                ireq, vistir.path.create_tracked_tempdir(prefix="ephem"),
+                finder, _get_wheel_cache(), kwargs,
+            )
+    if wheel_path is None or not os.path.exists(wheel_path):
+        raise WheelBuildError
     return distlib.wheel.Wheel(wheel_path)
 
 
+class MetadataPreparationError(RuntimeError):
+    pass
+
+
+# Taken from pip. This makes sure setuptools is used even if setup.py only
+# imports distutils, so the `egg_info` command is available.
+_SETUPTOOLS_SHIM = (
+    "import setuptools, tokenize;__file__=%r;"
+    "f=getattr(tokenize, 'open', open)(__file__);"
+    "code=f.read().replace('\\r\\n', '\\n');"
+    "f.close();"
+    "exec(compile(code, __file__, 'exec'))"
+)
+
+
+def _prepare_metadata_pep517(root, metadata_dir):
+    system = pep517.build.compat_system(root)
+    hooks = pep517.wrappers.Pep517HookCaller(root, system["build-backend"])
+    with hooks.subprocess_runner(pep517.wrappers.quiet_subprocess_runner):
+        name = hooks.prepare_metadata_for_build_wheel(metadata_dir)
+    path = os.path.join(metadata_dir, name, "METADATA")
+    return distlib.metadata.Metadata(path=path, scheme="legacy")
+
+
+def _prepare_metadata_egg_info(ireq, metadata_dir):
+    args = [
+        sys.executable, "-c", _SETUPTOOLS_SHIM % ireq.setup_py,
+        "egg_info", "--egg-base", metadata_dir,
+    ]
+    try:
+        subprocess.check_output(
+            args, cwd=ireq.setup_py_dir, stderr=subprocess.STDOUT,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise MetadataPreparationError(e)
+    for name in os.listdir(metadata_dir):
+        if name.endswith(".egg-info"):
+            path = os.path.join(metadata_dir, name)
+            return distlib.database.EggInfoDistribution(path).metadata
+    raise MetadataPreparationError("egg-info not found in {0}".format(
+        metadata_dir,
+    ))
+
+
+def prepare_metadata(ireq, sources):
+    """Generate metadata for the InstallRequirement object without building.
+
+    An artifact is downloaded (or read from cache) and unpacked. Metadata is
+    generated with the PEP 517 ``prepare_metadata_for_build_wheel`` hook if
+    the project has a pyproject.toml, or ``setup.py egg_info`` otherwise,
+    into a dedicated directory. Nothing is compiled. The hook is only used
+    if the optional `pep517` package is installed (``passa[pep517]``).
+
+    Returns a `distlib.metadata.Metadata` instance, or None if the artifact is
+    a wheel (use `build_wheel` instead). Raises a `MetadataPreparationError`
+    (a `RuntimeError` subclass) if metadata cannot be generated.
+    """
+    finder = _get_finder(sources)
+    ireq.populate_link(finder, False, False)
+    if ireq.is_wheel:
+        return None
+    _prepare_source(ireq, finder, _prepare_wheel_building_kwargs(ireq))
+    with _BUILD_LOCK:
+        return _prepare_metadata(ireq)
+
+
+def _prepare_metadata(ireq):
+    metadata_dir = vistir.path.create_tracked_tempdir(prefix="passa-meta")
+    root = ireq.setup_py_dir
+    has_setup_py = os.path.isfile(ireq.setup_py)
+    has_pyproject = os.path.isfile(os.path.join(root, "pyproject.toml"))
+    if pep517 is not None and has_pyproject:
+        try:
+            return _prepare_metadata_pep517(root, metadata_dir)
+        except Exception as e:
+            if not has_setup_py:
+                raise MetadataPreparationError(e)
+    if not has_setup_py:
+        raise MetadataPreparationError("{0} not found".format(ireq.setup_py))
+    return _prepare_metadata_egg_info(ireq, metadata_dir)
+
+
 def _obtrain_ref(vcs_obj, src_dir, name, rev=None):
     target_dir = os.path.join(src_dir, name)
     target_rev = vcs_obj.make_rev_options(rev)
@@ -216,11 +382,6 @@ def get_vcs_ref(requirement):
     return ref
 
 
-def find_installation_candidates(ireq, sources):
-    finder = _get_finder(sources)
-    return finder.find_all_candidates(ireq.name)
-
-
 class RequirementUninstaller(object):
     """A context manager to remove a package for the inner block.
 
@@ -390,8 +551,9 @@ def _find_egg_info(ireq):
 
 
 def read_sdist_metadata(ireq):
-    egg_info_dir = _find_egg_info(ireq)
-    if not egg_info_dir:
-        return None
-    distribution = distlib.database.EggInfoDistribution(egg_info_dir)
-    return distribution.metadata
+    with _BUILD_LOCK:
+        egg_info_dir = _find_egg_info(ireq)
+        if not egg_info_dir:
+            return None
+        distribution = distlib.database.EggInfoDistribution(egg_info_dir)
+        return distribution.metadata
@@ -0,0 +1,237 @@
+# -*- coding=utf-8 -*-
+
+"""Read metadata of a remote artifact without downloading it.
+
+Two strategies are used, in order:
+
+1. The PEP 658 metadata file, if the index advertises one for the wheel.
+2. HTTP range requests to read the zip central directory and the METADATA
+   member of the wheel, leaving the rest of the archive on the server.
+
+Sdists are not handled here; their metadata can only be known by building
+them, which needs the whole archive anyway.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+import io
+import posixpath
+import re
+import zipfile
+
+import packaging.version
+
+from pip_shims import Wheel
+
+from .indexes import IndexPageError, find_index_entries
+
+
+# Most wheels keep the central directory well within the last 8 KiB, so the
+# first request usually covers it entirely.
+_CHUNK_SIZE = 8192
+
+_METADATA_HASH_RE = re.compile(r"^([a-z0-9]+)=([a-f0-9]+)$")
+
+
+class _RangeNotSupported(Exception):
+    """The server did not answer a range request with a range.
+
+    If it sent the whole file instead, `content` holds it.
+    """
+    def __init__(self, url, content=None):
+        super(_RangeNotSupported, self).__init__(url)
+        self.content = content
+
+
+class _HTTPRangeFile(object):
+    """A read-only, seekable file over a remote URL, backed by range requests.
+
+    Only the parts actually read are downloaded. Fetched ranges are kept, so
+    `zipfile` seeking back and forth does not repeat requests.
+    """
+    def __init__(self, session, url):
+        self.session = session
+        self.url = url
+        self.position = 0
+        self._ranges = []   # List of (start, bytes).
+
+        response = self._request("bytes=-{0}".format(_CHUNK_SIZE))
+        content_range = response.headers.get("Content-Range", "")
+        match = re.match(r"^bytes (\d+)-\d+/(\d+)$", content_range)
+        if response.status_code == 200:
+            # The whole file is coming anyway; keep it for the caller.
+            raise _RangeNotSupported(self.url, response.content)
+        if response.status_code != 206 or not match:
+            response.close()
+            raise _RangeNotSupported(self.url)
+        self.length = int(match.group(2))
+        self._ranges.append((int(match.group(1)), response.content))
+
+    def _request(self, value):
+        # Streamed, so the body is not downloaded until we know it is the
+        # range we asked for.
+        response = self.session.get(self.url, stream=True, headers={
+            "Range": value, "Accept-Encoding": "identity",
+        })
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+        return response
+
+    def _fetch(self, start, end):
+        response = self._request("bytes={0}-{1}".format(start, end - 1))
+        if response.status_code != 206:
+            response.close()
+            raise _RangeNotSupported(self.url)
+        self._ranges.append((start, response.content))
+
+    def _find(self, start, end):
+        for offset, data in self._ranges:
+            if offset <= start and end <= offset + len(data):
+                return data[start - offset:end - offset]
+        return None
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += self.length
+        self.position = max(0, min(offset, self.length))
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        start = self.position
+        if size is None or size < 0:
+            end = self.length
+        else:
+            end = min(start + size, self.length)
+        if start >= end:
+            return b""
+        data = self._find(start, end)
+        if data is None:
+            fetch_end = min(start + _CHUNK_SIZE, self.length)
+            self._fetch(start, max(end, fetch_end))
+            data = self._find(start, end)
+            if data is None:
+                raise _RangeNotSupported(self.url)
+        self.position = end
+        return data
+
+    def close(self):
+        self._ranges = []
+
+
+def _is_metadata_name(name):
+    parts = name.split("/")
+    return (
+        len(parts) == 2 and parts[0].endswith(".dist-info") and
+        parts[1] == "METADATA"
+    )
+
+
+def _read_metadata_from_zip(f):
+    with zipfile.ZipFile(f) as zf:
+        for name in zf.namelist():
+            if _is_metadata_name(name):
+                return zf.read(name).decode("utf-8")
+    return None
+
+
+def _check_hash(content, value):
+    match = _METADATA_HASH_RE.match(value or "")
+    if not match:   # "true", or a hash format we don't understand.
+        return True
+    name, expected = match.groups()
+    try:
+        hasher = hashlib.new(name)
+    except ValueError:
+        return True
+    hasher.update(content)
+    return hasher.hexdigest() == expected
+
+
+def _read_metadata_file(session, entry):
+    response = session.get(entry.url + ".metadata")
+    response.raise_for_status()
+    if not _check_hash(response.content, entry.metadata):
+        raise ValueError("hash mismatch for {0}.metadata".format(entry.url))
+    return response.content.decode("utf-8")
+
+
+def _read_remote_wheel(session, entry):
+    try:
+        f = _HTTPRangeFile(session, entry.url)
+        try:
+            return _read_metadata_from_zip(f)
+        finally:
+            f.close()
+    except _RangeNotSupported as e:
+        content = e.content
+    # The server does not support ranges. Use the whole file if it was sent
+    # in place of the first range, otherwise download it.
+    if content is None:
+        response = session.get(entry.url)
+        response.raise_for_status()
+        content = response.content
+    f = io.BytesIO(content)
+    try:
+        return _read_metadata_from_zip(f)
+    finally:
+        f.close()
+
+
+def _get_wheel_priority(entry):
+    if posixpath.splitext(entry.filename)[1] != ".whl":
+        return None
+    try:
+        wheel = Wheel(entry.filename)
+    except Exception:
+        return None
+    # Prefer wheels that would be installed here, since metadata may differ
+    # between wheels of the same version in rare cases.
+    return 0 if wheel.supported() else 1
+
+
+def find_wheel_entries(name, version, sources):
+    """Find wheels of a given version, the most relevant first.
+    """
+    version = packaging.version.parse(version)
+    try:
+        entries = find_index_entries(name, sources)
+    except IndexPageError as e:
+        print(e)
+        return []
+    wheels = []
+    for entry in entries:
+        if entry.version != version:
+            continue
+        priority = _get_wheel_priority(entry)
+        if priority is None:
+            continue
+        # Wheels with a metadata file don't need range requests; try them
+        # first within the same priority.
+        wheels.append(((priority, entry.metadata is None), entry))
+    wheels.sort(key=lambda item: item[0])
+    return [entry for _, entry in wheels]
+
+
+def read_wheel_metadata(session, entry):
+    """Read the METADATA text of a remote wheel.
+
+    Returns None if the wheel does not contain metadata.
+    """
+    if entry.metadata:
+        try:
+            return _read_metadata_file(session, entry)
+        except Exception:
+            pass    # Fall back to reading the wheel itself.
+    return _read_remote_wheel(session, entry)
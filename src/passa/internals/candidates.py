@@ -6,7 +6,10 @@ import packaging.specifiers
 import packaging.version
 import requirementslib
 
-from ._pip import find_installation_candidates, get_vcs_ref
+from ._pip import get_vcs_ref
+from .indexes import find_index_entries
+from .requirements import LazyRequirement, get_specifier
+from .utils import get_pinned_version
 
 
 def _filter_matching_python_requirement(candidates, required_python):
@@ -51,7 +54,103 @@ def _requirement_from_metadata(name, version, extras, index):
     return r
 
 
-def find_candidates(requirement, sources, requires_python, allow_prereleases):
+class Candidate(LazyRequirement):
+    """A named candidate found on an index.
+
+    There can be hundreds of these for a package, but the resolver only needs
+    to identify and compare them until a candidate is visited. This holds just
+    enough to do that, with the version pre-parsed. A full requirement is
+    built when anything else is needed (e.g. to fetch dependencies).
+
+    Use `materialize()` to get the full requirement.
+    """
+    __slots__ = ("name", "version", "extras", "index")
+
+    def __init__(self, name, version, extras, index):
+        self.name = name
+        self.version = version
+        self.extras = tuple(extras or ())
+        self.index = index
+        self._requirement = None
+
+    def _key(self):
+        return (self.name, self.version, self.extras, self.index)
+
+    @property
+    def normalized_name(self):
+        return self.name
+
+    def as_line(self, include_hashes=True):
+        # Same as the requirement's; a candidate has no hashes or markers.
+        return "{0}{1}=={2}".format(
+            self.name, self.extras_as_pip, self.version,
+        )
+
+    def _build_requirement(self):
+        return _requirement_from_metadata(
+            self.name, self.version, list(self.extras), self.index,
+        )
+
+
+def materialize(candidate):
+    """Get a full `requirementslib.Requirement` for a candidate.
+    """
+    if isinstance(candidate, Candidate):
+        return candidate.as_requirement()
+    return candidate
+
+
+def _get_sources_key(sources):
+    return tuple(
+        (source.get("url"), source.get("verify_ssl", True))
+        for source in sources
+    )
+
+
+def _find_versions(icans, requires_python):
+    if requires_python:
+        matching_icans = list(_filter_matching_python_requirement(
+            icans, packaging.version.parse(requires_python),
+        ))
+        icans = matching_icans or icans
+
+    # An index lists one entry per artifact, so a version usually appears
+    # multiple times. We only need each once.
+    return sorted({c.version for c in icans})
+
+
+def _get_artifacts_key(name, sources, version):
+    return (name, _get_sources_key(sources), str(version))
+
+
+def _record_artifacts(artifacts, name, sources, icans):
+    # Every artifact is recorded, including those filtered out by
+    # Requires-Python, since they are all needed to hash a pinned version.
+    # The project may be looked up again under another cache key (e.g. with
+    # prereleases allowed), so entries replace what was recorded before
+    # instead of being added to it.
+    recorded = {}
+    for entry in icans:
+        key = _get_artifacts_key(name, sources, entry.version)
+        recorded.setdefault(key, []).append(entry)
+    artifacts.update(recorded)
+
+
+def find_candidates(requirement, sources, requires_python, allow_prereleases,
+                    cache=None, artifacts=None):
+    """Find candidates matching the requirement, sorted by version.
+
+    Named candidates are returned as `Candidate` instances.
+
+    If `cache` is given, it should be a dict-like object living through the
+    resolution. Available versions of a project are remembered in it, and
+    reused when the same project is looked up again (e.g. when the resolver
+    backtracks), so the index is only queried once per project.
+
+    If `artifacts` is given, it should also be a dict-like object. Index
+    entries seen while finding candidates are recorded into it, to be looked
+    up later with `find_recorded_artifacts()`.
+    """
     # A non-named requirement has exactly one candidate that is itself. For
     # VCS, we also lock the requirement to an exact ref.
     if not requirement.is_named:
@@ -60,27 +159,44 @@ def find_candidates(requirement, sources, requires_python, allow_prereleases):
             candidate.req.ref = get_vcs_ref(candidate)
         return [candidate]
 
-    ireq = requirement.as_ireq()
-    icans = find_installation_candidates(ireq, sources)
+    if cache is None:
+        cache = {}
 
-    if requires_python:
-        matching_icans = list(_filter_matching_python_requirement(
-            icans, packaging.version.parse(requires_python),
-        ))
-        icans = matching_icans or icans
+    name = requirement.normalized_name
+    key = (
+        name, _get_sources_key(sources),
+        requires_python, allow_prereleases,
+    )
+    try:
+        versions = cache[key]
+    except KeyError:
+        icans = find_index_entries(requirement.name, sources)
+        if artifacts is not None:
+            _record_artifacts(artifacts, name, sources, icans)
+        versions = cache[key] = _find_versions(icans, requires_python)
 
-    versions = sorted(ireq.specifier.filter(
-        (c.version for c in icans), allow_prereleases,
-    ))
-    if not allow_prereleases and not versions:
-        versions = sorted(ireq.specifier.filter(
-            (c.version for c in icans), True,
-        ))
+    # Use our own packaging, the versions are not compatible with pip's.
+    specifier = get_specifier(requirement)
+    matching_versions = list(specifier.filter(versions, allow_prereleases))
+    if not allow_prereleases and not matching_versions:
+        matching_versions = list(specifier.filter(versions, True))
 
-    name = requirement.normalized_name
     extras = requirement.extras
     index = requirement.index
     return [
-        _requirement_from_metadata(name, version, extras, index)
-        for version in versions
+        Candidate(name, version, extras, index)
+        for version in matching_versions
     ]
+
+
+def find_recorded_artifacts(artifacts, requirement, sources):
+    """Look up index entries recorded by `find_candidates()`.
+
+    `requirement` should be pinned. Returns a list of `IndexEntry`, or None if
+    the version was not seen when finding candidates.
+    """
+    version = packaging.version.parse(
+        get_pinned_version(requirement.as_ireq()),
+    )
+    key = _get_artifacts_key(requirement.normalized_name, sources, version)
+    return artifacts.get(key)
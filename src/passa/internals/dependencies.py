@@ -3,24 +3,56 @@
 from __future__ import absolute_import, unicode_literals
 
 import functools
+import io
 import os
 import sys
 
+import distlib.metadata
 import packaging.specifiers
 import packaging.utils
 import packaging.version
-import requests
-import requirementslib
 import six
 
-from ..models.caches import DependencyCache, RequiresPythonCache
-from ._pip import WheelBuildError, build_wheel, read_sdist_metadata
+from ..models.caches import get_dependency_cache
+from . import instruments
+from .artifacts import find_wheel_entries, read_wheel_metadata
+from ._pip import (
+    WheelBuildError, build_wheel, get_session, prepare_metadata,
+    read_sdist_metadata,
+)
 from .markers import contains_extra, get_contained_extras, get_without_extra
+from .requirements import parse_requirement_line
 from .utils import get_pinned_version, is_pinned
 
 
-DEPENDENCY_CACHE = DependencyCache()
-REQUIRES_PYTHON_CACHE = RequiresPythonCache()
+DEPENDENCY_CACHE = get_dependency_cache()
+
+# Stamped on every dependency cache entry. Entries are validated and
+# normalized before they are written, and trusted when read; bump this when
+# that changes, so entries written by older versions are not trusted.
+CACHE_SCHEMA = 1
+
+
+def _normalize_cache_entry(name, dependencies, requires_python):
+    """Validate and normalize dependencies of a package to be cached.
+
+    Raises an exception if the dependencies should not be cached.
+    """
+    requires_python = str(packaging.specifiers.SpecifierSet(requires_python))
+    lines = []
+    for line in dependencies:
+        requirement = parse_requirement_line(line)
+        # The "extra =" marker breaks everything.
+        if contains_extra(requirement.markers):
+            raise ValueError("{0!r} has an extra marker".format(line))
+        if requirement.normalized_name == name:
+            raise ValueError("{0!r} depends on itself".format(name))
+        lines.append(requirement.as_line(include_hashes=False))
+    return {
+        "dependencies": lines,
+        "requires_python": requires_python,
+        "schema": CACHE_SCHEMA,
+    }
 
 
 def _cached(f, **kwargs):
@@ -30,22 +62,22 @@ def _cached(f, **kwargs):
         result = f(ireq, **kwargs)
         if result is not None and is_pinned(ireq):
             deps, requires_python = result
-            DEPENDENCY_CACHE[ireq] = deps
-            REQUIRES_PYTHON_CACHE[ireq] = requires_python
+            try:
+                entry = _normalize_cache_entry(
+                    packaging.utils.canonicalize_name(ireq.name),
+                    deps, requires_python,
+                )
+            except Exception as e:
+                print("not caching dependencies of {0} ({1})".format(
+                    ireq.name, e,
+                ))
+            else:
+                DEPENDENCY_CACHE[ireq] = entry
         return result
 
     return wrapped
 
 
-def _is_cache_broken(line, parent_name):
-    dep_req = requirementslib.Requirement.from_line(line)
-    if contains_extra(dep_req.markers):
-        return True     # The "extra =" marker breaks everything.
-    elif dep_req.normalized_name == parent_name:
-        return True     # A package cannot depend on itself.
-    return False
-
-
 def _get_dependencies_from_cache(ireq):
     """Retrieves dependencies for the requirement from the dependency cache.
     """
@@ -54,33 +86,69 @@ def _get_dependencies_from_cache(ireq):
     if ireq.editable:
         return
     try:
-        deps = DEPENDENCY_CACHE[ireq]
-        pyrq = REQUIRES_PYTHON_CACHE[ireq]
-    except KeyError:
+        entry = DEPENDENCY_CACHE[ireq]
+        schema = entry.get("schema")
+        deps = entry["dependencies"]
+        pyrq = entry["requires_python"]
+    except (KeyError, TypeError, AttributeError):
         return
 
-    # Preserving sanity: Run through the cache and make sure every entry if
-    # valid. If this fails, something is wrong with the cache. Drop it.
-    try:
-        packaging.specifiers.SpecifierSet(pyrq)
-        ireq_name = packaging.utils.canonicalize_name(ireq.name)
-        if any(_is_cache_broken(line, ireq_name) for line in deps):
-            broken = True
-        else:
-            broken = False
-    except Exception:
-        broken = True
-
-    if broken:
-        print("dropping broken cache for {0}".format(ireq.name))
-        del DEPENDENCY_CACHE[ireq]
-        del REQUIRES_PYTHON_CACHE[ireq]
+    # Entries are validated when written, so they are trusted here. An entry
+    # written by an older version is ignored, and replaced once this is
+    # fetched again. `verify_dependency_cache()` upgrades them in place.
+    if schema != CACHE_SCHEMA:
         return
 
     return deps, pyrq
 
 
-def _get_dependencies_from_json_url(url, session):
+def verify_dependency_cache(cache=None):
+    """Validate every entry in the dependency cache.
+
+    Valid entries are normalized and stamped with the current schema, and
+    invalid ones deleted. Returns a 3-tuple of numbers of entries checked,
+    upgraded, and deleted.
+    """
+    if cache is None:
+        cache = DEPENDENCY_CACHE
+    checked = upgraded = deleted = 0
+    for key, values in cache.iter_entries():
+        checked += 1
+        try:
+            entry = _normalize_cache_entry(
+                packaging.utils.canonicalize_name(key[0]),
+                values["dependencies"], values["requires_python"],
+            )
+        except Exception as e:
+            print("dropping broken cache for {0} ({1})".format(key[0], e))
+            cache.delete_entry(key)
+            deleted += 1
+            continue
+        if entry != values:
+            cache.set_entry(key, entry)
+            upgraded += 1
+    cache.flush()
+    return checked, upgraded, deleted
+
+
+def _evaluate_extras(requirement, extras):
+    """Evaluate the `extra == ...` part of a dependency's markers.
+
+    Returns False if the dependency is only needed by extras not in `extras`.
+    Otherwise the extra part is stripped from the dependency's markers (since
+    it is meaningless after the evaluation), and True is returned.
+    """
+    if not requirement.markers:
+        return True
+    contained = get_contained_extras(requirement.markers)
+    if contained and not any(e in contained for e in extras):
+        return False
+    marker = get_without_extra(requirement.markers)
+    requirement.markers = str(marker) if marker else None
+    return True
+
+
+def _get_dependencies_from_json_url(url, session, extras):
     response = session.get(url)
     response.raise_for_status()
     info = response.json()["info"]
@@ -96,7 +164,7 @@ def _get_dependencies_from_json_url(url, session):
     # better to drop it and fall back to downloading the package.
     try:
         dependency_requirements_iterator = (
-            requirementslib.Requirement.from_line(line)
+            parse_requirement_line(line)
             for line in requirement_lines
         )
     except TypeError:
@@ -105,7 +173,7 @@ def _get_dependencies_from_json_url(url, session):
     dependencies = [
         dep_req.as_line(include_hashes=False)
         for dep_req in dependency_requirements_iterator
-        if not contains_extra(dep_req.markers)
+        if _evaluate_extras(dep_req, extras)
     ]
     return dependencies, requires_python
 
@@ -121,11 +189,6 @@ def _get_dependencies_from_json(ireq, sources):
     if os.environ.get("PASSA_IGNORE_JSON_API"):
         return
 
-    # It is technically possible to parse extras out of the JSON API's
-    # requirement format, but it is such a chore let's just use the simple API.
-    if ireq.extras:
-        return
-
     try:
         version = get_pinned_version(ireq)
     except ValueError:
@@ -140,7 +203,8 @@ def _get_dependencies_from_json(ireq, sources):
         if proc_url.endswith("/simple")
     ]
 
-    session = requests.session()
+    session = get_session(sources)
+    extras = ireq.extras or ()
 
     for prefix in url_prefixes:
         url = "{prefix}/pypi/{name}/{version}/json".format(
@@ -149,7 +213,9 @@ def _get_dependencies_from_json(ireq, sources):
             version=version,
         )
         try:
-            dependencies = _get_dependencies_from_json_url(url, session)
+            dependencies = _get_dependencies_from_json_url(
+                url, session, extras,
+            )
             if dependencies is not None:
                 return dependencies
         except Exception as e:
@@ -181,13 +247,10 @@ def _read_requirements(metadata, extras):
         if extra is not None and extra not in extras:
             continue
         for line in entry.get("requires", []):
-            r = requirementslib.Requirement.from_line(line)
+            r = parse_requirement_line(line)
             if r.markers:
-                contained = get_contained_extras(r.markers)
-                if (contained and not any(e in contained for e in extras)):
+                if not _evaluate_extras(r, extras):
                     continue
-                marker = get_without_extra(r.markers)
-                r.markers = str(marker) if marker else None
                 line = r.as_line(include_hashes=False)
             requirements.append(line)
     return requirements
@@ -214,6 +277,56 @@ def _read_requires_python(metadata):
     return ""
 
 
+def _get_dependencies_from_wheel_metadata(ireq, sources):
+    """Retrieves dependencies for the requirement from remote wheel metadata.
+
+    Only the metadata is downloaded, either from the index's PEP 658 metadata
+    file, or with range requests into the wheel. Returns None if the pinned
+    version does not have a wheel, so the requirement can be built instead.
+    """
+    if ireq.editable or ireq.link:
+        return
+    try:
+        version = get_pinned_version(ireq)
+    except ValueError:
+        return
+
+    session = get_session(sources)
+    extras = ireq.extras or ()
+    for entry in find_wheel_entries(ireq.name, version, sources):
+        try:
+            text = read_wheel_metadata(session, entry)
+        except Exception as e:
+            print("unable to read metadata from {0} ({1})".format(
+                entry.url, e,
+            ))
+            continue
+        if text is None:
+            continue
+        metadata = distlib.metadata.Metadata(
+            fileobj=io.StringIO(text), scheme="legacy",
+        )
+        requirements = _read_requirements(metadata, extras)
+        requires_python = _read_requires_python(metadata)
+        return requirements, requires_python
+    return
+
+
+def _get_dependencies_from_sdist_metadata(ireq, sources):
+    """Retrieves dependencies for the requirement by generating its metadata.
+
+    The artifact is downloaded and unpacked, and metadata generated from it
+    without building a wheel (so extensions are not compiled). Returns None
+    if the artifact is a wheel.
+    """
+    metadata = prepare_metadata(ireq, sources)
+    if metadata is None:
+        return
+    requirements = _read_requirements(metadata, ireq.extras or ())
+    requires_python = _read_requires_python(metadata)
+    return requirements, requires_python
+
+
 def _get_dependencies_from_pip(ireq, sources):
     """Retrieves dependencies for the requirement from pip internals.
 
@@ -249,21 +362,32 @@ def get_dependencies(requirement, sources):
     :type sources: list[dict]
     """
     getters = [
-        _get_dependencies_from_cache,
-        _cached(_get_dependencies_from_json, sources=sources),
-        _cached(_get_dependencies_from_pip, sources=sources),
+        ("cache", _get_dependencies_from_cache),
+        ("json", _cached(_get_dependencies_from_json, sources=sources)),
+        ("wheel_metadata", _cached(
+            _get_dependencies_from_wheel_metadata, sources=sources,
+        )),
+        ("sdist_metadata", _cached(
+            _get_dependencies_from_sdist_metadata, sources=sources,
+        )),
+        ("pip", _cached(_get_dependencies_from_pip, sources=sources)),
     ]
     ireq = requirement.as_ireq()
     last_exc = None
-    for getter in getters:
+    for name, getter in getters:
         try:
-            result = getter(ireq)
+            with instruments.timed("dependencies.{0}".format(name)):
+                result = getter(ireq)
         except Exception as e:
             last_exc = sys.exc_info()
             continue
+        if name == "cache":
+            instruments.count("dependency_cache.{0}".format(
+                "misses" if result is None else "hits",
+            ))
         if result is not None:
             deps, pyreq = result
-            reqs = [requirementslib.Requirement.from_line(d) for d in deps]
+            reqs = [parse_requirement_line(d) for d in deps]
             return reqs, pyreq
     if last_exc:
         six.reraise(*last_exc)
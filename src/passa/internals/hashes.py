@@ -1,42 +1,59 @@
 # -*- coding=utf-8 -*-
 
-from __future__ import absolute_import, unicode_literals
+from __future__ import absolute_import, print_function, unicode_literals
 
-import contextlib
+import concurrent.futures
 
-from pip_shims import Wheel
+import packaging.version
 
+from pip_shims import Link
 
-def _wheel_supported(self, tags=None):
-    # Ignore current platform. Support everything.
-    return True
+from .candidates import find_recorded_artifacts
+from .indexes import IndexPageError, find_index_entries
+from .targets import is_artifact_targeted
+from .utils import filter_sources, get_max_workers, get_pinned_version
 
 
-def _wheel_support_index_min(self, tags=None):
-    # All wheels are equal priority for sorting.
-    return 0
+def _get_link(entry):
+    if not entry.hash:
+        return Link(entry.url)
+    return Link("{0}#{1}".format(entry.url, entry.hash.replace(":", "=", 1)))
 
 
-@contextlib.contextmanager
-def _allow_all_wheels():
-    """Monkey patch pip.Wheel to allow all wheels
+def _find_artifacts(req, sources):
+    version = packaging.version.parse(get_pinned_version(req.as_ireq()))
+    try:
+        entries = find_index_entries(req.name, sources)
+    except IndexPageError as e:
+        print(e)
+        return []
+    return [entry for entry in entries if entry.version == version]
 
-    The usual checks against platforms and Python versions are ignored to allow
-    fetching all available entries in PyPI. This also saves the candidate cache
-    and set a new one, or else the results from the previous non-patched calls
-    will interfere.
-    """
-    original_wheel_supported = Wheel.supported
-    original_support_index_min = Wheel.support_index_min
 
-    Wheel.supported = _wheel_supported
-    Wheel.support_index_min = _wheel_support_index_min
-    yield
-    Wheel.supported = original_wheel_supported
-    Wheel.support_index_min = original_support_index_min
+def find_artifact_links(req, sources, artifacts=None, targets=None):
+    """Find links to all artifacts of a pinned requirement.
 
+    The tag policy here is to accept everything: wheels for all platforms and
+    Python versions are returned alongside sdists, since the lock file should
+    be usable on any of them. If `targets` is given, only wheels for those
+    targets are returned alongside sdists instead.
 
-def get_hashes(cache, req):
+    If `artifacts` is given, entries recorded in it during candidate discovery
+    are used, and the index is only consulted for versions not found there.
+    """
+    sources = filter_sources(req, sources)
+    entries = None
+    if artifacts is not None:
+        entries = find_recorded_artifacts(artifacts, req, sources)
+    if entries is None:
+        entries = _find_artifacts(req, sources)
+    return [
+        _get_link(entry) for entry in entries
+        if is_artifact_targeted(entry.filename, targets)
+    ]
+
+
+def get_hashes(cache, req, sources, artifacts=None, targets=None):
     if req.is_vcs:
         return set()
 
@@ -52,10 +69,25 @@ def get_hashes(cache, req):
     if not ireq.is_pinned:
         return set()
 
-    with _allow_all_wheels():
-        matching_candidates = req.find_all_matches()
-
     return {
-        cache.get_hash(candidate.location)
-        for candidate in matching_candidates
+        cache.get_hash(link)
+        for link in find_artifact_links(req, sources, artifacts, targets)
     }
+
+
+def collect_hashes(cache, requirements, sources, artifacts=None,
+                   targets=None):
+    """Populate hashes for requirements that do not have them yet.
+
+    Requirements are processed concurrently, with at most ``get_max_workers()``
+    in flight. `cache` must be safe to use from multiple threads. `artifacts`
+    and `targets` are passed to `find_artifact_links()`.
+    """
+    pending = [r for r in requirements if not r.hashes]
+
+    def get_hashes_for(r):
+        return get_hashes(cache, r, sources, artifacts, targets)
+
+    with concurrent.futures.ThreadPoolExecutor(get_max_workers()) as executor:
+        for r, hashes in zip(pending, executor.map(get_hashes_for, pending)):
+            r.hashes = hashes
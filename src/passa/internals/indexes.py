@@ -0,0 +1,253 @@
+# -*- coding=utf-8 -*-
+
+"""Read project pages from PEP 503 "simple" package indexes.
+
+Parsed pages are kept in a persistent cache, and revalidated with the ETag and
+Last-Modified headers the server sent, so an unchanged project only costs a
+conditional request. Set ``PASSA_INDEX_MAX_AGE`` to a number of seconds to
+skip revalidation entirely for pages fetched recently.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import collections
+import os
+import posixpath
+import re
+import threading
+import time
+
+import packaging.utils
+import packaging.version
+import six
+
+from ..models.caches import IndexCache
+from . import instruments
+from ._pip import get_session
+
+
+INDEX_CACHE = IndexCache()
+
+
+class IndexPageError(RuntimeError):
+    pass
+
+
+IndexEntry = collections.namedtuple("IndexEntry", [
+    "url", "filename", "version", "requires_python", "hash", "metadata",
+])
+
+
+_ARCHIVE_EXTENSIONS = (
+    ".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".tbz", ".txz", ".tar", ".zip",
+)
+
+_HASH_FRAGMENT_RE = re.compile(
+    r"^(sha1|sha224|sha384|sha256|sha512|md5)=([a-f0-9]+)$",
+)
+
+
+class _ProjectPageParser(six.moves.html_parser.HTMLParser):
+    """Collect anchors (and the base URL) from a project page.
+    """
+    def __init__(self):
+        # HTMLParser is an old-style class on Python 2, super() won't work.
+        six.moves.html_parser.HTMLParser.__init__(self)
+        self.base_url = None
+        self.anchors = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "base" and self.base_url is None:
+            self.base_url = attrs.get("href")
+        elif tag == "a" and attrs.get("href"):
+            self.anchors.append(attrs)
+
+
+def _get_max_age():
+    try:
+        return int(os.environ.get("PASSA_INDEX_MAX_AGE", ""))
+    except ValueError:
+        return 0
+
+
+def _get_version_from_filename(filename, name):
+    """Extract the version from an artifact's file name.
+
+    Returns None if the file is not an artifact (wheel or sdist) of project
+    `name`, which should be canonicalized, or if an sdist's version is not a
+    valid PEP 440 version.
+    """
+    if filename.endswith(".whl"):
+        parts = filename[:-4].split("-")
+        if len(parts) not in (5, 6):
+            return None
+        if packaging.utils.canonicalize_name(parts[0]) != name:
+            return None
+        return parts[1]
+    lowered = filename.lower()
+    for ext in _ARCHIVE_EXTENSIONS:
+        if lowered.endswith(ext):
+            stem = filename[:-len(ext)]
+            break
+    else:
+        return None
+    # The project name can contain dashes itself, so try every dash to find
+    # the one separating the name from the version. The rest must be a valid
+    # version, or e.g. "requests-toolbelt-0.8.0" would be taken as version
+    # "toolbelt-0.8.0" of "requests".
+    for i, c in enumerate(stem):
+        if c != "-":
+            continue
+        if packaging.utils.canonicalize_name(stem[:i]) != name:
+            continue
+        version = stem[i + 1:]
+        try:
+            packaging.version.Version(version)
+        except packaging.version.InvalidVersion:
+            continue
+        return version
+    return None
+
+
+def _parse_page(content, url, name):
+    parser = _ProjectPageParser()
+    parser.feed(content)
+    parser.close()
+    if parser.base_url:
+        url = six.moves.urllib.parse.urljoin(url, parser.base_url)
+    entries = []
+    for anchor in parser.anchors:
+        link = six.moves.urllib.parse.urljoin(url, anchor["href"])
+        link, fragment = six.moves.urllib.parse.urldefrag(link)
+        path = six.moves.urllib.parse.urlparse(link).path
+        filename = six.moves.urllib.parse.unquote(posixpath.basename(path))
+        version = _get_version_from_filename(filename, name)
+        if version is None:
+            continue
+        match = _HASH_FRAGMENT_RE.match(fragment)
+        if match:
+            hash_value = ":".join(match.groups())
+        else:
+            hash_value = None
+        # PEP 658 metadata file. The attribute was renamed in PEP 714.
+        metadata = (
+            anchor.get("data-core-metadata") or
+            anchor.get("data-dist-info-metadata")
+        )
+        if metadata == "false":
+            metadata = None
+        entries.append(IndexEntry(
+            url=link, filename=filename, version=version,
+            requires_python=anchor.get("data-requires-python") or None,
+            hash=hash_value, metadata=metadata,
+        ))
+    return entries
+
+
+def _entries_from_page(page):
+    return [
+        IndexEntry(*values)._replace(
+            version=packaging.version.parse(values[2]),
+        )
+        for values in page["entries"]
+    ]
+
+
+def _is_page_unchanged(response, page):
+    if response.status_code == 304:
+        return True
+    # pip's HTTP cache may turn a 304 into a cached 200 response. The page is
+    # the same as long as the validator is.
+    etag = response.headers.get("ETag")
+    return bool(etag and etag == page.get("etag"))
+
+
+def _fetch_page_entries(session, url, name):
+    if os.environ.get("PASSA_IGNORE_LOCAL_CACHE"):
+        page = None
+    else:
+        page = INDEX_CACHE.get_page(url)
+
+    now = time.time()
+    if page is not None and now - page["fetched"] < _get_max_age():
+        instruments.count("index_cache.hits")
+        return _entries_from_page(page)
+    instruments.count("index.requests")
+
+    headers = {"Accept": "text/html", "Cache-Control": "max-age=0"}
+    if page is not None:
+        if page.get("etag"):
+            headers["If-None-Match"] = page["etag"]
+        if page.get("last_modified"):
+            headers["If-Modified-Since"] = page["last_modified"]
+
+    try:
+        response = session.get(url, headers=headers)
+        if page is not None and _is_page_unchanged(response, page):
+            page["fetched"] = now
+            INDEX_CACHE.set_page(url, page)
+            instruments.count("index_cache.revalidated")
+            return _entries_from_page(page)
+        response.raise_for_status()
+    except Exception as e:     # pip vendors its own requests.
+        raise IndexPageError(
+            "unable to read project page {0} ({1})".format(url, e),
+        )
+
+    instruments.count("index_cache.misses")
+    entries = _parse_page(response.text, response.url, name)
+    INDEX_CACHE.set_page(url, {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "fetched": now,
+        "entries": [list(entry) for entry in entries],
+    })
+    return [
+        entry._replace(version=packaging.version.parse(entry.version))
+        for entry in entries
+    ]
+
+
+# Pages already read during this lock. A page is needed multiple times, e.g.
+# to find candidates, and to find artifacts to read metadata from. Cleared
+# with `clear_page_entries()` when the lock is done, so the next one goes
+# through INDEX_CACHE (and its max age and revalidation) again.
+_PAGE_ENTRIES = {}
+_PAGE_LOCKS = collections.defaultdict(threading.Lock)
+
+
+def clear_page_entries():
+    """Forget pages read so far, so they are looked up again when needed.
+    """
+    _PAGE_ENTRIES.clear()
+
+
+def _get_page_entries(session, url, name):
+    with _PAGE_LOCKS[url]:
+        try:
+            return _PAGE_ENTRIES[url]
+        except KeyError:
+            pass
+        # Failures are not remembered, so the page is requested again the
+        # next time it is needed.
+        entries = _PAGE_ENTRIES[url] = _fetch_page_entries(session, url, name)
+        return entries
+
+
+def find_index_entries(name, sources):
+    """Find artifacts of a project listed on indexes in `sources`.
+
+    Returns a list of `IndexEntry`. The `version` of each entry is parsed.
+    Raises `IndexPageError` if a page cannot be read.
+    """
+    session = get_session(sources)
+    name = packaging.utils.canonicalize_name(name)
+    entries = []
+    for source in sources:
+        index_url = source.get("url")
+        if not index_url:
+            continue
+        url = "{0}/{1}/".format(index_url.rstrip("/"), name)
+        entries.extend(_get_page_entries(session, url, name))
+    return entries
@@ -0,0 +1,175 @@
+# -*- coding=utf-8 -*-
+
+"""Record where time goes during a lock.
+
+Instrumentation is off unless a recorder is started, usually because
+``PASSA_INSTRUMENT_FILE`` (or ``passa lock --instrument``) names a file to
+write the report to. Code being measured calls `timed()` and `count()`, which
+are no-ops when no recorder is running.
+
+The report is a JSON document like::
+
+    {
+        "format": 1,
+        "elapsed": 12.3,
+        "timings": {"find_matches": {"seconds": 1.2, "calls": 34}, ...},
+        "counts": {"http.requests": 56, "http.bytes": 789, ...},
+        "rounds": [
+            {"index": 0, "elapsed": 2.3, "pins": 4, "timings": {...},
+             "counts": {...}},
+            ...
+        ],
+        "trace": {...}
+    }
+
+Each round only contains what happened during it. Timings are wall clock
+seconds, and may overlap, since work is also done in background threads.
+"trace" is what the resolver asked for, to be replayed offline; see
+`internals.replays`. It is omitted if the resolution did not finish.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import contextlib
+import io
+import json
+import os
+import threading
+import timeit
+
+
+class Recorder(object):
+    """Collect timings and counts, in total and per resolver round.
+    """
+    report_format = 1
+
+    def __init__(self):
+        self.started = timeit.default_timer()
+        self.timings = {}
+        self.counts = {}
+        self.rounds = []
+        self.trace = None
+        self._lock = threading.Lock()
+        self._round_start = None
+
+    def add_timing(self, name, seconds):
+        with self._lock:
+            try:
+                timing = self.timings[name]
+            except KeyError:
+                timing = self.timings[name] = [0.0, 0]
+            timing[0] += seconds
+            timing[1] += 1
+
+    def add_count(self, name, value):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def _snapshot(self):
+        with self._lock:
+            timings = {k: tuple(v) for k, v in self.timings.items()}
+            counts = dict(self.counts)
+        return timeit.default_timer(), timings, counts
+
+    def start_round(self):
+        self._round_start = self._snapshot()
+
+    def end_round(self, index, pins):
+        if self._round_start is None:
+            return
+        (start, timings, counts), self._round_start = self._round_start, None
+        now, new_timings, new_counts = self._snapshot()
+        round_timings = {}
+        for name, (seconds, calls) in new_timings.items():
+            old_seconds, old_calls = timings.get(name, (0.0, 0))
+            if calls != old_calls:
+                round_timings[name] = _format_timing(
+                    seconds - old_seconds, calls - old_calls,
+                )
+        round_counts = {}
+        for name, value in new_counts.items():
+            if value != counts.get(name, 0):
+                round_counts[name] = value - counts.get(name, 0)
+        self.rounds.append({
+            "index": index,
+            "elapsed": now - start,
+            "pins": pins,
+            "timings": round_timings,
+            "counts": round_counts,
+        })
+
+    def as_report(self):
+        now, timings, counts = self._snapshot()
+        report = {
+            "format": self.report_format,
+            "elapsed": now - self.started,
+            "timings": {
+                name: _format_timing(seconds, calls)
+                for name, (seconds, calls) in timings.items()
+            },
+            "counts": counts,
+            "rounds": list(self.rounds),
+        }
+        if self.trace is not None:
+            report["trace"] = self.trace
+        return report
+
+    def write(self, path):
+        content = json.dumps(self.as_report(), indent=4, sort_keys=True)
+        with io.open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.write("\n")
+
+
+def _format_timing(seconds, calls):
+    return {"seconds": seconds, "calls": calls}
+
+
+_RECORDER = None
+
+
+def get_output_path():
+    """Where the report should be written, from ``PASSA_INSTRUMENT_FILE``.
+
+    Returns None if instrumentation is not requested.
+    """
+    return os.environ.get("PASSA_INSTRUMENT_FILE") or None
+
+
+def start():
+    """Start recording, and return the new `Recorder`.
+    """
+    global _RECORDER
+    _RECORDER = Recorder()
+    return _RECORDER
+
+
+def stop():
+    """Stop recording, and return the `Recorder` that was running, if any.
+    """
+    global _RECORDER
+    recorder, _RECORDER = _RECORDER, None
+    return recorder
+
+
+def get_recorder():
+    return _RECORDER
+
+
+def count(name, value=1):
+    recorder = _RECORDER
+    if recorder is not None:
+        recorder.add_count(name, value)
+
+
+@contextlib.contextmanager
+def timed(name):
+    recorder = _RECORDER
+    if recorder is None:
+        yield
+        return
+    start = timeit.default_timer()
+    try:
+        yield
+    finally:
+        recorder.add_timing(name, timeit.default_timer() - start)
@@ -1,71 +1,377 @@
 # -*- coding=utf-8 -*-
 
+"""Parsed, interned representation of environment markers.
+
+Markers are parsed once into a small tree of expressions (``os_name == "nt"``)
+and compounds (operands joined by ``and`` or ``or``), cached by their string
+form. Every node is interned, so equal markers are the same object, and can be
+compared and hashed cheaply. Compounds are built by `conjoin()` and
+`disjoin()`, which flatten, deduplicate, and simplify their operands, so
+combining many markers does not grow long redundant chains.
+"""
+
 from __future__ import absolute_import, unicode_literals
 
-from packaging.markers import Marker
+import re
+
+import packaging.markers
+import packaging.version
+
+
+class _Expression(object):
+    """A single comparison, e.g. ``os_name == "nt"``.
+
+    Operands are kept serialized, i.e. a value is quoted, but a variable is
+    not. Do not instantiate this directly; use `_make_expression()`.
+    """
+    __slots__ = ("lhs", "op", "rhs", "_string")
+
+    def __init__(self, lhs, op, rhs):
+        self.lhs = lhs
+        self.op = op
+        self.rhs = rhs
+        self._string = "{0} {1} {2}".format(lhs, op, rhs)
+
+    def __repr__(self):
+        return "<Marker {0!r}>".format(self._string)
+
+    def __str__(self):
+        return self._string
+
+
+class _Compound(object):
+    """Operands joined by either "and" or "or".
+
+    Operands are sorted by their string forms, so the order in which they are
+    combined does not matter. Do not instantiate this directly; use
+    `_make_compound()`.
+    """
+    __slots__ = ("operator", "operands", "_string")
+
+    def __init__(self, operator, operands):
+        self.operator = operator
+        self.operands = operands
+        self._string = " {0} ".format(operator).join(
+            "({0})".format(operand) if isinstance(operand, _Compound)
+            else str(operand)
+            for operand in operands
+        )
+
+    def __repr__(self):
+        return "<Marker {0!r}>".format(self._string)
+
+    def __str__(self):
+        return self._string
+
+
+_NODES = {}
+
+
+def _make_expression(lhs, op, rhs):
+    key = (lhs, op, rhs)
+    try:
+        return _NODES[key]
+    except KeyError:
+        return _NODES.setdefault(key, _Expression(lhs, op, rhs))
+
+
+def _make_compound(operator, operands):
+    # Operands are interned, so they are hashed by identity here. This keeps
+    # the key cheap to calculate even for deeply nested markers.
+    key = (operator, tuple(operands))
+    try:
+        return _NODES[key]
+    except KeyError:
+        return _NODES.setdefault(key, _Compound(operator, key[1]))
+
+
+# An empty "and" is always true, and an empty "or" always false. The latter
+# has no string form, and is never produced by parsing.
+ALWAYS = _make_compound("and", ())
+NEVER = _make_compound("or", ())
+
+
+def _parse_python_version(expression):
+    if expression.lhs != "python_version" or expression.rhs[:1] != '"':
+        return None
+    try:
+        return packaging.version.Version(expression.rhs[1:-1])
+    except packaging.version.InvalidVersion:
+        return None
+
+
+_PYTHON_VERSION_RE = re.compile(r"^\d+\.\d+$")
+
+
+def iter_python_versions_in(value):
+    """Find all python_version values an "in" operand can match.
+
+    "in" and "not in" are substring checks, so "3.1" is in "3.10".
+    """
+    for i in range(len(value)):
+        for j in range(i + 1, len(value) + 1):
+            if _PYTHON_VERSION_RE.match(value[i:j]):
+                yield value[i:j]
+
+
+class _Range(object):
+    """Lower and upper bounds of python_version, from expressions.
+    """
+    def __init__(self, operator):
+        self.operator = operator
+        self.lower = None
+        self.upper = None
+
+    def add(self, expression):
+        version = _parse_python_version(expression)
+        if version is None:
+            return False
+        if expression.op in (">", ">="):
+            key = (version, expression.op == ">")
+            if self.lower is None or (
+                    (key > self.lower[0]) == (self.operator == "and")):
+                self.lower = (key, expression)
+        elif expression.op in ("<", "<="):
+            key = (version, expression.op == "<=")
+            if self.upper is None or (
+                    (key < self.upper[0]) == (self.operator == "and")):
+                self.upper = (key, expression)
+        else:
+            return False
+        return True
+
+    def overlaps(self):
+        """Whether the lower bound is not higher than the upper bound.
+        """
+        if self.lower is None or self.upper is None:
+            return True
+        (lower, lower_exclusive), (upper, upper_inclusive) = (
+            self.lower[0], self.upper[0],
+        )
+        if lower != upper:
+            return lower < upper
+        return not lower_exclusive and upper_inclusive
+
+    def covers(self):
+        """Whether either bound matches any version.
+        """
+        if self.lower is None or self.upper is None:
+            return False
+        (lower, lower_exclusive), (upper, upper_inclusive) = (
+            self.lower[0], self.upper[0],
+        )
+        if lower != upper:
+            return lower < upper
+        return not lower_exclusive or upper_inclusive
+
+    def contains(self, version):
+        if self.lower is not None:
+            bound, exclusive = self.lower[0]
+            if version < bound or (exclusive and version == bound):
+                return False
+        if self.upper is not None:
+            bound, inclusive = self.upper[0]
+            if version > bound or (not inclusive and version == bound):
+                return False
+        return True
 
+    def iter_bounds(self):
+        for bound in (self.lower, self.upper):
+            if bound is not None:
+                yield bound[1]
 
-def _strip_extra(elements):
-    """Remove the "extra == ..." operands from the list.
+
+def _is_redundant_exclusion(expression, python_range):
+    # Whether an exclusion can't match any version in the range, i.e. always
+    # evaluates to true when combined with the range.
+    if expression.lhs != "python_version" or expression.rhs[:1] != '"':
+        return False
+    if expression.op == "!=":
+        version = _parse_python_version(expression)
+        return version is not None and not python_range.contains(version)
+    if expression.op == "not in":
+        return not any(
+            python_range.contains(packaging.version.Version(version))
+            for version in iter_python_versions_in(expression.rhs[1:-1])
+        )
+    return False
+
+
+def _merge_python_versions(operator, operands):
+    """Merge bounds of python_version.
+
+    For "and", only the highest lower bound and lowest upper bound are kept,
+    and exclusions outside of them dropped. For "or", only the lowest lower
+    bound and highest upper bound are kept; if they cover every version, the
+    result is always true. Contradicting bounds are left as-is.
+    """
+    python_range = _Range(operator)
+    others = [
+        operand for operand in operands
+        if not isinstance(operand, _Expression) or
+        not python_range.add(operand)
+    ]
+    if python_range.lower is None and python_range.upper is None:
+        return operands
+    if operator == "or":
+        if python_range.covers():
+            return [ALWAYS]
+        return others + list(python_range.iter_bounds())
+    if not python_range.overlaps():
+        return operands
+    others = [
+        operand for operand in others
+        if not isinstance(operand, _Expression) or
+        not _is_redundant_exclusion(operand, python_range)
+    ]
+    return others + list(python_range.iter_bounds())
+
+
+def _absorb(operator, operands):
+    """Apply the absorption law, e.g. "x or (x and y)" is "x".
+    """
+    def get_terms(operand):
+        if isinstance(operand, _Compound) and operand.operator != operator:
+            return frozenset(operand.operands)
+        return frozenset([operand])
+
+    termsets = [(get_terms(operand), operand) for operand in operands]
+    return [
+        operand for terms, operand in termsets
+        if not any(other < terms for other, _ in termsets)
+    ]
+
+
+def _combine(operator, markers):
+    if operator == "and":
+        annihilator = NEVER
+    else:
+        annihilator = ALWAYS
+    operands = set()
+    for marker in markers:
+        marker = parse_marker(marker)
+        if marker is annihilator:
+            return annihilator
+        if isinstance(marker, _Compound) and marker.operator == operator:
+            operands.update(marker.operands)
+        else:
+            operands.add(marker)
+    operands = _merge_python_versions(operator, list(operands))
+    if annihilator in operands:
+        return annihilator
+    operands = _absorb(operator, operands)
+    if len(operands) == 1:
+        return operands[0]
+    return _make_compound(operator, sorted(operands, key=str))
+
+
+def conjoin(markers):
+    """Join markers with "and", and simplify the result.
+    """
+    return _combine("and", markers)
+
+
+def disjoin(markers):
+    """Join markers with "or", and simplify the result.
+    """
+    return _combine("or", markers)
+
+
+def _convert(elements):
+    # Operators are not grouped by precedence in packaging's representation;
+    # it is a flat list. "and" binds tighter than "or".
+    groups = [[]]
+    for element in elements:
+        if element == "or":
+            groups.append([])
+        elif element == "and":
+            continue
+        elif isinstance(element, list):
+            groups[-1].append(_convert(element))
+        else:
+            groups[-1].append(_make_expression(*(
+                node.serialize() for node in element
+            )))
+    return disjoin(conjoin(group) for group in groups)
+
+
+_PARSED = {}
+
+
+def parse_marker(marker):
+    """Parse a marker into its interned representation.
+
+    `marker` can be a string, a `packaging.markers.Marker`, or something this
+    function returned. `ALWAYS` is returned if the marker is empty. Results are
+    cached by both the input string, and the normalized string form.
+    """
+    if isinstance(marker, (_Expression, _Compound)):
+        return marker
+    if not marker:
+        return ALWAYS
+    key = str(marker)
+    try:
+        return _PARSED[key]
+    except KeyError:
+        pass
+    node = _convert(packaging.markers.Marker(key)._markers)
+    _PARSED.setdefault(str(node), node)
+    return _PARSED.setdefault(key, node)
+
+
+_WITHOUT_EXTRA = {}
+
+
+def _strip_extra(node):
+    """Remove the "extra == ..." operands from the marker.
 
     This is not a comprehensive implementation, but relies on an important
     characteristic of metadata generation: The "extra == ..." operand is always
     associated with an "and" operator. This means that we can simply remove the
-    operand and the "and" operator associated with it.
+    operand, and any compound left empty by it.
+
+    Returns None if everything is removed.
     """
-    extra_indexes = []
-    for i, element in enumerate(elements):
-        if isinstance(element, list):
-            cancelled = _strip_extra(element)
-            if cancelled:
-                extra_indexes.append(i)
-        elif isinstance(element, tuple) and element[0].value == "extra":
-            extra_indexes.append(i)
-    for i in reversed(extra_indexes):
-        del elements[i]
-        if i > 0 and elements[i - 1] == "and":
-            # Remove the "and" before it.
-            del elements[i - 1]
-        elif elements:
-            # This shouldn't ever happen, but is included for completeness.
-            # If there is not an "and" before this element, try to remove the
-            # operator after it.
-            del elements[0]
-    return (not elements)
+    if isinstance(node, _Expression):
+        if node.lhs == "extra":
+            return None
+        return node
+    try:
+        return _WITHOUT_EXTRA[node]
+    except KeyError:
+        pass
+    operands = [
+        operand for operand in (_strip_extra(o) for o in node.operands)
+        if operand is not None
+    ]
+    if operands:
+        result = _combine(node.operator, operands)
+    else:
+        result = None
+    return _WITHOUT_EXTRA.setdefault(node, result)
 
 
 def get_without_extra(marker):
     """Build a new marker without the `extra == ...` part.
 
-    The implementation relies very deep into packaging's internals, but I don't
-    have a better way now (except implementing the whole thing myself).
-
     This could return `None` if the `extra == ...` part is the only one in the
     input marker.
     """
-    # TODO: Why is this very deep in the internals? Why is a better solution
-    # implementing it yourself when someone is already maintaining a codebase
-    # for this? It's literally a grammar implementation that is required to
-    # meet the demands of a pep... -d
     if not marker:
         return None
-    marker = Marker(str(marker))
-    elements = marker._markers
-    _strip_extra(elements)
-    if elements:
-        return marker
-    return None
+    marker = _strip_extra(parse_marker(marker))
+    if marker is ALWAYS:
+        return None
+    return marker
 
 
-def _markers_collect_extras(markers, collection):
-    # Optimization: the marker element is usually appended at the end.
-    for el in reversed(markers):
-        if (isinstance(el, tuple) and
-                el[0].value == "extra" and
-                el[1].value == "=="):
-            collection.add(el[2].value)
-        elif isinstance(el, list):
-            _markers_collect_extras(el, collection)
+def _iter_expressions(node):
+    if isinstance(node, _Expression):
+        yield node
+        return
+    for operand in node.operands:
+        for expression in _iter_expressions(operand):
+            yield expression
 
 
 def get_contained_extras(marker):
@@ -75,21 +381,11 @@ def get_contained_extras(marker):
     """
     if not marker:
         return set()
-    marker = Marker(str(marker))
-    extras = set()
-    _markers_collect_extras(marker._markers, extras)
-    return extras
-
-
-def _markers_contains_extra(markers):
-    # Optimization: the marker element is usually appended at the end.
-    for element in reversed(markers):
-        if isinstance(element, tuple) and element[0].value == "extra":
-            return True
-        elif isinstance(element, list):
-            if _markers_contains_extra(element):
-                return True
-    return False
+    return {
+        expression.rhs[1:-1]
+        for expression in _iter_expressions(parse_marker(marker))
+        if expression.lhs == "extra" and expression.op == "=="
+    }
 
 
 def contains_extra(marker):
@@ -97,5 +393,7 @@ def contains_extra(marker):
     """
     if not marker:
         return False
-    marker = Marker(str(marker))
-    return _markers_contains_extra(marker._markers)
+    return any(
+        expression.lhs == "extra"
+        for expression in _iter_expressions(parse_marker(marker))
+    )
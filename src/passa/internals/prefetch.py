@@ -0,0 +1,158 @@
+# -*- coding=utf-8 -*-
+
+"""Fetch what the resolver is going to ask for, ahead of time.
+
+The resolver asks the provider for candidates and dependencies one at a time,
+so the time spent on a lock is mostly sequential network latency. Much of what
+it is going to ask for can be guessed, however: top-level requirements are
+known up front, a newly pinned candidate's dependencies will be pinned next,
+and when a candidate is rejected, the next-best versions will be tried.
+
+Results are stored in the provider's caches, which the resolver reads from,
+so speculation only affects how long the resolver waits, never what it
+decides.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .utils import get_max_workers
+
+
+def _get_lookahead_depth():
+    try:
+        return int(os.environ.get("PASSA_LOOKAHEAD_DEPTH", ""))
+    except ValueError:
+        return 1
+
+
+class Lookahead(object):
+    """A pool fetching candidates and dependencies for a provider.
+
+    :param provider: The provider to fetch for. It should implement
+        `fetch_matches()` and `fetch_dependencies()`, which fetch without
+        recording anything about the resolution.
+    :param depth: How many levels of dependencies to fetch when a
+        requirement is scheduled, and how many alternatives to fetch when a
+        candidate is rejected. Configurable with ``PASSA_LOOKAHEAD_DEPTH``;
+        zero disables speculation during resolution.
+    :param max_workers: Number of threads to fetch with. Configurable with
+        ``PASSA_MAX_WORKERS``.
+
+    Fetching errors are ignored, and nothing is cached for them; the resolver
+    will fetch again (and report errors) when it actually needs the result.
+    """
+    def __init__(self, provider, depth=None, max_workers=None):
+        if depth is None:
+            depth = _get_lookahead_depth()
+        if max_workers is None:
+            max_workers = get_max_workers()
+        self.provider = provider
+        self.depth = depth
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._scheduled = {}
+        self._futures = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Stop scheduled jobs and wait for running ones to finish.
+        """
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+
+    def wait(self):
+        """Wait until all scheduled jobs, including ones they schedule, finish.
+        """
+        while True:
+            with self._lock:
+                futures = set(self._futures)
+            if not futures:
+                return
+            wait(futures)
+
+    def _submit(self, key, depth, f, *args):
+        with self._lock:
+            if self._closed or self._scheduled.get(key, -1) >= depth:
+                return
+            self._scheduled[key] = depth
+            future = self._executor.submit(f, *args)
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _fetch_matches(self, requirement):
+        if self._closed:
+            return []
+        try:
+            return self.provider.fetch_matches(requirement)
+        except Exception:
+            return []
+
+    def _fetch_dependencies(self, candidate):
+        if self._closed:
+            return []
+        try:
+            dependencies, _ = self.provider.fetch_dependencies(candidate)
+        except Exception:
+            return []
+        return dependencies
+
+    def _run_requirement(self, requirement, depth):
+        candidates = self._fetch_matches(requirement)
+        if not candidates or depth < 1:
+            return
+        # The resolver tries candidates from the end of the list.
+        dependencies = self._fetch_dependencies(candidates[-1])
+        self.schedule(dependencies, depth=depth - 1)
+
+    def schedule(self, requirements, depth=None):
+        """Fetch candidates of requirements in the background.
+
+        Dependencies of each requirement's most preferred candidate are also
+        fetched, recursively, until `depth` levels down. Non-named
+        requirements (paths, URLs, VCS) are skipped.
+        """
+        if depth is None:
+            depth = self.depth
+        for requirement in requirements:
+            # The only candidate of a non-named requirement is itself, but
+            # finding it can mean a VCS checkout, which is not cached; it
+            # would be done again when the resolver asks.
+            if not requirement.is_named:
+                continue
+            key = (
+                "requirement", self.provider.identify(requirement),
+                requirement.specifiers,
+            )
+            self._submit(key, depth, self._run_requirement, requirement, depth)
+
+    def schedule_alternatives(self, candidates, current):
+        """Fetch dependencies of candidates the resolver may try next.
+
+        This is used when the resolver is trying `current` because another
+        candidate of the package has hit a conflict. `candidates` is the list
+        of candidates of the package. Since the resolver tries candidates from
+        the end of the list, the ones right before `current` are fetched.
+        """
+        try:
+            index = candidates.index(current)
+        except ValueError:
+            return
+        for candidate in candidates[max(index - self.depth, 0):index]:
+            key = ("candidate", candidate.as_line(include_hashes=False))
+            self._submit(key, 0, self._fetch_dependencies, candidate)
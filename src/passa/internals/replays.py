@@ -0,0 +1,174 @@
+# -*- coding=utf-8 -*-
+
+"""Record what a resolution asked for, and replay it offline.
+
+A trace holds the top-level requirements, versions found for each package,
+and dependencies fetched for each candidate during a lock. Replaying it runs
+the resolver again against the recorded answers only, so the cost of a
+strategy (e.g. how packages are preferred) can be measured without any
+network noise. The trace is included in the instrumentation report (see
+`internals.instruments`) as its "trace" key.
+
+Anything not recorded is answered as if the package has no versions, or the
+candidate has no dependencies, and counted as a miss. A replay with misses
+took a different path than the recorded resolution, so its numbers are not
+comparable. Non-named requirements (paths, URLs, VCS) are parsed again, so
+relative paths should be replayed from the project root.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import timeit
+
+import packaging.version
+import resolvelib
+
+from ..models.providers import BasicProvider
+from .requirements import parse_requirement_line
+
+
+trace_format = 1
+
+
+def record_trace(provider, requirements, mapping):
+    """Record a resolution into a JSON-serializable dict.
+
+    :param provider: The `BasicProvider` used in the resolution.
+    :param requirements: Top-level requirements passed to the resolver.
+    :param mapping: The resolution result, from identifiers to candidates.
+    """
+    versions = [
+        {
+            "name": name,
+            "sources": [list(source) for source in sources],
+            "requires_python": requires_python,
+            "allow_prereleases": allow_prereleases,
+            "versions": [str(version) for version in found],
+        }
+        for (name, sources, requires_python, allow_prereleases), found
+        in provider.candidate_cache.items()
+    ]
+    dependencies = {
+        line: {
+            "dependencies": [
+                dependency.as_line(include_hashes=False)
+                for dependency in result
+            ],
+            "requires_python": requires_python,
+        }
+        for line, (result, requires_python)
+        in provider.dependency_results.items()
+    }
+    return {
+        "format": trace_format,
+        "sources": provider.sources,
+        "requires_python": provider.requires_python,
+        "allow_prereleases": provider.allow_prereleases,
+        "requirements": [
+            requirement.as_line(include_hashes=False)
+            for requirement in requirements
+        ],
+        "versions": versions,
+        "dependencies": dependencies,
+        "pins": {
+            key: candidate.as_line(include_hashes=False)
+            for key, candidate in mapping.items()
+        },
+    }
+
+
+class _Recorded(dict):
+    """Recorded answers, with a default for anything not recorded.
+    """
+    def __init__(self, items, default):
+        super(_Recorded, self).__init__(items)
+        self.default = default
+        self.misses = 0
+
+    def __missing__(self, key):
+        self.misses += 1
+        return self.default
+
+
+class _RoundCounter(resolvelib.BaseReporter):
+
+    def __init__(self):
+        self.rounds = 0
+
+    def starting_round(self, index):
+        self.rounds += 1
+
+
+def _build_provider(trace, requirements, strategy):
+    provider = BasicProvider(
+        requirements, trace["sources"],
+        trace["requires_python"], trace["allow_prereleases"],
+    )
+    provider.preference_strategy = strategy
+    provider.candidate_cache = _Recorded((
+        (
+            (
+                entry["name"],
+                tuple(tuple(source) for source in entry["sources"]),
+                entry["requires_python"],
+                entry["allow_prereleases"],
+            ),
+            [packaging.version.parse(v) for v in entry["versions"]],
+        )
+        for entry in trace["versions"]
+    ), [])
+    provider.dependency_results = _Recorded((
+        (
+            line,
+            (
+                [parse_requirement_line(d) for d in entry["dependencies"]],
+                entry["requires_python"],
+            ),
+        )
+        for line, entry in trace["dependencies"].items()
+    ), ([], ""))
+    return provider
+
+
+def replay_trace(trace, strategy):
+    """Resolve a recorded trace again with a preference strategy.
+
+    Returns a dict with the number of rounds the resolver took, the wall
+    time in seconds, the number of misses, and the number of pins different
+    from the recorded result. All but misses are None if the resolution
+    fails.
+    """
+    requirements = [
+        parse_requirement_line(line) for line in trace["requirements"]
+    ]
+    provider = _build_provider(trace, requirements, strategy)
+
+    reporter = _RoundCounter()
+    resolver = resolvelib.Resolver(provider, reporter)
+    start = timeit.default_timer()
+    try:
+        state = resolver.resolve(requirements)
+    except (resolvelib.NoVersionsAvailable, resolvelib.ResolutionError):
+        state = None
+    seconds = timeit.default_timer() - start
+    misses = (
+        provider.candidate_cache.misses + provider.dependency_results.misses
+    )
+    if state is None:
+        return {
+            "rounds": None, "seconds": None, "misses": misses, "changed": None,
+        }
+    pins = {
+        key: candidate.as_line(include_hashes=False)
+        for key, candidate in state.mapping.items()
+    }
+    recorded = trace["pins"]
+    return {
+        "rounds": reporter.rounds,
+        "seconds": seconds,
+        "misses": misses,
+        "changed": sum(
+            pins.get(key) != recorded.get(key)
+            for key in set(pins) | set(recorded)
+        ),
+    }
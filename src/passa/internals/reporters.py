@@ -2,6 +2,9 @@
 
 from __future__ import absolute_import, print_function, unicode_literals
 
+import itertools
+import os
+
 import resolvelib
 
 from .traces import trace_graph
@@ -33,12 +36,56 @@ def print_dependency(state, key):
         print('{pad}{line}'.format(pad=padding, line=line))
 
 
+class InstrumentedReporter(resolvelib.BaseReporter):
+    """Reporter recording each round into an `instruments.Recorder`.
+
+    Reports are also passed on to another reporter.
+    """
+    def __init__(self, reporter, recorder):
+        super(InstrumentedReporter, self).__init__()
+        self.reporter = reporter
+        self.recorder = recorder
+        self._index = None
+
+    def starting(self):
+        self.reporter.starting()
+
+    def starting_round(self, index):
+        self._index = index
+        self.recorder.start_round()
+        self.reporter.starting_round(index)
+
+    def ending_round(self, index, state):
+        self.recorder.end_round(index, len(state.mapping))
+        self.reporter.ending_round(index, state)
+
+    def ending(self, state):
+        # The last round does not end with `ending_round()`.
+        self.recorder.end_round(self._index, len(state.mapping))
+        self.reporter.ending(state)
+
+
+def _get_max_paths():
+    try:
+        return max(int(os.environ.get("PASSA_REPORT_PATHS", "")), 0)
+    except ValueError:
+        return 0
+
+
 class StdOutReporter(resolvelib.BaseReporter):
     """Simple reporter that prints things to stdout.
+
+    Each stable pin is listed with the top-level requirements it is required
+    through. Set ``PASSA_REPORT_PATHS`` to a number to also list up to that
+    many dependency paths leading to each pin; there can be exponentially
+    many of them.
     """
-    def __init__(self, requirements):
+    def __init__(self, requirements, max_paths=None):
         super(StdOutReporter, self).__init__()
         self.requirements = requirements
+        if max_paths is None:
+            max_paths = _get_max_paths()
+        self.max_paths = max_paths
 
     def starting(self):
         self._prev = None
@@ -74,13 +121,19 @@ class StdOutReporter(resolvelib.BaseReporter):
 
     def ending(self, state):
         print_title(" STABLE PINS ")
-        path_lists = trace_graph(state.graph)
+        traces = trace_graph(state.graph)
         for k in sorted(state.mapping):
             print(state.mapping[k].as_line(include_hashes=False))
-            paths = path_lists[k]
+            if None in state.graph.iter_parents(k):
+                print('    User requirement')
+            for root in sorted(traces.get_routes(k)):
+                line = state.mapping[root].as_line(include_hashes=False)
+                print('    Required by', line)
+            if not self.max_paths:
+                continue
+            paths = itertools.islice(traces.iter_paths(k), self.max_paths)
             for path in paths:
                 if path == [None]:
-                    print('    User requirement')
                     continue
                 print('   ', end='')
                 for v in reversed(path[1:]):
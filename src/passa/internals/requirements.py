@@ -0,0 +1,208 @@
+# -*- coding=utf-8 -*-
+
+"""Cheap parsing of named requirement lines.
+
+Dependencies read from metadata are almost always plain PEP 508 lines like
+``foo[bar]>=1.0; python_version >= "3"``. Parsing them with requirementslib
+is expensive (it builds a pip InstallRequirement, and checks the filesystem
+for paths), and happens for every dependency of every candidate, so these
+are parsed into a `NamedRequirement` instead. URL, path, and VCS lines are
+still parsed by requirementslib.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import re
+
+import packaging.markers
+import packaging.specifiers
+import packaging.utils
+import requirementslib
+
+from .markers import parse_marker
+
+
+_NAME = r"[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?"
+
+_NAME_RE = re.compile(r"^{0}$".format(_NAME))
+
+_NAMED_LINE_RE = re.compile(r"""
+    ^\s*
+    (?P<name>{0})\s*
+    (?:\[(?P<extras>[^\]]*)\])?\s*
+    (?:\((?P<parenthesized>[^()]*)\)|(?P<specifier>[^;()@:/]*?))\s*
+    (?:;(?P<markers>.*))?
+    $
+""".format(_NAME), re.VERBOSE)
+
+# A "name" like these is a path to an archive.
+_ARCHIVE_EXTENSIONS = (".whl", ".zip", ".tar.gz", ".tgz", ".tar.bz2")
+
+
+class LazyRequirement(object):
+    """Base of light stand-ins for `requirementslib.Requirement`.
+
+    A subclass holds just enough to identify and compare itself, and
+    implements `_key()`, `as_line()`, and `_build_requirement()`. The full
+    requirement is built the first time anything else is needed, and
+    forwarded to afterwards.
+    """
+    __slots__ = ("_requirement",)
+
+    is_named = True
+
+    def __repr__(self):
+        return "<{0} {1!r}>".format(type(self).__name__, self.as_line())
+
+    def __eq__(self, other):
+        if not isinstance(other, type(self)):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        if not isinstance(other, type(self)):
+            return NotImplemented
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __getattr__(self, name):
+        # Private and special attributes are never forwarded, so checking
+        # for them (e.g. with getattr) does not build the requirement.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.as_requirement(), name)
+
+    @property
+    def extras_as_pip(self):
+        if not self.extras:
+            return ""
+        extras = sorted(extra.lower() for extra in self.extras)
+        return "[{0}]".format(",".join(extras))
+
+    def as_requirement(self):
+        if self._requirement is None:
+            self._requirement = self._build_requirement()
+        return self._requirement
+
+
+class NamedRequirement(LazyRequirement):
+    """A named requirement parsed from a PEP 508 line.
+
+    This holds what the provider needs to find and check candidates, with
+    the specifiers pre-parsed. Setting `markers` or `extras` discards the
+    built requirement.
+    """
+    __slots__ = ("name", "specifier", "_extras", "_markers")
+
+    index = None
+
+    def __init__(self, name, extras, specifier, markers):
+        self.name = name
+        self.specifier = specifier
+        self._extras = tuple(extras or ())
+        self._markers = markers or None
+        self._requirement = None
+
+    def _key(self):
+        return (
+            self.normalized_name, self.extras_as_pip,
+            str(self.specifier), self._markers,
+        )
+
+    @property
+    def extras(self):
+        return self._extras
+
+    @extras.setter
+    def extras(self, value):
+        self._extras = tuple(value or ())
+        self._requirement = None
+
+    @property
+    def markers(self):
+        return self._markers
+
+    @markers.setter
+    def markers(self, value):
+        self._markers = value or None
+        self._requirement = None
+
+    @property
+    def normalized_name(self):
+        return packaging.utils.canonicalize_name(self.name)
+
+    @property
+    def specifiers(self):
+        return str(self.specifier) or None
+
+    def as_line(self, include_hashes=True):
+        # Same as the requirement's; a dependency has no hashes.
+        line = "{0}{1}{2}".format(
+            self.name, self.extras_as_pip, self.specifier,
+        )
+        if self._markers:
+            line = "{0}; {1}".format(line, self._markers)
+        return line
+
+    def _build_requirement(self):
+        return requirementslib.Requirement.from_line(self.as_line())
+
+
+_SPECIFIERS = {}
+
+
+def _parse_specifier(value):
+    try:
+        return _SPECIFIERS[value]
+    except KeyError:
+        pass
+    specifier = packaging.specifiers.SpecifierSet(value)
+    return _SPECIFIERS.setdefault(value, specifier)
+
+
+def _parse_named_line(line):
+    match = _NAMED_LINE_RE.match(line)
+    if not match or match.group("name").endswith(_ARCHIVE_EXTENSIONS):
+        return None
+    extras = match.group("extras")
+    if extras is not None:
+        extras = [extra.strip() for extra in extras.split(",")]
+        extras = [extra for extra in extras if extra]
+        if not all(_NAME_RE.match(extra) for extra in extras):
+            return None
+    specifier = match.group("parenthesized")
+    if specifier is None:
+        specifier = match.group("specifier")
+    markers = (match.group("markers") or "").strip()
+    try:
+        specifier = _parse_specifier(specifier.strip())
+        if markers:
+            parse_marker(markers)
+    except (packaging.specifiers.InvalidSpecifier,
+            packaging.markers.InvalidMarker):
+        return None
+    return NamedRequirement(match.group("name"), extras, specifier, markers)
+
+
+def parse_requirement_line(line):
+    """Parse a requirement line.
+
+    Returns a `NamedRequirement` for a plain PEP 508 line. Anything else
+    (URLs, paths, VCS, editables, hashes, etc.) is parsed by requirementslib.
+    """
+    requirement = _parse_named_line(line)
+    if requirement is None:
+        requirement = requirementslib.Requirement.from_line(line)
+    return requirement
+
+
+def get_specifier(requirement):
+    """Version specifiers of a named requirement, as a `SpecifierSet`.
+
+    This avoids building a pip InstallRequirement for a `NamedRequirement`.
+    """
+    if isinstance(requirement, NamedRequirement):
+        return requirement.specifier
+    return _parse_specifier(str(requirement.as_ireq().specifier))
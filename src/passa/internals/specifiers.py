@@ -1,12 +1,112 @@
 # -*- coding=utf-8 -*-
 
+"""Python version requirements as sets of version intervals.
+
+The python_version marker only has a granularity of "X.Y", so versions are
+represented as (major, minor) tuples. A specifier matching only some patch
+releases of a version (e.g. ">=2.7.9") includes the whole "X.Y" version.
+"""
+
 from __future__ import absolute_import, unicode_literals
 
-import itertools
-import operator
+import sys
+
+import packaging.version
+import six
+
+from packaging.specifiers import InvalidSpecifier, SpecifierSet, Specifier
+
+from .markers import (
+    conjoin, disjoin, iter_python_versions_in, parse_marker,
+)
+
+
+_LOWEST = (0, 0)
+_UNBOUNDED = (sys.maxsize, 0)
+
+
+class PythonVersions(object):
+    """A set of Python versions, as sorted half-open intervals.
+
+    Each interval is a ``(lower, upper)`` pair of versions, where `upper` is
+    excluded. Intervals are disjoint, and never adjacent, so equal sets always
+    have equal intervals. An empty set means no Python version can satisfy the
+    requirements.
+    """
+    __slots__ = ("intervals",)
+
+    def __init__(self, intervals):
+        self.intervals = tuple(intervals)
+
+    def __repr__(self):
+        return "PythonVersions({0!r})".format(self.intervals)
+
+    def __eq__(self, other):
+        if not isinstance(other, PythonVersions):
+            return NotImplemented
+        return self.intervals == other.intervals
 
-from packaging.specifiers import SpecifierSet, Specifier
-from vistir.misc import dedup
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.intervals)
+
+    def __bool__(self):
+        return bool(self.intervals)
+
+    def __nonzero__(self):  # Python 2.
+        return self.__bool__()
+
+    def __and__(self, other):
+        intervals = []
+        i = j = 0
+        while i < len(self.intervals) and j < len(other.intervals):
+            (a_lower, a_upper), (b_lower, b_upper) = (
+                self.intervals[i], other.intervals[j],
+            )
+            lower, upper = max(a_lower, b_lower), min(a_upper, b_upper)
+            if lower < upper:
+                intervals.append((lower, upper))
+            if a_upper < b_upper:
+                i += 1
+            else:
+                j += 1
+        return PythonVersions(intervals)
+
+    def __or__(self, other):
+        intervals = []
+        for lower, upper in sorted(self.intervals + other.intervals):
+            if intervals and lower <= intervals[-1][1]:
+                intervals[-1] = (
+                    intervals[-1][0], max(intervals[-1][1], upper),
+                )
+            else:
+                intervals.append((lower, upper))
+        return PythonVersions(intervals)
+
+    def is_any(self):
+        """Whether every Python version is in this set.
+        """
+        return self.intervals == ((_LOWEST, _UNBOUNDED),)
+
+    def as_marker(self):
+        """Render the set as a marker of python_version.
+
+        Returns `markers.ALWAYS` if every Python version is in this set.
+        """
+        if not self.intervals:
+            return parse_marker('python_version < "0"')
+        return disjoin(
+            conjoin(
+                parse_marker('python_version {0} "{1}"'.format(op, version))
+                for op, version in _format_intervals(run)
+            )
+            for run in _iter_runs(self.intervals)
+        )
+
+
+ANY_PYTHON = PythonVersions([(_LOWEST, _UNBOUNDED)])
 
 
 def _tuplize_version(version):
@@ -17,120 +117,148 @@ def _format_version(version):
     return ".".join(str(i) for i in version)
 
 
-# Prefer [x,y) ranges.
-REPLACE_RANGES = {">": ">=", "<=": "<"}
+def _iter_runs(intervals):
+    # Gaps inside a major version can be rendered as exclusions, but not ones
+    # spanning to another major version, since there is no "last" minor.
+    run = [intervals[0]]
+    for interval in intervals[1:]:
+        if interval[0][0] != run[-1][1][0]:
+            yield run
+            run = []
+        run.append(interval)
+    yield run
 
 
-def _format_pyspec(specifier):
-    if isinstance(specifier, str):
-        if not any(op in specifier for op in Specifier._operators.keys()):
-            specifier = "=={0}".format(specifier)
-        specifier = Specifier(specifier)
-    if specifier.operator == "==" and specifier.version.endswith(".*"):
-        specifier = Specifier("=={0}".format(specifier.version[:-2]))
-    try:
-        op = REPLACE_RANGES[specifier.operator]
-    except KeyError:
-        return specifier
-    version = specifier.version.replace(".*", "")
-    curr_tuple = _tuplize_version(version)
+def _format_intervals(intervals):
+    """Render intervals into (operator, version) pairs joined with "and".
+
+    Gaps between intervals are rendered as exclusions. If a gap spans to
+    another major version, only versions in the latter are excluded, so the
+    result may include more versions than the intervals do.
+    """
+    lower, upper = intervals[0][0], intervals[-1][1]
+    if len(intervals) == 1:
+        if upper == (lower[0], lower[1] + 1):
+            return [("==", _format_version(lower))]
+        if lower != _LOWEST and upper == (lower[0] + 1, 0):
+            return [("~=", _format_version(lower))]
+    specs = []
+    if lower != _LOWEST:
+        specs.append((">=", _format_version(lower)))
+    if upper != _UNBOUNDED:
+        specs.append(("<", _format_version(upper)))
+    excluded = []
+    for (_, gap_lower), (gap_upper, _) in zip(intervals, intervals[1:]):
+        if gap_lower[0] != gap_upper[0]:
+            gap_lower = (gap_upper[0], 0)
+        excluded.extend(
+            (gap_lower[0], minor)
+            for minor in range(gap_lower[1], gap_upper[1])
+        )
+    if len(excluded) > 1:
+        value = ", ".join(_format_version(v) for v in excluded)
+        if all(_tuplize_version(v) in excluded
+               for v in iter_python_versions_in(value)):
+            specs.append(("not in", value))
+            return specs
+    specs.extend(("!=", _format_version(v)) for v in excluded)
+    return specs
+
+
+def _get_intervals(specifier):
+    op, version = specifier.operator, specifier.version
+    wildcard = version.endswith(".*")
+    if wildcard:
+        version = version[:-2]
     try:
-        next_tuple = (curr_tuple[0], curr_tuple[1] + 1)
-    except IndexError:
-        next_tuple = (curr_tuple[0], 1)
-    specifier = Specifier("{0}{1}".format(op, _format_version(next_tuple)))
-    return specifier
+        release = packaging.version.Version(version).release
+    except packaging.version.InvalidVersion:
+        return [(_LOWEST, _UNBOUNDED)]
+    major = release[0]
+    minor = release[1] if len(release) > 1 else 0
+    patched = any(release[2:])
+    this, next_minor = (major, minor), (major, minor + 1)
+    if op == ">=":
+        return [(this, _UNBOUNDED)]
+    if op == ">":
+        return [(this if patched else next_minor, _UNBOUNDED)]
+    if op == "<":
+        return [(_LOWEST, next_minor if patched else this)]
+    if op == "<=":
+        return [(_LOWEST, next_minor)]
+    if op == "~=":
+        if len(release) > 2:
+            return [(this, next_minor)]
+        return [(this, (major + 1, 0))]
+    if wildcard and len(release) == 1:
+        this, next_minor = (major, 0), (major + 1, 0)
+    if op in ("==", "==="):
+        return [(this, next_minor)]
+    if op == "!=" and not patched:
+        return [
+            (lower, upper)
+            for lower, upper in [(_LOWEST, this), (next_minor, _UNBOUNDED)]
+            if lower < upper
+        ]
+    return [(_LOWEST, _UNBOUNDED)]
+
+
+_PARSED = {}
+
 
+def parse_pyspecs(specifiers):
+    """Parse Python version specifiers into a `PythonVersions`.
 
-def _get_specs(specset):
-    if isinstance(specset, Specifier):
-        specset = str(specset)
-    if isinstance(specset, str):
-        specset = SpecifierSet(specset.replace(".*", ""))
-    return [
-        (spec._spec[0], _tuplize_version(spec._spec[1]))
-        for spec in getattr(specset, "_specs", [])
-    ]
+    `specifiers` can be a string or a `SpecifierSet`. Results are cached by the
+    string form. An empty string means any Python version.
+    """
+    key = str(specifiers)
+    try:
+        return _PARSED[key]
+    except KeyError:
+        pass
+    versions = ANY_PYTHON
+    if not isinstance(specifiers, SpecifierSet):
+        try:
+            specifiers = SpecifierSet(key)
+        except InvalidSpecifier:
+            specifiers = SpecifierSet()
+    for specifier in specifiers:
+        versions &= PythonVersions(_get_intervals(specifier))
+    return _PARSED.setdefault(key, versions)
 
 
-def _group_by_op(specs):
-    specs = [_get_specs(x) for x in list(specs)]
-    flattened = [(op, version) for spec in specs for op, version in spec]
-    specs = sorted(flattened, key=operator.itemgetter(1))
-    grouping = itertools.groupby(specs, key=operator.itemgetter(0))
-    return grouping
+def _parse_pyspec(spec):
+    if isinstance(spec, PythonVersions):
+        return spec
+    if isinstance(spec, six.string_types):
+        if not any(op in spec for op in Specifier._operators.keys()):
+            spec = "=={0}".format(spec)
+    return parse_pyspecs(spec)
 
 
 def cleanup_pyspecs(specs, joiner="or"):
-    specs = {_format_pyspec(spec) for spec in specs}
-    # for != operator we want to group by version
-    # if all are consecutive, join as a list
-    results = set()
-    for op, versions in _group_by_op(specs):
-        versions = [version[1] for version in versions]
-        versions = sorted(dedup(versions))
-        # if we are doing an or operation, we need to use the min for >=
-        # this way OR(>=2.6, >=2.7, >=3.6) picks >=2.6
-        # if we do an AND operation we need to use MAX to be more selective
-        if op in (">", ">="):
-            if joiner == "or":
-                results.add((op, _format_version(min(versions))))
-            else:
-                results.add((op, _format_version(max(versions))))
-        # we use inverse logic here so we will take the max value if we are
-        # using OR but the min value if we are using AND
-        elif op in ("<=", "<"):
-            if joiner == "or":
-                results.add((op, _format_version(max(versions))))
-            else:
-                results.add((op, _format_version(min(versions))))
-        # leave these the same no matter what operator we use
-        elif op in ("!=", "==", "~="):
-            version_list = sorted(
-                "{0}".format(_format_version(version))
-                for version in versions
-            )
-            version = ", ".join(version_list)
-            if len(version_list) == 1:
-                results.add((op, version))
-            elif op == "!=":
-                results.add(("not in", version))
-            elif op == "==":
-                results.add(("in", version))
-            else:
-                specifier = SpecifierSet(",".join(sorted(
-                    "{0}".format(op, v) for v in version_list
-                )))._specs
-                for s in specifier:
-                    results &= (specifier._spec[0], specifier._spec[1])
-        else:
-            if len(version) == 1:
-                results.add((op, version))
-            else:
-                specifier = SpecifierSet("{0}".format(version))._specs
-                for s in specifier:
-                    results |= (specifier._spec[0], specifier._spec[1])
-    return results
-
-
-def pyspec_from_markers(marker):
-    if marker._markers[0][0] != 'python_version':
-        return
-    op = marker._markers[0][1].value
-    version = marker._markers[0][2].value
-    specset = set()
-    if op == "in":
-        specset.update(
-            Specifier("=={0}".format(v.strip()))
-            for v in version.split(",")
-        )
-    elif op == "not in":
-        specset.update(
-            Specifier("!={0}".format(v.strip()))
-            for v in version.split(",")
-        )
+    """Simplify Python version specifiers into (operator, version) pairs.
+
+    The pairs are meant to be joined with "and". A `SpecifierSet` is always
+    an intersection of its specifiers; items of other collections are joined
+    with `joiner`.
+    """
+    if isinstance(specs, (SpecifierSet, PythonVersions)):
+        versions = _parse_pyspec(specs)
     else:
-        specset.add(Specifier("".join([op, version])))
-    if specset:
-        return specset
-    return None
+        versions = None
+        for spec in specs:
+            spec = _parse_pyspec(spec)
+            if versions is None:
+                versions = spec
+            elif joiner == "or":
+                versions |= spec
+            else:
+                versions &= spec
+        if versions is None:
+            versions = ANY_PYTHON
+    if not versions:
+        return {("<", "0")}
+    return set(_format_intervals(versions.intervals))
+
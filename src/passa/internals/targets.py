@@ -0,0 +1,147 @@
+# -*- coding=utf-8 -*-
+
+"""Limit hashed artifacts to declared deployment targets.
+
+By default a lock file contains hashes of every artifact of a pinned version,
+so it can be installed anywhere. Projects deploying to a known set of
+platforms can declare them (and Python versions) when locking, and only
+wheels for those targets, plus sdists, are hashed. The declaration is
+recorded in the lock file's ``_meta`` section as::
+
+    "targets": {
+        "platforms": ["manylinux*_x86_64"],
+        "python-versions": ["3.6", "3.7"]
+    }
+
+Platforms are wheel platform tags, and may contain shell-style wildcards. An
+empty list means no restriction.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import collections
+import fnmatch
+import posixpath
+import re
+import sys
+import sysconfig
+
+from pip_shims import InstallationError, Wheel
+
+
+Targets = collections.namedtuple("Targets", ["platforms", "python_versions"])
+
+
+def get_targets(lockfile):
+    """Read declared targets from a lock file.
+
+    Returns a `Targets` instance, or None if the lock file does not declare
+    targets (i.e. all artifacts are hashed).
+    """
+    if not lockfile:
+        return None
+    data = lockfile.meta.get("targets")
+    if not data:
+        return None
+    return Targets(
+        platforms=tuple(data.get("platforms", ())),
+        python_versions=tuple(data.get("python-versions", ())),
+    )
+
+
+def set_targets(lockfile, targets):
+    """Record declared targets into a lock file.
+    """
+    if not targets:
+        return
+    lockfile.meta["targets"] = {
+        "platforms": list(targets.platforms),
+        "python-versions": list(targets.python_versions),
+    }
+
+
+_PYTHON_TAG_RE = re.compile(r"^(py|cp)(\d)(\d*)$")
+
+
+def _is_python_tag_targeted(tag, abis, version):
+    match = _PYTHON_TAG_RE.match(tag)
+    if not match:
+        return False
+    implementation, major, minor = match.groups()
+    target_major, target_minor = version.split(".")[:2]
+    if major != target_major:
+        return False
+    if not minor:   # E.g. "py3".
+        return implementation == "py"
+    if minor == target_minor:
+        return True
+    # The stable ABI is forward-compatible.
+    return (
+        implementation == "cp" and "abi3" in abis and
+        int(minor) <= int(target_minor)
+    )
+
+
+def _is_platform_targeted(platform, patterns):
+    return platform == "any" or any(
+        fnmatch.fnmatchcase(platform, pattern) for pattern in patterns
+    )
+
+
+def is_artifact_targeted(filename, targets):
+    """Whether an artifact should be hashed for the declared targets.
+
+    Sdists are always wanted, since they can be built on any target.
+    """
+    if not targets or posixpath.splitext(filename)[1] != ".whl":
+        return True
+    try:
+        wheel = Wheel(filename)
+    except InstallationError:   # pip raises InvalidWheelFilename.
+        return True
+    if targets.platforms and not any(
+            _is_platform_targeted(platform, targets.platforms)
+            for platform in wheel.plats):
+        return False
+    if targets.python_versions and not any(
+            _is_python_tag_targeted(tag, wheel.abis, version)
+            for tag in wheel.pyversions
+            for version in targets.python_versions):
+        return False
+    return True
+
+
+_MANYLINUX_RE = re.compile(
+    r"^(?:many|musl)linux(?:1|2010|2014|_\d+_\d+|\*)_",
+)
+
+
+def _get_platform_family(platform):
+    # "manylinux2014_x86_64" -> "linux_x86_64". The running platform is only
+    # known as the latter.
+    return _MANYLINUX_RE.sub("linux_", platform)
+
+
+def get_environment_mismatch(targets):
+    """Check the running environment against declared targets.
+
+    Returns a message describing the mismatch, or None if the environment is
+    one of the targets (or there are no targets).
+    """
+    if not targets:
+        return None
+    python_version = "{0[0]}.{0[1]}".format(sys.version_info)
+    if (targets.python_versions and
+            python_version not in targets.python_versions):
+        return "Python {0} is not one of the locked targets ({1})".format(
+            python_version, ", ".join(targets.python_versions),
+        )
+    if not targets.platforms:
+        return None
+    platform = re.sub(r"[.-]", "_", sysconfig.get_platform())
+    for pattern in targets.platforms:
+        if fnmatch.fnmatchcase(platform, _get_platform_family(pattern)):
+            return None
+    return "platform {0} is not one of the locked targets ({1})".format(
+        platform, ", ".join(targets.platforms),
+    )
@@ -1,40 +1,288 @@
 # -*- coding=utf-8 -*-
 
+"""Trace how each package in a resolved dependency graph came to be.
+
+The graph's root is `None`, whose children are the top-level (user)
+requirements. Everything here is computed in (near) linear time, so huge
+graphs with many diamonds don't blow up. Enumerating every path to a package
+is exponential on such graphs, and only offered as a lazy API for display.
+"""
+
 from __future__ import absolute_import, unicode_literals
 
 
-def _trace_visit_vertex(graph, current, target, visited, path, paths):
-    if current == target:
-        paths.append(path)
-        return
-    for v in graph.iter_children(current):
-        if v == current or v in visited:
+def _sort_key(vertex):
+    return (vertex is not None, vertex)
+
+
+def _iter_children(graph, vertex):
+    return sorted(graph.iter_children(vertex), key=_sort_key)
+
+
+def _find_components(graph):
+    """Find strongly connected components with Tarjan's algorithm.
+
+    Components are returned in topological order, i.e. a component comes
+    before every component it has edges to. Vertices of a component are
+    listed together.
+    """
+    indexes = {}
+    lowlinks = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for start in sorted(graph, key=_sort_key):
+        if start in indexes:
             continue
-        next_path = path + [current]
-        next_visited = visited | {current}
-        _trace_visit_vertex(graph, v, target, next_visited, next_path, paths)
+        indexes[start] = lowlinks[start] = len(indexes)
+        stack.append(start)
+        on_stack.add(start)
+        work = [(start, iter(_iter_children(graph, start)))]
+        while work:
+            vertex, children = work[-1]
+            for child in children:
+                if child not in indexes:
+                    indexes[child] = lowlinks[child] = len(indexes)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(_iter_children(graph, child))))
+                    break
+                if child in on_stack:
+                    lowlinks[vertex] = min(lowlinks[vertex], indexes[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlinks[parent] = min(lowlinks[parent], lowlinks[vertex])
+                if lowlinks[vertex] != indexes[vertex]:
+                    continue
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == vertex:
+                        break
+                components.append(sorted(component, key=_sort_key))
 
+    # Tarjan's algorithm finishes a component after everything it reaches.
+    components.reverse()
+    return components
 
-def trace_graph(graph):
-    """Build a collection of "traces" for each package.
-
-    A trace is a list of names that eventually leads to the package. For
-    example, if A and B are root dependencies, A depends on C and D, B
-    depends on C, and C depends on D, the return value would be like::
-
-        {
-            None: [],
-            "A": [None],
-            "B": [None],
-            "C": [[None, "A"], [None, "B"]],
-            "D": [[None, "B", "C"], [None, "A"]],
+
+def _find_postorder(graph):
+    postorder = []
+    visited = {None}
+    work = [(None, iter(_iter_children(graph, None)))]
+    while work:
+        vertex, children = work[-1]
+        for child in children:
+            if child not in visited:
+                visited.add(child)
+                work.append((child, iter(_iter_children(graph, child))))
+                break
+        else:
+            work.pop()
+            postorder.append(vertex)
+    return postorder
+
+
+def _find_dominator_intervals(graph):
+    """Calculate the dominator tree of vertices reachable from `None`.
+
+    A vertex D dominates V if every path from `None` to V passes through D.
+    This uses the iterative algorithm by Cooper, Harvey, and Kennedy. The
+    tree is returned as (preorder, postorder) numbers of each vertex, so
+    domination can be checked in constant time.
+    """
+    postorder = _find_postorder(graph)
+    numbers = {v: i for i, v in enumerate(postorder)}
+    idoms = {None: None}
+
+    def intersect(a, b):
+        while a != b:
+            while numbers[a] < numbers[b]:
+                a = idoms[a]
+            while numbers[b] < numbers[a]:
+                b = idoms[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for vertex in reversed(postorder[:-1]):     # Skip `None`.
+            new_idom = None
+            found = False
+            for parent in graph.iter_parents(vertex):
+                if parent not in idoms:
+                    continue    # Not reachable, or not processed yet.
+                if not found:
+                    new_idom = parent
+                    found = True
+                else:
+                    new_idom = intersect(parent, new_idom)
+            if found and (vertex not in idoms or idoms[vertex] != new_idom):
+                idoms[vertex] = new_idom
+                changed = True
+
+    tree = {}
+    for vertex, idom in idoms.items():
+        if vertex is not None:
+            tree.setdefault(idom, []).append(vertex)
+
+    intervals = {}
+    counter = 0
+    work = [(None, iter(tree.get(None, ())))]
+    intervals[None] = [counter, None]
+    while work:
+        vertex, children = work[-1]
+        for child in children:
+            counter += 1
+            intervals[child] = [counter, None]
+            work.append((child, iter(tree.get(child, ()))))
+            break
+        else:
+            work.pop()
+            counter += 1
+            intervals[vertex][1] = counter
+    return intervals
+
+
+class Traces(object):
+    """Dependency relationships in a resolved graph.
+
+    For a package, this provides:
+
+    * Routes: top-level requirements leading to this package, not including
+      the package itself.
+    * Parents: packages depending on this package, through which it can be
+      reached from top-level requirements without passing through itself.
+      `None` is a parent if this is a top-level requirement.
+
+    For compatibility, a `Traces` also works as a mapping of each package to
+    a list of paths leading to it, but these are computed on access. Use
+    `iter_paths()` instead, preferrably only for display purposes.
+    """
+    def __init__(self, graph):
+        self._graph = graph
+        self.components = [
+            component for component in _find_components(graph)
+            if component != [None]
+        ]
+
+        roots = set(graph.iter_children(None))
+        component_routes = []
+        vertex_components = {}
+        for i, component in enumerate(self.components):
+            routes = roots.intersection(component)
+            for vertex in component:
+                vertex_components[vertex] = i
+                for parent in graph.iter_parents(vertex):
+                    j = vertex_components.get(parent)
+                    if j is not None and j != i:
+                        routes.update(component_routes[j])
+            component_routes.append(frozenset(routes))
+        self._routes = {
+            vertex: component_routes[i] - {vertex}
+            for vertex, i in vertex_components.items()
+        }
+
+        intervals = _find_dominator_intervals(graph)
+
+        def dominates(d, v):
+            (d_pre, d_post), (v_pre, v_post) = intervals[d], intervals[v]
+            return d_pre <= v_pre and v_post <= d_post
+
+        self._parents = {
+            vertex: [
+                parent for parent in sorted(
+                    graph.iter_parents(vertex), key=_sort_key,
+                )
+                if parent != vertex and parent in intervals and
+                not dominates(vertex, parent)
+            ]
+            for vertex in vertex_components
         }
+
+    @property
+    def order(self):
+        """Packages in topological order, i.e. parents before children.
+
+        Members of a dependency cycle are listed next to each other.
+        """
+        return [v for component in self.components for v in component]
+
+    def get_routes(self, vertex):
+        return self._routes.get(vertex, frozenset())
+
+    def get_parents(self, vertex):
+        return list(self._parents.get(vertex, ()))
+
+    def iter_paths(self, vertex):
+        """Iterate through paths from `None` leading to a package.
+
+        Each path is a list starting with `None`, followed by vertices on the
+        path, not including `vertex` itself. The number of paths can be
+        exponential to the graph's size.
+        """
+        if vertex is None or vertex not in self._graph:
+            return
+        # Only walk into packages leading to `vertex`, so finding each path
+        # does not require searching the rest of the graph first.
+        ancestors = {vertex}
+        pending = [vertex]
+        while pending:
+            for parent in self._graph.iter_parents(pending.pop()):
+                if parent is not None and parent not in ancestors:
+                    ancestors.add(parent)
+                    pending.append(parent)
+        for root in _iter_children(self._graph, None):
+            if root not in ancestors:
+                continue
+            paths = self._iter_paths(root, vertex, {None}, [None], ancestors)
+            for path in paths:
+                yield path
+
+    def _iter_paths(self, current, target, visited, path, ancestors):
+        if current == target:
+            yield path
+            return
+        for v in _iter_children(self._graph, current):
+            if v == current or v in visited or v not in ancestors:
+                continue
+            next_path = path + [current]
+            next_visited = visited | {current}
+            paths = self._iter_paths(
+                v, target, next_visited, next_path, ancestors,
+            )
+            for p in paths:
+                yield p
+
+    def __contains__(self, vertex):
+        return vertex in self._graph
+
+    def __iter__(self):
+        return iter(self._graph)
+
+    def __len__(self):
+        return len(self._graph)
+
+    def __getitem__(self, vertex):
+        if vertex not in self._graph:
+            raise KeyError(vertex)
+        return list(self.iter_paths(vertex))
+
+
+def trace_graph(graph):
+    """Build traces for each package in a resolved graph.
+
+    For example, if A and B are root dependencies, A depends on C and D, B
+    depends on C, and C depends on D, the traces would be like::
+
+        routes: {"A": set(), "B": set(), "C": {"A", "B"}, "D": {"A", "B"}}
+        parents: {"A": [None], "B": [None], "C": ["A", "B"], "D": ["A", "C"]}
+
+    Returns a `Traces` instance.
     """
-    result = {None: []}
-    for vertex in graph:
-        result[vertex] = []
-        for root in graph.iter_children(None):
-            paths = []
-            _trace_visit_vertex(graph, root, vertex, {None}, [None], paths)
-            result[vertex].extend(paths)
-    return result
+    return Traces(graph)
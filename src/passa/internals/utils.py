@@ -2,6 +2,10 @@
 
 from __future__ import absolute_import, unicode_literals
 
+import os
+
+from .requirements import parse_requirement_line
+
 
 def identify_requirment(r):
     """Produce an identifier for a requirement to use in the resolver.
@@ -112,7 +116,18 @@ def are_requirements_equal(this, that):
 def strip_extras(requirement):
     """Returns a new requirement object with extras removed.
     """
-    line = requirement.as_line()
-    new = type(requirement).from_line(line)
+    new = parse_requirement_line(requirement.as_line())
     new.extras = None
     return new
+
+
+def get_max_workers():
+    """Number of worker threads to use for network-bound operations.
+
+    This can be configured with ``PASSA_MAX_WORKERS``.
+    """
+    try:
+        max_workers = int(os.environ.get("PASSA_MAX_WORKERS", ""))
+    except ValueError:
+        return 8
+    return max(max_workers, 1)
@@ -6,13 +6,16 @@ import copy
 import hashlib
 import json
 import os
+import sqlite3
 import sys
+import threading
 
 import appdirs
 import pip_shims
 import requests
 import vistir
 
+from ..internals import instruments
 from ..internals._pip_shims import VCS_SUPPORT
 from ..internals.utils import get_pinned_version
 
@@ -20,16 +23,31 @@ from ..internals.utils import get_pinned_version
 CACHE_DIR = os.environ.get("PASSA_CACHE_DIR", appdirs.user_cache_dir("passa"))
 
 
+class HashMismatchError(ValueError):
+    pass
+
+
 class HashCache(pip_shims.SafeFileCache):
     """Caches hashes of PyPI artifacts so we do not need to re-download them.
 
+    If the URL contains a hash of the preferred algorithm (as PEP 503 indexes
+    advertise them), the value is used directly without downloading. Set
+    ``PASSA_VERIFY_HASHES`` (or pass ``verify=True``) to download artifacts
+    and check them against the advertised hash instead.
+
     Hashes are only cached when the URL appears to contain a hash in it and the
     cache key includes the hash value returned from the server). This ought to
     avoid ssues where the location on the server changes.
     """
     def __init__(self, *args, **kwargs):
-        session = kwargs.pop('session', requests.session())
+        session = kwargs.pop('session', None)
+        if session is None:
+            session = requests.session()
         self.session = session
+        verify = kwargs.pop('verify', None)
+        if verify is None:
+            verify = bool(os.environ.get('PASSA_VERIFY_HASHES'))
+        self.verify = verify
         kwargs.setdefault('directory', os.path.join(CACHE_DIR, 'hash-cache'))
         super(HashCache, self).__init__(*args, **kwargs)
 
@@ -41,12 +59,26 @@ class HashCache(pip_shims.SafeFileCache):
         new_location = copy.deepcopy(location)
         if orig_scheme in VCS_SUPPORT.all_schemes:
             new_location.url = new_location.url.split("+", 1)[-1]
+        if new_location.hash_name == pip_shims.FAVORITE_HASH:
+            advertised = ":".join([new_location.hash_name, new_location.hash])
+        else:
+            advertised = None
+        if advertised and not self.verify:
+            instruments.count("hashes.advertised")
+            return advertised
         can_hash = new_location.hash
         if can_hash:
             # hash url WITH fragment
             hash_value = self.get(new_location.url)
-        if not hash_value:
+        if hash_value:
+            instruments.count("hash_cache.hits")
+        else:
+            instruments.count("hash_cache.misses")
             hash_value = self._get_file_hash(new_location)
+            if advertised and hash_value != advertised:
+                raise HashMismatchError("{0} has hash {1}".format(
+                    new_location.url, hash_value,
+                ))
             hash_value = hash_value.encode('utf8')
         if can_hash:
             self.set(new_location.url, hash_value)
@@ -60,6 +92,38 @@ class HashCache(pip_shims.SafeFileCache):
         return ":".join([h.name, h.hexdigest()])
 
 
+class IndexCache(pip_shims.SafeFileCache):
+    """Caches parsed project pages of package indexes.
+
+    Each page is stored as a JSON document keyed by its URL. The document
+    contains the validators (ETag and Last-Modified) sent by the server, the
+    time the page was last fetched or revalidated, and the artifacts listed on
+    the page, so an unchanged page does not need to be downloaded and parsed
+    again.
+    """
+    page_format = 2
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('directory', os.path.join(CACHE_DIR, 'index-cache'))
+        super(IndexCache, self).__init__(*args, **kwargs)
+
+    def get_page(self, url):
+        data = self.get(url)
+        if not data:
+            return None
+        try:
+            page = json.loads(data.decode('utf8'))
+        except ValueError:
+            return None
+        if page.get('__format__') != self.page_format:
+            return None
+        return page
+
+    def set_page(self, url, page):
+        page = dict(page, __format__=self.page_format)
+        self.set(url, json.dumps(page, sort_keys=True).encode('utf8'))
+
+
 # pip-tools's dependency cache implementation.
 class CorruptCacheError(Exception):
     def __init__(self, path):
@@ -87,16 +151,18 @@ def _key_from_req(req):
     return key
 
 
-def _read_cache_file(cache_file_path):
+def _read_cache_file(cache_file_path, file_format):
     with open(cache_file_path, 'r') as cache_file:
         try:
             doc = json.load(cache_file)
         except ValueError:
             raise CorruptCacheError(cache_file_path)
 
-        # Check version and load the contents
-        assert doc['__format__'] == 1, 'Unknown cache file format'
-        return doc['dependencies']
+    # Check version and load the contents. A file of another format is left
+    # from an older (or newer) version of passa. Just start over.
+    if doc.get('__format__') != file_format:
+        return {}
+    return doc['dependencies']
 
 
 class _JSONCache(object):
@@ -108,10 +174,15 @@ class _JSONCache(object):
         ~/.cache/pip-tools/depcache-pyX.Y.json
 
     Where X.Y indicates the Python version.
+
+    Writes are deferred: the file is only rewritten every `flush_every`
+    changes, or when `flush()` is called. The file is replaced atomically, so
+    a reader never sees a partially written cache.
     """
     filename_format = None
+    file_format = 1
 
-    def __init__(self, cache_dir=CACHE_DIR):
+    def __init__(self, cache_dir=CACHE_DIR, flush_every=100):
         vistir.mkdir_p(cache_dir)
         python_version = ".".join(str(digit) for digit in sys.version_info[:2])
         cache_filename = self.filename_format.format(
@@ -119,6 +190,9 @@ class _JSONCache(object):
         )
         self._cache_file = os.path.join(cache_dir, cache_filename)
         self._cache = None
+        self._lock = threading.RLock()
+        self._flush_every = flush_every
+        self._pending_changes = 0
 
     @property
     def cache(self):
@@ -127,7 +201,9 @@ class _JSONCache(object):
         This property lazily loads the cache from disk.
         """
         if self._cache is None:
-            self.read_cache()
+            with self._lock:
+                if self._cache is None:
+                    self.read_cache()
         return self._cache
 
     def as_cache_key(self, ireq):
@@ -157,23 +233,38 @@ class _JSONCache(object):
         """Reads the cached contents into memory.
         """
         if os.path.exists(self._cache_file):
-            self._cache = _read_cache_file(self._cache_file)
+            self._cache = _read_cache_file(self._cache_file, self.file_format)
         else:
             self._cache = {}
 
     def write_cache(self):
         """Writes the cache to disk as JSON.
         """
-        doc = {
-            '__format__': 1,
-            'dependencies': self._cache,
-        }
-        with open(self._cache_file, 'w') as f:
-            json.dump(doc, f, sort_keys=True)
+        with self._lock:
+            doc = {
+                '__format__': self.file_format,
+                'dependencies': self._cache,
+            }
+            with vistir.atomic_open_for_write(self._cache_file) as f:
+                json.dump(doc, f, sort_keys=True)
+            self._pending_changes = 0
+
+    def flush(self):
+        """Writes the cache to disk if there are unwritten changes.
+        """
+        with self._lock:
+            if self._pending_changes:
+                self.write_cache()
+
+    def _changed(self):
+        self._pending_changes += 1
+        if self._pending_changes >= self._flush_every:
+            self.write_cache()
 
     def clear(self):
-        self._cache = {}
-        self.write_cache()
+        with self._lock:
+            self._cache = {}
+            self.write_cache()
 
     def __contains__(self, ireq):
         pkgname, pkgversion_and_extras = self.as_cache_key(ireq)
@@ -184,31 +275,276 @@ class _JSONCache(object):
         return self.cache[pkgname][pkgversion_and_extras]
 
     def __setitem__(self, ireq, values):
-        pkgname, pkgversion_and_extras = self.as_cache_key(ireq)
-        self.cache.setdefault(pkgname, {})
-        self.cache[pkgname][pkgversion_and_extras] = values
-        self.write_cache()
+        self.set_entry(self.as_cache_key(ireq), values)
 
     def __delitem__(self, ireq):
-        pkgname, pkgversion_and_extras = self.as_cache_key(ireq)
-        try:
-            del self.cache[pkgname][pkgversion_and_extras]
-        except KeyError:
-            return
-        self.write_cache()
+        self.delete_entry(self.as_cache_key(ireq))
 
     def get(self, ireq, default=None):
         pkgname, pkgversion_and_extras = self.as_cache_key(ireq)
         return self.cache.get(pkgname, {}).get(pkgversion_and_extras, default)
 
+    def iter_entries(self):
+        """Iterate through (key, values) of every entry.
+
+        The first item of each key is the package name.
+        """
+        with self._lock:
+            entries = [
+                ((pkgname, pkgversion_and_extras), values)
+                for pkgname, versions in self.cache.items()
+                for pkgversion_and_extras, values in versions.items()
+            ]
+        return iter(entries)
+
+    def set_entry(self, key, values):
+        pkgname, pkgversion_and_extras = key
+        with self._lock:
+            self.cache.setdefault(pkgname, {})
+            self.cache[pkgname][pkgversion_and_extras] = values
+            self._changed()
+
+    def delete_entry(self, key):
+        pkgname, pkgversion_and_extras = key
+        with self._lock:
+            try:
+                del self.cache[pkgname][pkgversion_and_extras]
+            except KeyError:
+                return
+            self._changed()
+
 
 class DependencyCache(_JSONCache):
-    """Cache the dependency of cancidates.
+    """Cache the dependencies and Requires-Python of candidates.
+
+    Each entry is a dict with keys "dependencies" (a list of requirement
+    lines), "requires_python" (a specifier string), and "schema" (a number
+    identifying how the entry was validated before it was written; see
+    `internals.dependencies`).
     """
     filename_format = "depcache-py{python_version}.json"
+    file_format = 2
+
+
+def _get_columns(connection, table):
+    rows = connection.execute("PRAGMA table_info({0})".format(table))
+    return {row[1] for row in rows.fetchall()}
+
+
+class _SQLiteDatabase(object):
+    """A SQLite database to store cached metadata.
+
+    Each thread gets its own connection. Every change is committed right away,
+    and SQLite's locking makes the database safe to share between processes,
+    e.g. parallel CI jobs using the same cache directory.
+    """
+    schema = [
+        """CREATE TABLE IF NOT EXISTS dependencies (
+            python TEXT NOT NULL,
+            name TEXT NOT NULL,
+            version TEXT NOT NULL,
+            extras TEXT NOT NULL,
+            dependencies TEXT NOT NULL,
+            requires_python TEXT NOT NULL,
+            schema INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (python, name, version, extras)
+        )""",
+        """CREATE TABLE IF NOT EXISTS hashes (
+            url TEXT NOT NULL PRIMARY KEY,
+            hash TEXT NOT NULL
+        )""",
+    ]
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        try:
+            return self._local.connection
+        except AttributeError:
+            pass
+        vistir.mkdir_p(os.path.dirname(self.path))
+        connection = sqlite3.connect(self.path, timeout=60)
+        with connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                connection.execute(statement)
+        self._migrate(connection)
+        self._local.connection = connection
+        return connection
+
+    def _migrate(self, connection):
+        # Databases created by older versions lack the schema column. Another
+        # process may be adding it at the same time, so a failure is fine as
+        # long as the column is there afterwards.
+        if "schema" in _get_columns(connection, "dependencies"):
+            return
+        try:
+            with connection:
+                connection.execute(
+                    "ALTER TABLE dependencies "
+                    "ADD COLUMN schema INTEGER NOT NULL DEFAULT 0",
+                )
+        except sqlite3.OperationalError:
+            if "schema" not in _get_columns(connection, "dependencies"):
+                raise
+
+    def execute(self, statement, parameters=()):
+        with self.connection as connection:
+            return connection.execute(statement, parameters).fetchall()
+
+
+_DATABASES = {}
+
+
+def _get_database(cache_dir=CACHE_DIR):
+    path = os.path.join(cache_dir, "metadata.sqlite3")
+    try:
+        return _DATABASES[path]
+    except KeyError:
+        database = _DATABASES[path] = _SQLiteDatabase(path)
+        return database
+
+
+def _values_from_row(row):
+    dependencies, requires_python, schema = row
+    return {
+        "dependencies": json.loads(dependencies),
+        "requires_python": requires_python,
+        "schema": schema,
+    }
+
+
+class SQLiteDependencyCache(object):
+    """Cache the dependencies and Requires-Python of candidates in SQLite.
+
+    This has the same interface as `DependencyCache`, but entries are looked
+    up individually by (name, version, extras), so nothing is loaded up front.
+    """
+    def __init__(self, cache_dir=CACHE_DIR):
+        self._db = _get_database(cache_dir)
+        self._python = ".".join(str(digit) for digit in sys.version_info[:2])
+
+    def _as_row_key(self, ireq):
+        name = _key_from_req(ireq.req)
+        version = get_pinned_version(ireq)
+        extras = ",".join(sorted(ireq.extras))
+        return name, version, extras
+
+    def __contains__(self, ireq):
+        return self.get(ireq) is not None
+
+    def __getitem__(self, ireq):
+        rows = self._db.execute(
+            "SELECT dependencies, requires_python, schema FROM dependencies "
+            "WHERE python = ? AND name = ? AND version = ? AND extras = ?",
+            (self._python,) + self._as_row_key(ireq),
+        )
+        if not rows:
+            raise KeyError(ireq)
+        return _values_from_row(rows[0])
+
+    def __setitem__(self, ireq, values):
+        self.set_entry(self._as_row_key(ireq), values)
+
+    def __delitem__(self, ireq):
+        self.delete_entry(self._as_row_key(ireq))
+
+    def get(self, ireq, default=None):
+        try:
+            return self[ireq]
+        except KeyError:
+            return default
+
+    def iter_entries(self):
+        """Iterate through (key, values) of every entry.
+
+        The first item of each key is the package name.
+        """
+        rows = self._db.execute(
+            "SELECT name, version, extras, "
+            "dependencies, requires_python, schema FROM dependencies "
+            "WHERE python = ?", (self._python,),
+        )
+        return ((tuple(row[:3]), _values_from_row(row[3:])) for row in rows)
+
+    def set_entry(self, key, values):
+        self._db.execute(
+            "INSERT OR REPLACE INTO dependencies "
+            "(python, name, version, extras, "
+            "dependencies, requires_python, schema) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self._python,) + tuple(key) + (
+                json.dumps(values["dependencies"]),
+                values["requires_python"],
+                values.get("schema", 0),
+            ),
+        )
+
+    def delete_entry(self, key):
+        self._db.execute(
+            "DELETE FROM dependencies "
+            "WHERE python = ? AND name = ? AND version = ? AND extras = ?",
+            (self._python,) + tuple(key),
+        )
+
+    def clear(self):
+        self._db.execute(
+            "DELETE FROM dependencies WHERE python = ?", (self._python,),
+        )
+
+    def flush(self):
+        pass    # Changes are committed right away.
+
+
+class SQLiteHashCache(HashCache):
+    """Caches hashes of artifacts in SQLite, looked up by URL.
+    """
+    def __init__(self, *args, **kwargs):
+        self._db = _get_database(kwargs.pop('cache_dir', CACHE_DIR))
+        super(SQLiteHashCache, self).__init__(*args, **kwargs)
+
+    def get(self, key):
+        rows = self._db.execute(
+            "SELECT hash FROM hashes WHERE url = ?", (key,),
+        )
+        if not rows:
+            return None
+        return rows[0][0].encode('utf8')
+
+    def set(self, key, value):
+        self._db.execute(
+            "INSERT OR REPLACE INTO hashes (url, hash) VALUES (?, ?)",
+            (key, value.decode('utf8')),
+        )
+
+    def delete(self, key):
+        self._db.execute("DELETE FROM hashes WHERE url = ?", (key,))
+
+
+def _use_sqlite():
+    return os.environ.get("PASSA_CACHE_BACKEND", "").lower() == "sqlite"
+
+
+def get_dependency_cache():
+    """Get a dependency cache of the configured backend.
+
+    Set ``PASSA_CACHE_BACKEND=sqlite`` to use a SQLite database instead of a
+    JSON file.
+    """
+    if _use_sqlite():
+        return SQLiteDependencyCache()
+    return DependencyCache()
+
 
+def get_hash_cache(**kwargs):
+    """Get a hash cache of the configured backend.
 
-class RequiresPythonCache(_JSONCache):
-    """Cache a candidate's Requires-Python information.
+    Set ``PASSA_CACHE_BACKEND=sqlite`` to use a SQLite database instead of a
+    directory of files.
     """
-    filename_format = "pyreqcache-py{python_version}.json"
+    if _use_sqlite():
+        return SQLiteHashCache(**kwargs)
+    return HashCache(**kwargs)
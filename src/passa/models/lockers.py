@@ -10,13 +10,24 @@ import plette
 import requirementslib
 import vistir
 
-from ..internals.hashes import get_hashes
-from ..internals.reporters import StdOutReporter
+from ..internals import instruments
+from ..internals._pip import get_session
+from ..internals.candidates import materialize
+from ..internals.dependencies import DEPENDENCY_CACHE
+from ..internals.hashes import collect_hashes
+from ..internals.indexes import clear_page_entries
+from ..internals.prefetch import Lookahead
+from ..internals.replays import record_trace
+from ..internals.reporters import InstrumentedReporter, StdOutReporter
+from ..internals.targets import get_targets, set_targets
 from ..internals.traces import trace_graph
-from ..internals.utils import identify_requirment
-from .caches import HashCache
+from ..internals.utils import get_pinned_version, identify_requirment
+from .caches import get_hash_cache
 from .metadata import set_metadata
-from .providers import BasicProvider, EagerUpgradeProvider, PinReuseProvider
+from .providers import (
+    BasicProvider, EagerUpgradeProvider, InstrumentedProvider,
+    PinReuseProvider,
+)
 
 
 def _get_requirements(model, section_name):
@@ -45,13 +56,45 @@ def _get_requires_python(pipfile):
         return ""
 
 
+def _get_hash_key(requirement):
+    try:
+        version = get_pinned_version(requirement.as_ireq())
+    except ValueError:
+        return None
+    return (requirement.normalized_name, version, requirement.index)
+
+
+def _get_pinned_hashes(lockfile):
+    """Produce a mapping of (name, version, index): hashes from the lock file.
+    """
+    pins = _get_requirements(lockfile, "develop")
+    pins.update(_get_requirements(lockfile, "default"))
+    hashes = {}
+    for pin in pins.values():
+        key = _get_hash_key(pin)
+        if key is not None and pin.hashes:
+            hashes[key] = set(pin.hashes)
+    return hashes
+
+
+def _carry_forward_hashes(requirements, pinned_hashes):
+    """Reuse hashes of pins that did not change since the last lock.
+    """
+    for requirement in requirements:
+        if requirement.hashes:
+            continue
+        key = _get_hash_key(requirement)
+        if key in pinned_hashes:
+            requirement.hashes = set(pinned_hashes[key])
+
+
 def _collect_derived_entries(state, traces, identifiers):
     """Produce a mapping containing all candidates derived from `identifiers`.
 
     `identifiers` should provide a collection of requirement identifications
     from a section (i.e. `packages` or `dev-packages`). This function uses
-    `trace` to filter out candidates in the state that are present because of
-    an entry in that collection.
+    `traces` to filter out candidates in the state that are present because
+    of an entry in that collection.
     """
     identifiers = set(identifiers)
     if not identifiers:
@@ -60,7 +103,7 @@ def _collect_derived_entries(state, traces, identifiers):
     entries = {}
     extras = {}
     for identifier, requirement in state.mapping.items():
-        routes = {trace[1] for trace in traces[identifier] if len(trace) > 1}
+        routes = traces.get_routes(identifier)
         if identifier not in identifiers and not (identifiers & routes):
             continue
         name = requirement.normalized_name
@@ -110,6 +153,15 @@ class AbstractLocker(object):
             project.pipfile.get("pipenv", {}).get("allow_prereleases", False),
         )
         self.requires_python = _get_requires_python(project.pipfile)
+        self.pinned_hashes = _get_pinned_hashes(project.lockfile)
+
+        # Platforms and Python versions to hash artifacts for. These are kept
+        # from the existing lock file unless set explicitly.
+        self.pinned_targets = get_targets(project.lockfile)
+        self.targets = self.pinned_targets
+
+        # Where to write instrumentation of the lock, if anywhere.
+        self.instrument_path = instruments.get_output_path()
 
     def __repr__(self):
         return "<{0} @ {1!r}>".format(type(self).__name__, self.project.root)
@@ -124,36 +176,98 @@ class AbstractLocker(object):
     def lock(self):
         """Lock specified (abstract) requirements into (concrete) candidates.
 
-        The locking procedure consists of four stages:
+        The locking procedure consists of five stages:
 
-        * Resolve versions and dependency graph (powered by ResolveLib).
+        * Prefetch candidates and dependencies of top-level requirements, so
+          the resolver starts with warm caches.
+        * Resolve versions and dependency graph (powered by ResolveLib). What
+          the resolver will likely need next is fetched in the background.
         * Walk the graph to determine "why" each candidate came to be, i.e.
           what top-level requirements result in a given candidate.
-        * Populate hashes for resolved candidates.
+        * Populate hashes for resolved candidates, limited to `targets` if
+          set. Hashes of pins unchanged from the existing lock file are
+          reused, unless hashes are being verified (``PASSA_VERIFY_HASHES``)
+          or targets changed.
         * Populate markers based on dependency specifications of each
           candidate, and the dependency graph.
+
+        If `instrument_path` is set, where time goes in each stage (and each
+        resolver round) is recorded, and written there as JSON, even if
+        locking fails.
         """
+        try:
+            if not self.instrument_path:
+                self._lock(recorder=None)
+                return
+            recorder = instruments.start()
+            try:
+                self._lock(recorder)
+            finally:
+                instruments.stop()
+                recorder.write(self.instrument_path)
+        finally:
+            # Index pages are only reused within a lock.
+            clear_page_entries()
+
+    def _lock(self, recorder):
         provider = self.get_provider()
         reporter = self.get_reporter()
-        resolver = resolvelib.Resolver(provider, reporter)
-
-        with vistir.cd(self.project.root):
-            state = resolver.resolve(self.requirements)
+        if recorder is None:
+            resolver = resolvelib.Resolver(provider, reporter)
+        else:
+            resolver = resolvelib.Resolver(
+                InstrumentedProvider(provider),
+                InstrumentedReporter(reporter, recorder),
+            )
+
+        lookahead = Lookahead(provider)
+        try:
+            with vistir.cd(self.project.root), lookahead:
+                with instruments.timed("prefetch"):
+                    lookahead.schedule(self.requirements, depth=1)
+                    lookahead.wait()
+                provider.lookahead = lookahead
+                with instruments.timed("resolve"):
+                    state = resolver.resolve(self.requirements)
+        finally:
+            # Dependencies are written to disk in batches. Make sure the last
+            # batch is not lost, even if the resolution fails.
+            DEPENDENCY_CACHE.flush()
+
+        if recorder is not None:
+            recorder.trace = record_trace(
+                provider, self.requirements, state.mapping,
+            )
+
+        # Candidates are only built into full requirements as needed during
+        # resolution. Everything from here on works on full requirements.
+        for key, candidate in list(state.mapping.items()):
+            state.mapping[key] = materialize(candidate)
 
         traces = trace_graph(state.graph)
 
-        hash_cache = HashCache()
-        for r in state.mapping.values():
-            if not r.hashes:
-                r.hashes = get_hashes(hash_cache, r)
-
-        set_metadata(
-            state.mapping, traces,
-            provider.fetched_dependencies,
-            provider.collected_requires_pythons,
-        )
+        hash_cache = get_hash_cache(session=get_session(self.sources))
+        if hash_cache.verify or self.targets != self.pinned_targets:
+            # Re-hash everything, including pins reused from the lock file.
+            for r in state.mapping.values():
+                r.hashes = set()
+        else:
+            _carry_forward_hashes(state.mapping.values(), self.pinned_hashes)
+        with instruments.timed("hashes"):
+            collect_hashes(
+                hash_cache, state.mapping.values(), self.sources,
+                artifacts=provider.artifacts, targets=self.targets,
+            )
+
+        with instruments.timed("metadata"):
+            set_metadata(
+                state.mapping, traces,
+                provider.fetched_dependencies,
+                provider.collected_requires_pythons,
+            )
 
         lockfile = plette.Lockfile.with_meta_from(self.project.pipfile)
+        set_targets(lockfile, self.targets)
         lockfile["default"] = _collect_derived_entries(
             state, traces, self.default_requirements,
         )
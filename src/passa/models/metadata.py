@@ -2,22 +2,12 @@
 
 from __future__ import absolute_import, unicode_literals
 
-import copy
 import itertools
 
-import packaging.markers
-import packaging.specifiers
-import vistir
-import vistir.misc
-
-from ..internals.markers import get_without_extra
-from ..internals.specifiers import cleanup_pyspecs, pyspec_from_markers
-
-
-def dedup_markers(s):
-    # TODO: Implement better logic.
-    deduped = sorted(vistir.misc.dedup(s))
-    return deduped
+from ..internals.markers import (
+    ALWAYS, conjoin, disjoin, get_without_extra, parse_marker,
+)
+from ..internals.specifiers import ANY_PYTHON, parse_pyspecs
 
 
 class MetaSet(object):
@@ -27,104 +17,115 @@ class MetaSet(object):
     includes a marker, and a specifier set of Python versions required.
     """
     def __init__(self):
-        self.markerset = frozenset()
-        self.pyspecset = packaging.specifiers.SpecifierSet()
+        self.marker = ALWAYS
+        self.pyspecset = ANY_PYTHON
 
     def __repr__(self):
-        return "MetaSet(markerset={0!r}, pyspecset={1!r})".format(
-            ",".join(sorted(self.markerset)), str(self.pyspecset),
+        return "MetaSet(marker={0!r}, pyspecset={1!r})".format(
+            str(self.marker), str(self.pyspecset.as_marker()),
         )
 
     def __str__(self):
-        pyspecs = set()
-        markerset = set()
-        for m in self.markerset:
-            marker_specs = pyspec_from_markers(packaging.markers.Marker(m))
-            if marker_specs:
-                pyspecs.add(marker_specs)
-            else:
-                markerset.add(m)
-        if pyspecs:
-            self.pyspecset._specs &= pyspecs
-            self.markerset = frozenset(markerset)
-        return " and ".join(dedup_markers(itertools.chain(
-            # Make sure to always use the same quotes so we can dedup properly.
-            (
-                "{0}".format(ms) if " or " in ms else ms
-                for ms in (str(m).replace('"', "'") for m in self.markerset)
-            ),
-            (
-                "python_version {0[0]} '{0[1]}'".format(spec)
-                for spec in cleanup_pyspecs(self.pyspecset)
-            ),
-        )))
+        return str(self.as_marker())
 
     def __bool__(self):
-        return bool(self.markerset or self.pyspecset)
+        return self.marker is not ALWAYS or not self.pyspecset.is_any()
 
     def __nonzero__(self):  # Python 2.
         return self.__bool__()
 
     def __or__(self, pair):
-        marker, specset = pair
-        markerset = set(self.markerset)
-        if marker:
-            marker_specs = pyspec_from_markers(marker)
-            if not marker_specs:
-                markerset.add(str(marker))
-            else:
-                specset._specs &= marker_specs
+        marker, pyspecset = pair
         metaset = MetaSet()
-        metaset.markerset = frozenset(markerset)
-        # TODO: Implement some logic to clean up dups like '3.0.*' and '3.0'.
-        metaset.pyspecset &= self.pyspecset & specset
+        metaset.marker = conjoin([self.marker, parse_marker(marker)])
+        metaset.pyspecset = self.pyspecset & pyspecset
         return metaset
 
+    def as_marker(self):
+        """Combine the marker and Python version specifiers into one marker.
+        """
+        return conjoin([self.marker, self.pyspecset.as_marker()])
+
+
+def _get_metaset_key(metaset):
+    return str(metaset)
+
 
-def _build_metasets(dependencies, pythons, key, trace, all_metasets):
-    all_parent_metasets = []
-    for route in trace:
-        parent = route[-1]
-        try:
-            parent_metasets = all_metasets[parent]
-        except KeyError:    # Parent not calculated yet. Wait for it.
-            return
-        all_parent_metasets.append((parent, parent_metasets))
+def _dedup_metasets(metasets):
+    """Remove duplicated metasets, and simplify the collection.
 
+    If a metaset is unconditional, the collection as a whole is unconditional,
+    since metasets are joined with "or". Everything else can be dropped.
+    Metasets no Python version can satisfy are also dropped, unless there is
+    nothing else, so routes through them are not followed any further.
+    """
+    deduped = {}
+    unsatisfiable = {}
+    for metaset in metasets:
+        if not metaset:
+            return [MetaSet()]
+        if metaset.pyspecset:
+            bucket = deduped
+        else:
+            bucket = unsatisfiable
+        bucket.setdefault(_get_metaset_key(metaset), metaset)
+    if not deduped:
+        deduped = unsatisfiable
+    return [deduped[key] for key in sorted(deduped)]
+
+
+def _build_metasets(dependencies, pythons, key, parents, all_metasets):
     metaset_iters = []
-    for parent, parent_metasets in all_parent_metasets:
+    for parent in parents:
+        # Parents in the same dependency cycle may not be calculated yet.
+        parent_metasets = all_metasets.get(parent, ())
         r = dependencies[parent][key]
         python = pythons[key]
         metaset = (
             get_without_extra(r.markers),
-            packaging.specifiers.SpecifierSet(python),
+            parse_pyspecs(python),
         )
-        metaset_iters.append(
+        # This must be built right away. A generator would read `metaset`
+        # after the loop, giving every parent the last parent's markers.
+        metaset_iters.append([
             parent_metaset | metaset
             for parent_metaset in parent_metasets
-        )
-    return list(itertools.chain.from_iterable(metaset_iters))
+        ])
+    return _dedup_metasets(itertools.chain.from_iterable(metaset_iters))
 
 
 def _calculate_metasets_mapping(dependencies, pythons, traces):
+    """Calculate metasets of each package in a single topological pass.
+
+    Since parents are visited before their children, the (deduplicated)
+    metasets of each parent are only calculated once, and the cost grows with
+    the number of edges, not paths. Packages in a dependency cycle depend on
+    each other, so they are recalculated until nothing changes. Each pass
+    follows routes one more step into the cycle, so after as many passes as
+    there are packages in it, every route without repetition is covered;
+    going around the cycle again only adds conditions already there. The
+    passes are capped at that, in case simplification keeps changing the
+    string forms without changing the meaning.
+    """
     all_metasets = {None: [MetaSet()]}
 
-    del traces[None]
-    while traces:
-        new_metasets = {}
-        for key, trace in traces.items():
-            assert key not in all_metasets, key     # Sanity check for debug.
-            metasets = _build_metasets(
-                dependencies, pythons, key, trace, all_metasets,
-            )
-            if metasets is None:
-                continue
-            new_metasets[key] = metasets
-        if not new_metasets:
-            break   # No progress? Deadlocked. Give up.
-        all_metasets.update(new_metasets)
-        for key in new_metasets:
-            del traces[key]
+    for component in traces.components:
+        keys = None
+        for _ in range(len(component) + 1):
+            for key in component:
+                all_metasets[key] = _build_metasets(
+                    dependencies, pythons, key, traces.get_parents(key),
+                    all_metasets,
+                )
+            if len(component) == 1:
+                break
+            new_keys = [
+                [_get_metaset_key(m) for m in all_metasets[key]]
+                for key in component
+            ]
+            if new_keys == keys:
+                break
+            keys = new_keys
 
     return all_metasets
 
@@ -133,13 +134,10 @@ def _format_metasets(metasets):
     # If there is an unconditional route, this needs to be unconditional.
     if not metasets or not all(metasets):
         return None
-
-    # This extra str(Marker()) call helps simplify the expression.
-    return str(packaging.markers.Marker(" or ".join(
-        "{0}".format(s) if " and " in s else s
-        for s in dedup_markers(str(metaset) for metaset in metasets
-        if metaset)
-    )))
+    marker = disjoin(metaset.as_marker() for metaset in metasets)
+    if marker is ALWAYS:
+        return None
+    return str(marker)
 
 
 def set_metadata(candidates, traces, dependencies, pythons):
@@ -150,8 +148,9 @@ def set_metadata(candidates, traces, dependencies, pythons):
 
     :param candidates: A key-candidate mapping. Candidates in the mapping will
         have their markers set.
-    :param traces: A graph trace (produced by `traces.trace_graph`) providing
-        information about dependency relationships between candidates.
+    :param traces: A `traces.Traces` instance (produced by
+        `traces.trace_graph`) providing information about dependency
+        relationships between candidates.
     :param dependencies: A key-collection mapping containing what dependencies
         each candidate in `candidates` requested.
     :param pythons: A key-str mapping containing Requires-Python information
@@ -163,7 +162,7 @@ def set_metadata(candidates, traces, dependencies, pythons):
     The candidates are modified in-place.
     """
     metasets_mapping = _calculate_metasets_mapping(
-        dependencies, pythons, copy.deepcopy(traces),
+        dependencies, pythons, traces,
     )
     for key, candidate in candidates.items():
         candidate.markers = _format_metasets(metasets_mapping[key])
@@ -3,11 +3,16 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
 import os
+import threading
 
+import packaging.version
 import resolvelib
 
-from ..internals.candidates import find_candidates
+from ..internals import instruments
+from ..internals.candidates import Candidate, find_candidates
 from ..internals.dependencies import get_dependencies
+from ..internals.indexes import IndexPageError
+from ..internals.requirements import get_specifier
 from ..internals.utils import (
     filter_sources, get_allow_prereleases, identify_requirment, strip_extras,
 )
@@ -15,6 +20,25 @@ from ..internals.utils import (
 
 PROTECTED_PACKAGE_NAMES = {"pip", "setuptools"}
 
+PREFERENCE_STRATEGIES = ["heuristic", "fewest-candidates"]
+
+
+def _get_preference_strategy():
+    strategy = os.environ.get("PASSA_PREFERENCE_STRATEGY", "")
+    if strategy in PREFERENCE_STRATEGIES:
+        return strategy
+    return PREFERENCE_STRATEGIES[0]
+
+
+def _is_exact(specifier):
+    if specifier is None or len(specifier) != 1:
+        return False
+    specifier = next(iter(specifier))
+    return (
+        specifier.operator in ("==", "===") and
+        not specifier.version.endswith(".*")
+    )
+
 
 class BasicProvider(resolvelib.AbstractProvider):
     """Provider implementation to interface with `requirementslib.Requirement`.
@@ -26,6 +50,38 @@ class BasicProvider(resolvelib.AbstractProvider):
         self.allow_prereleases = bool(allow_prereleases)
         self.invalid_candidates = set()
 
+        # Versions found for each project during this resolution. The resolver
+        # asks for matches of the same identifier over and over when it
+        # backtracks, and we don't want to hit the index every time.
+        self.candidate_cache = {}
+
+        # Index entries of each version seen while finding candidates. These
+        # provide the links to hash after resolution.
+        self.artifacts = {}
+
+        # Dependencies fetched for each candidate during this resolution. This
+        # may be populated ahead of time (e.g. by `internals.prefetch`) from
+        # other threads, so fetching is guarded by per-key locks to make sure
+        # each candidate is only fetched once.
+        self.dependency_results = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+        # An `internals.prefetch.Lookahead` to fetch things the resolver will
+        # likely ask for in the background. Set by the locker.
+        self.lookahead = None
+        self._matches = {}
+        self._attempts = {}
+
+        # How the resolver should be told to order packages to pin, one of
+        # `PREFERENCE_STRATEGIES`. Configurable with
+        # ``PASSA_PREFERENCE_STRATEGY``. The heuristic uses how many times
+        # a package's pin was dropped, and how deep it is in the dependency
+        # tree (top-level requirements are zero).
+        self.preference_strategy = _get_preference_strategy()
+        self.conflicts = {}
+        self.depths = {self.identify(r): 0 for r in root_requirements}
+
         # Remember requirements of each pinned candidate. The resolver calls
         # `get_dependencies()` only when it wants to repin, so the last time
         # the dependencies we got when it is last called on a package, are
@@ -38,20 +94,75 @@ class BasicProvider(resolvelib.AbstractProvider):
         # Should Pipfile's requires.python_[full_]version be included?
         self.collected_requires_pythons = {None: ""}
 
+        # The resolver checks the same requirements against the same versions
+        # over and over. Parsed specifiers and versions are cached by object
+        # identity, with the object kept alive so the id is not reused, and
+        # results by requirement identity and version.
+        self._specifiers = {}
+        self._versions = {}
+        self._satisfied = {}
+
     def identify(self, dependency):
         return identify_requirment(dependency)
 
+    def _get_lock(self, key):
+        with self._locks_lock:
+            try:
+                lock = self._locks[key]
+            except KeyError:
+                lock = self._locks[key] = threading.Lock()
+        return lock
+
     def get_preference(self, resolution, candidates, information):
-        # TODO: Provide better sorting logic. This simply resolve the ones with
-        # less choices first. Not sophisticated, but sounds reasonable?
-        return len(candidates)
+        if self.preference_strategy == "fewest-candidates":
+            # Resolve the ones with less choices first.
+            return len(candidates)
 
-    def find_matches(self, requirement):
-        sources = filter_sources(requirement, self.sources)
-        candidates = find_candidates(
-            requirement, sources, self.requires_python,
-            get_allow_prereleases(requirement, self.allow_prereleases),
+        # Packages with no choice come first, since they constrain everything
+        # else, then ones that have had conflicts, so they are settled before
+        # more is built on top of them. Then the more parents demand a
+        # package, the more constrained it is, and shallower packages are
+        # preferred since their dependencies are pinned in later rounds.
+        # Fewer candidates break the ties. Nothing here may depend on what
+        # is fetched in the background, or the result would depend on timing.
+        key = self.identify(information[0].requirement)
+        pinned = len(candidates) == 1 or any(
+            _is_exact(self._get_specifier(requirement))
+            for requirement, _ in information
+            if requirement.is_named
         )
+        return (
+            not pinned,
+            -self.conflicts.get(key, 0),
+            -len(information),
+            self.depths.get(key, 0),
+            len(candidates),
+        )
+
+    def fetch_matches(self, requirement):
+        """Find candidates matching a requirement.
+
+        Unlike `find_matches()`, this does not record anything about the
+        resolution, so it is safe to call ahead of the resolver. Versions
+        found are cached for the resolution. Failures are not cached.
+        """
+        sources = filter_sources(requirement, self.sources)
+        with self._get_lock(("matches", requirement.normalized_name)):
+            return find_candidates(
+                requirement, sources, self.requires_python,
+                get_allow_prereleases(requirement, self.allow_prereleases),
+                cache=self.candidate_cache, artifacts=self.artifacts,
+            )
+
+    def find_matches(self, requirement):
+        try:
+            candidates = self.fetch_matches(requirement)
+        except IndexPageError as e:
+            if os.environ.get("PASSA_NO_SUPPRESS_EXCEPTIONS"):
+                raise
+            print(e)
+            return []
+        self._matches[self.identify(requirement)] = candidates
         return candidates
 
     def is_satisfied_by(self, requirement, candidate):
@@ -70,30 +181,121 @@ class BasicProvider(resolvelib.AbstractProvider):
             return True
 
         # Optimization: Everything matches if there are no specifiers.
-        if not requirement.specifiers:
+        specifier = self._get_specifier(requirement)
+        if specifier is None:
             return True
 
         # We can't handle old version strings before PEP 440. Drop them all.
         # Practically this shouldn't be a problem if the user is specifying a
         # remotely reasonable dependency not from before 2013.
-        candidate_line = candidate.as_line(include_hashes=False)
-        if candidate_line in self.invalid_candidates:
+        version = self._get_version(candidate)
+        if version is None:
+            candidate_line = candidate.as_line(include_hashes=False)
+            if candidate_line not in self.invalid_candidates:
+                print('ignoring invalid version from {!r}'.format(
+                    candidate_line,
+                ))
+                self.invalid_candidates.add(candidate_line)
             return False
+
+        key = (id(requirement), version)
+        try:
+            return self._satisfied[key]
+        except KeyError:
+            pass
+        result = self._satisfied[key] = specifier.contains(version)
+        return result
+
+    def _get_specifier(self, requirement):
+        """Parsed specifiers of a requirement, or None if it has none.
+        """
+        key = id(requirement)
         try:
-            version = candidate.get_specifier().version
+            return self._specifiers[key][1]
+        except KeyError:
+            pass
+        # This is our packaging's, so candidates' versions can be used
+        # without converting.
+        specifier = get_specifier(requirement) or None
+        self._specifiers[key] = (requirement, specifier)
+        return specifier
+
+    def _get_version(self, candidate):
+        """Parsed version of a candidate, or None if it is not PEP 440.
+        """
+        if isinstance(candidate, Candidate):
+            version = candidate.version
+            if isinstance(version, packaging.version.Version):
+                return version
+            return None
+        key = id(candidate)
+        try:
+            return self._versions[key][1]
+        except KeyError:
+            pass
+        try:
+            version = packaging.version.parse(
+                candidate.get_specifier().version,
+            )
         except (TypeError, ValueError):
-            print('ignoring invalid version from {!r}'.format(candidate_line))
-            self.invalid_candidates.add(candidate_line)
+            version = None
+        if not isinstance(version, packaging.version.Version):
+            version = None
+        self._versions[key] = (candidate, version)
+        return version
+
+    def fetch_dependencies(self, candidate):
+        """Fetch dependencies and Requires-Python of a candidate.
+
+        Unlike `get_dependencies()`, this does not record anything about the
+        resolution, so it is safe to call ahead of the resolver. The result is
+        cached for the resolution. Failures are not cached.
+        """
+        key = candidate.as_line(include_hashes=False)
+        with self._get_lock(("dependencies", key)):
+            try:
+                return self.dependency_results[key]
+            except KeyError:
+                pass
+            sources = filter_sources(candidate, self.sources)
+            result = get_dependencies(candidate, sources=sources)
+            self.dependency_results[key] = result
+        return result
+
+    def _record_attempt(self, candidate):
+        """Record the resolver trying a candidate.
+
+        Returns True if the package was previously tried with another
+        candidate, i.e. the previous pin has hit a conflict.
+        """
+        key = self.identify(candidate)
+        previous = self._attempts.get(key)
+        self._attempts[key] = candidate
+        if previous is None or previous == candidate:
             return False
+        self.conflicts[key] = self.conflicts.get(key, 0) + 1
+        return True
+
+    def _record_depths(self, candidate, dependencies):
+        depth = self.depths.get(self.identify(candidate), 0) + 1
+        for dependency in dependencies:
+            key = self.identify(dependency)
+            self.depths[key] = min(self.depths.get(key, depth), depth)
 
-        return requirement.as_ireq().specifier.contains(version)
+    def _schedule_lookahead(self, candidate, dependencies, conflicted):
+        if self.lookahead is None:
+            return
+        self.lookahead.schedule(dependencies)
+        if conflicted:
+            # The resolver may need to go through more versions of this
+            # package.
+            self.lookahead.schedule_alternatives(
+                self._matches.get(self.identify(candidate), []), candidate,
+            )
 
     def get_dependencies(self, candidate):
-        sources = filter_sources(candidate, self.sources)
         try:
-            dependencies, requires_python = get_dependencies(
-                candidate, sources=sources,
-            )
+            dependencies, requires_python = self.fetch_dependencies(candidate)
         except Exception as e:
             if os.environ.get("PASSA_NO_SUPPRESS_EXCEPTIONS"):
                 raise
@@ -116,6 +318,9 @@ class BasicProvider(resolvelib.AbstractProvider):
             # the same package with different extras (treated as distinct by
             # the resolver) have the same version. (sarugaku/passa#4)
             dependencies.append(strip_extras(candidate))
+        conflicted = self._record_attempt(candidate)
+        self._record_depths(candidate, dependencies)
+        self._schedule_lookahead(candidate, dependencies, conflicted)
         candidate_key = self.identify(candidate)
         self.fetched_dependencies[candidate_key] = {
             self.identify(r): r for r in dependencies
@@ -134,8 +339,8 @@ class PinReuseProvider(BasicProvider):
         super(PinReuseProvider, self).__init__(*args, **kwargs)
         self.preferred_pins = preferred_pins
 
-    def find_matches(self, requirement):
-        candidates = super(PinReuseProvider, self).find_matches(requirement)
+    def fetch_matches(self, requirement):
+        candidates = super(PinReuseProvider, self).fetch_matches(requirement)
         try:
             # Add the preferred pin. Remember the resolve prefer candidates
             # at the end of the list, so the most preferred should be last.
@@ -193,6 +398,48 @@ class EagerUpgradeProvider(PinReuseProvider):
     def get_preference(self, resolution, candidates, information):
         # Resolve tracking packages so we have a chance to unpin them first.
         name = self.identify(candidates[0])
-        if name in self.tracked_names:
-            return -1
-        return len(candidates)
+        preference = super(EagerUpgradeProvider, self).get_preference(
+            resolution, candidates, information,
+        )
+        return (name not in self.tracked_names, preference)
+
+
+class InstrumentedProvider(resolvelib.AbstractProvider):
+    """Wrap a provider to record how long the resolver spends in it.
+
+    Only methods called by the resolver are wrapped. Everything else (e.g.
+    what the locker reads after resolution) should be accessed on the wrapped
+    provider directly.
+
+    A backtrack is counted every time the wrapped provider records a
+    conflict, i.e. the resolver asks for dependencies of a different
+    candidate than it did last time for the same package.
+    """
+    def __init__(self, provider):
+        self.provider = provider
+
+    def identify(self, dependency):
+        return self.provider.identify(dependency)
+
+    def get_preference(self, resolution, candidates, information):
+        with instruments.timed("get_preference"):
+            return self.provider.get_preference(
+                resolution, candidates, information,
+            )
+
+    def find_matches(self, requirement):
+        with instruments.timed("find_matches"):
+            return self.provider.find_matches(requirement)
+
+    def is_satisfied_by(self, requirement, candidate):
+        with instruments.timed("is_satisfied_by"):
+            return self.provider.is_satisfied_by(requirement, candidate)
+
+    def get_dependencies(self, candidate):
+        key = self.identify(candidate)
+        conflicts = self.provider.conflicts.get(key, 0)
+        with instruments.timed("get_dependencies"):
+            dependencies = self.provider.get_dependencies(candidate)
+        if self.provider.conflicts.get(key, 0) > conflicts:
+            instruments.count("backtracks")
+        return dependencies
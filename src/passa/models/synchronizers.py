@@ -15,6 +15,7 @@ import packaging.version
 import requirementslib
 
 from ..internals._pip import uninstall, EditableInstaller, WheelInstaller
+from ..internals.targets import get_environment_mismatch, get_targets
 
 
 def _is_installation_local(name):
@@ -130,12 +131,22 @@ class Synchronizer(object):
         self._root = project.root   # Only for repr.
         self.packages = _get_packages(project.lockfile, default, develop)
         self.sources = project.lockfile.meta.sources._data
+        self.targets = get_targets(project.lockfile)
         self.paths = _build_paths()
         self.clean_unneeded = clean_unneeded
 
     def __repr__(self):
         return "<{0} @ {1!r}>".format(type(self).__name__, self._root)
 
+    def check_targets(self):
+        """Check the environment against targets declared in the lock file.
+
+        Hashes only cover artifacts for declared targets, so installation
+        would likely fail elsewhere. Returns a message describing the
+        mismatch, or None if the environment is targeted.
+        """
+        return get_environment_mismatch(self.targets)
+
     def sync(self):
         groupcoll = _group_installed_names(self.packages)
 
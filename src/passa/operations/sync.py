@@ -4,6 +4,10 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 
 def sync(syncer):
+    mismatch = syncer.check_targets()
+    if mismatch:
+        print("Cannot synchronize: {0}".format(mismatch))
+        return False
     print("Starting synchronization")
     installed, updated, cleaned = syncer.sync()
     if cleaned:
@@ -0,0 +1,34 @@
+import json
+import os
+
+import invoke
+
+from passa.internals.replays import replay_trace
+from passa.models.providers import PREFERENCE_STRATEGIES
+
+
+@invoke.task(iterable=['report'])
+def benchmark_preferences(ctx, report, repeat=5):
+    """Replay recorded resolutions with each preference strategy.
+
+    Each report is written by `passa lock --instrument`. Run this from the
+    project root if the project has path requirements.
+    """
+    for path in report:
+        with open(path, encoding='utf-8') as f:
+            trace = json.load(f).get('trace')
+        if trace is None:
+            print(f'[benchmark] {path} has no trace, skipping')
+            continue
+        print(f'[benchmark] {os.path.basename(path)}')
+        for strategy in PREFERENCE_STRATEGIES:
+            results = [replay_trace(trace, strategy) for _ in range(repeat)]
+            result = results[0]
+            if result['rounds'] is None:
+                print(f'  {strategy}: failed ({result["misses"]} misses)')
+                continue
+            seconds = min(r['seconds'] for r in results)
+            print(
+                f'  {strategy}: {result["rounds"]} rounds, {seconds:.3f}s, '
+                f'{result["misses"]} misses, {result["changed"]} pins changed',
+            )
@@ -0,0 +1,104 @@
+import hashlib
+import io
+import random
+import re
+import zipfile
+
+from passa.internals.artifacts import read_wheel_metadata
+from passa.internals.indexes import IndexEntry
+
+
+METADATA = "Metadata-Version: 2.1\nName: foo\nVersion: 1.0\n"
+
+URL = "https://files/foo-1.0-py2.py3-none-any.whl"
+
+
+def _make_wheel():
+    rng = random.Random(0)
+    padding = bytes(bytearray(rng.getrandbits(8) for _ in range(65536)))
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, "w") as zf:
+        zf.writestr("foo/data.bin", padding)
+        zf.writestr("foo-1.0.dist-info/METADATA", METADATA)
+    return f.getvalue()
+
+
+WHEEL = _make_wheel()
+
+
+class Response(object):
+    def __init__(self, content, status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise IOError(self.status_code)
+
+    def close(self):
+        self.closed = True
+
+
+class Session(object):
+    def __init__(self, files, ranges=True):
+        self.files = files
+        self.ranges = ranges
+        self.requests = []
+
+    def get(self, url, headers=None, stream=False):
+        value = (headers or {}).get("Range")
+        self.requests.append((url, value))
+        try:
+            content = self.files[url]
+        except KeyError:
+            return Response(b"", status_code=404)
+        if not value or not self.ranges:
+            return Response(content)
+        start, end = re.match(r"^bytes=(\d*)-(\d*)$", value).groups()
+        if not start:
+            start, end = len(content) - int(end), len(content) - 1
+        start, end = int(start), min(int(end), len(content) - 1)
+        return Response(content[start:end + 1], status_code=206, headers={
+            "Content-Range": "bytes {0}-{1}/{2}".format(
+                start, end, len(content),
+            ),
+        })
+
+
+def _make_entry(metadata=None):
+    return IndexEntry(
+        URL, "foo-1.0-py2.py3-none-any.whl", "1.0", None, None, metadata,
+    )
+
+
+def test_read_wheel_metadata_with_ranges():
+    session = Session({URL: WHEEL})
+    assert read_wheel_metadata(session, _make_entry()) == METADATA
+    assert session.requests
+    assert all(value for _, value in session.requests)
+
+
+def test_read_wheel_metadata_without_ranges():
+    session = Session({URL: WHEEL}, ranges=False)
+    assert read_wheel_metadata(session, _make_entry()) == METADATA
+    # The whole file sent in place of the first range is used.
+    assert len(session.requests) == 1
+
+
+def test_read_wheel_metadata_from_metadata_file():
+    content = METADATA.encode("utf-8")
+    value = "sha256={0}".format(hashlib.sha256(content).hexdigest())
+    session = Session({URL: WHEEL, URL + ".metadata": content})
+    assert read_wheel_metadata(session, _make_entry(value)) == METADATA
+    assert session.requests == [(URL + ".metadata", None)]
+
+
+def test_read_wheel_metadata_file_hash_mismatch():
+    content = b"Metadata-Version: 2.1\nName: bar\n"
+    value = "sha256={0}".format(hashlib.sha256(b"").hexdigest())
+    session = Session({URL: WHEEL, URL + ".metadata": content})
+    assert read_wheel_metadata(session, _make_entry(value)) == METADATA
+    assert session.requests[0] == (URL + ".metadata", None)
+    assert all(value for _, value in session.requests[1:])
@@ -0,0 +1,252 @@
+import sqlite3
+import sys
+import threading
+
+import pytest
+import requirementslib
+import resolvelib
+
+from pip_shims import Link
+
+from passa.internals.dependencies import CACHE_SCHEMA, verify_dependency_cache
+from passa.models import lockers
+from passa.models.caches import (
+    DependencyCache, HashCache, HashMismatchError, SQLiteDependencyCache,
+    SQLiteHashCache, get_dependency_cache,
+)
+from passa.models.lockers import BasicLocker
+from passa.models.projects import Project
+
+
+def _make_entry(requires_python=""):
+    return {
+        "dependencies": [],
+        "requires_python": requires_python,
+        "schema": CACHE_SCHEMA,
+    }
+
+
+def test_verify_dependency_cache(tmpdir):
+    cache = DependencyCache(cache_dir=str(tmpdir))
+    current = {
+        "dependencies": ["six>=1.0"],
+        "requires_python": ">=2.7",
+        "schema": CACHE_SCHEMA,
+    }
+    cache.set_entry(("foo", "1.0"), current)
+    cache.set_entry(("foo", "2.0"), {
+        "dependencies": ["Six (>=1.0)"],
+        "requires_python": ">=2.7",
+    })
+    cache.set_entry(("bar", "1.0"), {
+        "dependencies": ["bar"], "requires_python": "",
+    })
+    cache.set_entry(("baz", "1.0"), {
+        "dependencies": ['six; extra == "test"'], "requires_python": "",
+    })
+
+    assert verify_dependency_cache(cache) == (4, 1, 2)
+    assert dict(cache.iter_entries()) == {
+        ("foo", "1.0"): current,
+        ("foo", "2.0"): dict(current, dependencies=["Six>=1.0"]),
+    }
+
+    cache = DependencyCache(cache_dir=str(tmpdir))
+    assert verify_dependency_cache(cache) == (2, 0, 0)
+
+
+def test_dependency_cache_flushes_every_n_changes(tmpdir):
+    cache = DependencyCache(cache_dir=str(tmpdir), flush_every=3)
+    cache.set_entry(("foo", "1.0"), _make_entry())
+    cache.set_entry(("foo", "2.0"), _make_entry())
+    assert not tmpdir.listdir()
+
+    cache.set_entry(("foo", "3.0"), _make_entry())
+    cache.set_entry(("foo", "4.0"), _make_entry())
+    on_disk = DependencyCache(cache_dir=str(tmpdir))
+    assert len(list(on_disk.iter_entries())) == 3
+
+    cache.flush()
+    on_disk = DependencyCache(cache_dir=str(tmpdir))
+    assert len(list(on_disk.iter_entries())) == 4
+
+
+def test_lock_flushes_dependency_cache_on_failure(monkeypatch, tmpdir):
+    cache = DependencyCache(cache_dir=str(tmpdir.mkdir("cache")))
+    cache.set_entry(("foo", "1.0"), _make_entry(">=3.6"))
+    monkeypatch.setattr(lockers, "DEPENDENCY_CACHE", cache)
+
+    class Resolver(resolvelib.Resolver):
+        def resolve(self, requirements):
+            raise resolvelib.ResolutionImpossible([])
+
+    monkeypatch.setattr(lockers.resolvelib, "Resolver", Resolver)
+    tmpdir.join("Pipfile").write("[packages]\n")
+    locker = BasicLocker(Project(str(tmpdir)))
+    with pytest.raises(resolvelib.ResolutionImpossible):
+        locker.lock()
+
+    on_disk = DependencyCache(cache_dir=str(tmpdir.join("cache")))
+    assert dict(on_disk.iter_entries()) == {
+        ("foo", "1.0"): _make_entry(">=3.6"),
+    }
+
+
+def _make_ireq(line):
+    return requirementslib.Requirement.from_line(line).as_ireq()
+
+
+def test_sqlite_dependency_cache(tmpdir):
+    cache = SQLiteDependencyCache(cache_dir=str(tmpdir))
+    ireq = _make_ireq("Foo[b,a]==1.0")
+    assert ireq not in cache
+    assert cache.get(ireq) is None
+
+    cache[ireq] = _make_entry(">=3.6")
+    assert ireq in cache
+    assert cache[ireq] == _make_entry(">=3.6")
+    assert _make_ireq("foo==1.0") not in cache
+    assert list(cache.iter_entries()) == [
+        (("foo", "1.0", "a,b"), _make_entry(">=3.6")),
+    ]
+    mode = cache._db.execute("PRAGMA journal_mode")
+    assert mode == [("wal",)]
+
+    del cache[ireq]
+    assert ireq not in cache
+
+    # Entries are shared through the database file.
+    cache[ireq] = _make_entry()
+    cache.flush()
+    assert SQLiteDependencyCache(cache_dir=str(tmpdir))[ireq] == _make_entry()
+    cache.clear()
+    assert list(cache.iter_entries()) == []
+
+
+def test_sqlite_dependency_cache_entries(tmpdir):
+    cache = SQLiteDependencyCache(cache_dir=str(tmpdir))
+    cache.set_entry(("foo", "1.0", ""), _make_entry())
+    cache.set_entry(("foo", "2.0", "bar"), _make_entry(">=3.6"))
+    cache.set_entry(("foo", "1.0", ""), _make_entry(">=2.7"))
+    assert dict(cache.iter_entries()) == {
+        ("foo", "1.0", ""): _make_entry(">=2.7"),
+        ("foo", "2.0", "bar"): _make_entry(">=3.6"),
+    }
+    assert cache[_make_ireq("foo[bar]==2.0")] == _make_entry(">=3.6")
+    cache.delete_entry(("foo", "1.0", ""))
+    cache.delete_entry(("foo", "3.0", ""))
+    assert [key for key, _ in cache.iter_entries()] == [("foo", "2.0", "bar")]
+
+
+def test_sqlite_dependency_cache_threads(tmpdir):
+    cache = SQLiteDependencyCache(cache_dir=str(tmpdir))
+    connections = []
+
+    def write(name):
+        connections.append(cache._db.connection)
+        for i in range(50):
+            cache.set_entry((name, "{0}.0".format(i), ""), _make_entry())
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert connections[0] is not connections[1]
+    assert len(list(cache.iter_entries())) == 100
+
+
+def test_sqlite_hash_cache(tmpdir):
+    cache = SQLiteHashCache(
+        cache_dir=str(tmpdir), directory=str(tmpdir.join("unused")),
+        session=object(),
+    )
+    url = "https://files/six-1.11.0.tar.gz#sha256=aaa"
+    assert cache.get(url) is None
+    cache.set(url, b"sha256:aaa")
+    assert cache.get(url) == b"sha256:aaa"
+    cache.delete(url)
+    assert cache.get(url) is None
+
+
+def test_get_dependency_cache_backend(monkeypatch):
+    monkeypatch.setenv("PASSA_CACHE_BACKEND", "sqlite")
+    assert isinstance(get_dependency_cache(), SQLiteDependencyCache)
+    monkeypatch.setenv("PASSA_CACHE_BACKEND", "")
+    assert isinstance(get_dependency_cache(), DependencyCache)
+
+
+def test_verify_old_sqlite_dependency_cache(tmpdir):
+    # A database written before entries carried a schema.
+    connection = sqlite3.connect(str(tmpdir.join("metadata.sqlite3")))
+    python = "{0[0]}.{0[1]}".format(sys.version_info)
+    with connection:
+        connection.execute("""CREATE TABLE dependencies (
+            python TEXT NOT NULL,
+            name TEXT NOT NULL,
+            version TEXT NOT NULL,
+            extras TEXT NOT NULL,
+            dependencies TEXT NOT NULL,
+            requires_python TEXT NOT NULL,
+            PRIMARY KEY (python, name, version, extras)
+        )""")
+        connection.executemany(
+            "INSERT INTO dependencies VALUES (?, ?, ?, ?, ?, ?)", [
+                (python, "foo", "1.0", "", '["Six (>=1.0)"]', ">=2.7"),
+                (python, "bar", "1.0", "", '["bar"]', ""),
+            ],
+        )
+    connection.close()
+
+    cache = SQLiteDependencyCache(cache_dir=str(tmpdir))
+    assert dict(cache.iter_entries())[("foo", "1.0", "")]["schema"] == 0
+    assert verify_dependency_cache(cache) == (2, 1, 1)
+    assert dict(cache.iter_entries()) == {("foo", "1.0", ""): {
+        "dependencies": ["Six>=1.0"],
+        "requires_python": ">=2.7",
+        "schema": CACHE_SCHEMA,
+    }}
+
+
+class _HashCache(HashCache):
+    def __init__(self, file_hash, **kwargs):
+        super(_HashCache, self).__init__(session=object(), **kwargs)
+        self.file_hash = file_hash
+        self.downloaded = []
+
+    def _get_file_hash(self, location):
+        self.downloaded.append(location.url)
+        return self.file_hash
+
+
+HASHED_URL = "https://files/six-1.11.0.tar.gz#sha256=aaa"
+
+
+def test_hash_cache_trusts_advertised_hash(tmpdir):
+    cache = _HashCache("sha256:bbb", directory=str(tmpdir), verify=False)
+    assert cache.get_hash(Link(HASHED_URL)) == "sha256:aaa"
+    assert cache.downloaded == []
+
+
+def test_hash_cache_verifies_advertised_hash(tmpdir):
+    cache = _HashCache("sha256:aaa", directory=str(tmpdir), verify=True)
+    assert cache.get_hash(Link(HASHED_URL)) == "sha256:aaa"
+    assert cache.downloaded == [HASHED_URL]
+    # Verified hashes are cached by URL.
+    assert cache.get_hash(Link(HASHED_URL)) == "sha256:aaa"
+    assert cache.downloaded == [HASHED_URL]
+
+
+def test_hash_cache_mismatch(tmpdir):
+    cache = _HashCache("sha256:bbb", directory=str(tmpdir), verify=True)
+    with pytest.raises(HashMismatchError):
+        cache.get_hash(Link(HASHED_URL))
+    assert cache.get(HASHED_URL) is None
+
+
+def test_hash_cache_without_advertised_hash(tmpdir):
+    cache = _HashCache("sha256:bbb", directory=str(tmpdir), verify=False)
+    url = "https://files/six-1.11.0.tar.gz"
+    assert cache.get_hash(Link(url)) == "sha256:bbb"
+    assert cache.get_hash(Link(url)) == "sha256:bbb"
+    assert cache.downloaded == [url, url]
@@ -0,0 +1,79 @@
+import packaging.version
+
+from passa.internals import candidates
+from passa.internals.candidates import (
+    Candidate, find_candidates, find_recorded_artifacts, materialize,
+)
+from passa.internals.indexes import IndexEntry
+from passa.internals.requirements import parse_requirement_line
+from passa.internals.utils import identify_requirment
+
+
+def test_candidate_is_lazy():
+    candidate = Candidate(
+        "requests", packaging.version.parse("2.20.0"), ["Socks"], None,
+    )
+    assert identify_requirment(candidate) == "requests[socks]"
+    assert candidate.as_line() == "requests[socks]==2.20.0"
+    assert getattr(candidate, "_preferred_by_provider", False) is False
+    assert candidate._requirement is None
+
+    requirement = materialize(candidate)
+    assert requirement.as_line() == candidate.as_line()
+    assert candidate.as_ireq().name == "requests"
+    assert materialize(candidate) is requirement
+    assert materialize(requirement) is requirement
+
+
+def test_candidate_equality():
+    version = packaging.version.parse("1.0")
+    assert Candidate("foo", version, (), None) == Candidate(
+        "foo", packaging.version.parse("1.0.0"), [], None,
+    )
+    assert Candidate("foo", version, (), None) != Candidate(
+        "foo", version, ("bar",), None,
+    )
+
+
+def _make_entry(filename, version, requires_python=None):
+    return IndexEntry(
+        "https://files/{0}".format(filename), filename,
+        packaging.version.parse(version), requires_python, None, None,
+    )
+
+
+def test_find_recorded_artifacts(monkeypatch):
+    entries = [
+        _make_entry("foo-1.0.tar.gz", "1.0"),
+        _make_entry("foo-1.0-py3-none-any.whl", "1.0"),
+        _make_entry("foo-2.0b1.tar.gz", "2.0b1", ">=3.8"),
+    ]
+    monkeypatch.setattr(
+        candidates, "find_index_entries", lambda name, sources: entries,
+    )
+    sources = [{"name": "pypi", "url": "https://pypi.org/simple"}]
+    cache = {}
+    artifacts = {}
+    requirement = parse_requirement_line("foo")
+
+    found = find_candidates(
+        requirement, sources, "3.7", False, cache=cache, artifacts=artifacts,
+    )
+    assert [c.as_line() for c in found] == ["foo==1.0"]
+    # Looked up again under other cache keys.
+    find_candidates(
+        requirement, sources, "3.7", True, cache=cache, artifacts=artifacts,
+    )
+    find_candidates(
+        requirement, sources, "3.8", True, cache=cache, artifacts=artifacts,
+    )
+    assert len(cache) == 3
+
+    def find(line):
+        pinned = parse_requirement_line(line)
+        return find_recorded_artifacts(artifacts, pinned, sources)
+
+    assert find("foo==1.0") == entries[:2]
+    # Recorded even though filtered out by Requires-Python.
+    assert find("foo==2.0b1") == entries[2:]
+    assert find("foo==3.0") is None
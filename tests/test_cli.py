@@ -0,0 +1,39 @@
+import pytest
+
+from passa.cli import lock
+
+
+@pytest.fixture
+def project_root(tmpdir):
+    tmpdir.join("Pipfile").write("")
+    return str(tmpdir)
+
+
+@pytest.fixture
+def locked(monkeypatch):
+    calls = []
+    monkeypatch.setattr(lock, "lock", lambda **kwargs: calls.append(kwargs))
+    return calls
+
+
+@pytest.mark.parametrize("argv", [
+    ["--all-targets", "--target-platform", "manylinux1_x86_64"],
+    ["--target-python", "3.7", "--all-targets"],
+])
+def test_lock_all_targets_exclusive(project_root, locked, argv):
+    command = lock.Command.build_parser()
+    with pytest.raises(SystemExit):
+        command(["--project", project_root] + argv)
+    assert not locked
+
+
+def test_lock_targets(project_root, locked):
+    command = lock.Command.build_parser()
+    command([
+        "--project", project_root,
+        "--target-platform", "manylinux1_x86_64", "--target-python", "3.7",
+    ])
+    assert len(locked) == 1
+    assert locked[0]["platforms"] == ["manylinux1_x86_64"]
+    assert locked[0]["python_versions"] == ["3.7"]
+    assert not locked[0]["all_targets"]
@@ -0,0 +1,106 @@
+import tarfile
+
+import pytest
+import requirementslib
+
+from passa.internals import _pip
+from passa.internals.dependencies import (
+    _get_dependencies_from_json_url, _get_dependencies_from_sdist_metadata,
+)
+
+
+def _make_sdist(tmpdir, name, files):
+    root = tmpdir.mkdir("{0}-1.0".format(name))
+    for filename, content in files.items():
+        root.join(filename).write(content)
+    path = tmpdir.join("{0}-1.0.tar.gz".format(name))
+    with tarfile.open(str(path), "w:gz") as tf:
+        tf.add(str(root), arcname=root.basename)
+    return requirementslib.Requirement.from_line(str(path)).as_ireq()
+
+
+def test_get_dependencies_from_sdist_metadata_egg_info(tmpdir):
+    ireq = _make_sdist(tmpdir, "foo", {"setup.py": (
+        "from setuptools import setup\n"
+        "setup(name='foo', version='1.0', install_requires=['six>=1.0'],\n"
+        "      python_requires='>=2.7')\n"
+    )})
+    result = _get_dependencies_from_sdist_metadata(ireq, [])
+    assert result == (["six (>=1.0)"], ">=2.7")
+
+
+def test_get_dependencies_from_sdist_metadata_pep517(tmpdir):
+    pytest.importorskip("pep517")
+    ireq = _make_sdist(tmpdir, "bar", {
+        "pyproject.toml": (
+            "[build-system]\n"
+            "requires = ['setuptools']\n"
+            "build-backend = 'setuptools.build_meta'\n"
+        ),
+        "setup.cfg": (
+            "[metadata]\nname = bar\nversion = 1.0\n\n"
+            "[options]\ninstall_requires =\n    six>=1.0\n"
+        ),
+    })
+    result = _get_dependencies_from_sdist_metadata(ireq, [])
+    assert result == (["six (>=1.0)"], "")
+
+
+def test_only_metadata_preparation_is_locked(monkeypatch, tmpdir):
+    ireq = _make_sdist(tmpdir, "qux", {"setup.py": (
+        "from setuptools import setup\n"
+        "setup(name='qux', version='1.0')\n"
+    )})
+    locked = []
+
+    def wrap(name):
+        f = getattr(_pip, name)
+
+        def wrapped(*args, **kwargs):
+            locked.append((name, _pip._BUILD_LOCK.locked()))
+            return f(*args, **kwargs)
+
+        monkeypatch.setattr(_pip, name, wrapped)
+
+    wrap("_prepare_source")
+    wrap("_prepare_metadata")
+    assert _get_dependencies_from_sdist_metadata(ireq, []) == ([], "")
+    assert locked == [("_prepare_source", False), ("_prepare_metadata", True)]
+
+
+class _JSONResponse(object):
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class _JSONSession(object):
+    def __init__(self, data):
+        self.data = data
+
+    def get(self, url):
+        return _JSONResponse(self.data)
+
+
+@pytest.mark.parametrize("extras, expected", [
+    ((), ["six"]),
+    (("socks",), [
+        "six", "pysocks", 'win-inet-pton; sys_platform == "win32"',
+    ]),
+])
+def test_get_dependencies_from_json_url_extras(extras, expected):
+    session = _JSONSession({"info": {
+        "requires_python": ">=2.7",
+        "requires_dist": [
+            "six",
+            'pysocks; extra == "socks"',
+            'win-inet-pton; sys_platform == "win32" and extra == "socks"',
+        ],
+    }})
+    result = _get_dependencies_from_json_url("https://json", session, extras)
+    assert result == (expected, ">=2.7")
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import packaging.version
+import requirementslib
+
+from passa.internals.candidates import _record_artifacts
+from passa.internals.hashes import collect_hashes
+from passa.internals.indexes import IndexEntry
+
+
+SOURCES = [{"name": "pypi", "url": "https://pypi.org/simple"}]
+
+
+class HashCache(object):
+    def __init__(self, delays=None):
+        self.links = []
+        self.delays = delays or {}
+        self.threads = set()
+
+    def get_hash(self, link):
+        time.sleep(self.delays.get(link.filename, 0))
+        self.links.append(link.filename)
+        self.threads.add(threading.current_thread().ident)
+        return "sha256:{0}".format(link.filename)
+
+
+def _record(artifacts, name, version, filenames):
+    _record_artifacts(artifacts, name, SOURCES, [
+        IndexEntry(
+            "https://files/{0}".format(filename), filename,
+            packaging.version.parse(version), None, None, None,
+        )
+        for filename in filenames
+    ])
+
+
+def test_collect_hashes_skips_hashed():
+    artifacts = {}
+    _record(artifacts, "six", "1.11.0", ["six-1.11.0.tar.gz"])
+    _record(artifacts, "foo", "1.0", ["foo-1.0.tar.gz"])
+    hashed = requirementslib.Requirement.from_line("foo==1.0")
+    hashed.hashes = {"sha256:known"}
+    pending = requirementslib.Requirement.from_line("six==1.11.0")
+
+    cache = HashCache()
+    collect_hashes(cache, [hashed, pending], SOURCES, artifacts=artifacts)
+    assert hashed.hashes == {"sha256:known"}
+    assert pending.hashes == {"sha256:six-1.11.0.tar.gz"}
+    assert cache.links == ["six-1.11.0.tar.gz"]
+
+
+def test_collect_hashes_parallel(monkeypatch):
+    monkeypatch.setenv("PASSA_MAX_WORKERS", "4")
+    artifacts = {}
+    requirements = []
+    delays = {}
+    for i in range(8):
+        name = "pkg{0}".format(i)
+        filenames = [
+            "{0}-1.0.tar.gz".format(name),
+            "{0}-1.0-py2.py3-none-any.whl".format(name),
+        ]
+        _record(artifacts, name, "1.0", filenames)
+        # Earlier requirements finish later.
+        delays[filenames[0]] = (8 - i) * 0.01
+        requirements.append(
+            requirementslib.Requirement.from_line("{0}==1.0".format(name)),
+        )
+
+    cache = HashCache(delays)
+    collect_hashes(cache, requirements, SOURCES, artifacts=artifacts)
+    for i, requirement in enumerate(requirements):
+        assert requirement.hashes == {
+            "sha256:pkg{0}-1.0.tar.gz".format(i),
+            "sha256:pkg{0}-1.0-py2.py3-none-any.whl".format(i),
+        }
+    assert len(cache.threads) > 1
@@ -0,0 +1,133 @@
+import pytest
+
+from passa.internals import indexes
+from passa.internals.indexes import (
+    IndexPageError, _fetch_page_entries, _get_page_entries,
+    _get_version_from_filename, _parse_page,
+)
+
+
+class Response(object):
+    def __init__(self, text, status_code=200, headers=None):
+        self.text = text
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.url = "https://pypi.org/simple/six/"
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise IOError(self.status_code)
+
+
+class Session(object):
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None):
+        self.requests.append(headers)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class PageCache(object):
+    def __init__(self, pages=None):
+        self.pages = dict(pages or {})
+
+    def get_page(self, url):
+        return self.pages.get(url)
+
+    def set_page(self, url, page):
+        self.pages[url] = page
+
+
+@pytest.mark.parametrize("filename, name, version", [
+    ("requests-2.19.1-py2.py3-none-any.whl", "requests", "2.19.1"),
+    ("requests-2.19.1.tar.gz", "requests", "2.19.1"),
+    ("zope.interface-4.5.0.zip", "zope-interface", "4.5.0"),
+    ("Foo_Bar-1.0rc1.tar.bz2", "foo-bar", "1.0rc1"),
+    ("foo-bar-baz-1.0.tar.gz", "foo-bar-baz", "1.0"),
+
+    ("requests-toolbelt-0.8.0.tar.gz", "requests-toolbelt", "0.8.0"),
+
+    # Not an artifact of this project.
+    ("requests-toolbelt-0.8.0.tar.gz", "requests", None),
+    ("requests-2.19.1.exe", "requests", None),
+    ("requests-latest.tar.gz", "requests", None),
+])
+def test_get_version_from_filename(filename, name, version):
+    assert _get_version_from_filename(filename, name) == version
+
+
+def test_parse_page():
+    content = """
+        <a href="../../packages/ab/six-1.11.0.tar.gz#sha256=70e8a77beed4562e7"
+           data-requires-python="&gt;=2.6, !=3.0.*">six-1.11.0.tar.gz</a>
+        <a href="https://files/six-1.11.0-py2.py3-none-any.whl"
+           data-dist-info-metadata="sha256=6f22d1e3c5d8b2c4">wheel</a>
+        <a href="https://files/six.html">not an artifact</a>
+    """
+    entries = _parse_page(content, "https://pypi.org/simple/six/", "six")
+    assert [tuple(e) for e in entries] == [
+        (
+            "https://pypi.org/packages/ab/six-1.11.0.tar.gz",
+            "six-1.11.0.tar.gz", "1.11.0", ">=2.6, !=3.0.*",
+            "sha256:70e8a77beed4562e7", None,
+        ),
+        (
+            "https://files/six-1.11.0-py2.py3-none-any.whl",
+            "six-1.11.0-py2.py3-none-any.whl", "1.11.0", None, None,
+            "sha256=6f22d1e3c5d8b2c4",
+        ),
+    ]
+
+
+def test_get_page_entries_does_not_remember_failures(monkeypatch):
+    monkeypatch.setattr(indexes, "INDEX_CACHE", PageCache())
+    monkeypatch.setattr(indexes, "_PAGE_ENTRIES", {})
+    url = "https://pypi.org/simple/six/"
+    session = Session([
+        IOError("connection reset"),
+        Response("", status_code=503),
+        Response('<a href="six-1.11.0.tar.gz">six-1.11.0.tar.gz</a>'),
+    ])
+    for _ in range(2):
+        with pytest.raises(IndexPageError):
+            _get_page_entries(session, url, "six")
+    entries = _get_page_entries(session, url, "six")
+    assert [e.filename for e in entries] == ["six-1.11.0.tar.gz"]
+    assert _get_page_entries(session, url, "six") == entries
+    assert len(session.requests) == 3
+
+
+@pytest.mark.parametrize("response", [
+    Response("", status_code=304),
+    # pip's HTTP cache may answer a 304 with its cached 200 response.
+    Response("<html></html>", headers={"ETag": '"abc"'}),
+])
+def test_fetch_page_entries_revalidated(monkeypatch, response):
+    url = "https://pypi.org/simple/six/"
+    cache = PageCache({url: {
+        "etag": '"abc"',
+        "last_modified": "Wed, 21 Oct 2015 07:28:00 GMT",
+        "fetched": 0,
+        "entries": [[
+            "https://files/six-1.11.0.tar.gz", "six-1.11.0.tar.gz",
+            "1.11.0", None, None, None,
+        ]],
+    }})
+    monkeypatch.setattr(indexes, "INDEX_CACHE", cache)
+    session = Session([response])
+    entries = _fetch_page_entries(session, url, "six")
+    assert [(e.filename, str(e.version)) for e in entries] == [
+        ("six-1.11.0.tar.gz", "1.11.0"),
+    ]
+    assert session.requests == [{
+        "Accept": "text/html",
+        "Cache-Control": "max-age=0",
+        "If-None-Match": '"abc"',
+        "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT",
+    }]
+    assert cache.pages[url]["fetched"] > 0
@@ -0,0 +1,34 @@
+import json
+
+from passa.internals import instruments
+
+
+def test_count_and_timed_without_recorder():
+    assert instruments.get_recorder() is None
+    instruments.count("foo")
+    with instruments.timed("bar"):
+        pass
+
+
+def test_recorder_rounds(tmpdir):
+    recorder = instruments.start()
+    try:
+        instruments.count("http.requests")
+        recorder.start_round()
+        instruments.count("http.requests", 2)
+        with instruments.timed("find_matches"):
+            pass
+        recorder.end_round(0, pins=3)
+    finally:
+        assert instruments.stop() is recorder
+
+    path = tmpdir.join("report.json")
+    recorder.write(str(path))
+    report = json.loads(path.read())
+    assert report["counts"] == {"http.requests": 3}
+    assert report["timings"]["find_matches"]["calls"] == 1
+    round_report, = report["rounds"]
+    assert round_report["index"] == 0
+    assert round_report["pins"] == 3
+    assert round_report["counts"] == {"http.requests": 2}
+    assert round_report["timings"]["find_matches"]["calls"] == 1
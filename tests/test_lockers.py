@@ -0,0 +1,94 @@
+import io
+import json
+
+import plette
+import pytest
+import requirementslib
+import resolvelib
+
+from passa.internals import indexes
+from passa.models import lockers
+from passa.models.lockers import (
+    BasicLocker, _carry_forward_hashes, _get_pinned_hashes,
+)
+from passa.models.projects import Project
+
+
+def _load_lockfile(default):
+    return plette.Lockfile.load(io.StringIO(json.dumps({
+        "_meta": {
+            "hash": {"sha256": ""},
+            "pipfile-spec": 6,
+            "requires": {},
+            "sources": [
+                {"name": "pypi", "url": "https://pypi.org/simple",
+                 "verify_ssl": True},
+                {"name": "private", "url": "https://example.com/simple",
+                 "verify_ssl": True},
+            ],
+        },
+        "default": default,
+        "develop": {},
+    })))
+
+
+LOCKFILE = _load_lockfile({
+    "six": {"version": "==1.11.0", "hashes": ["sha256:aaa"]},
+    "foo": {"version": "==1.0", "hashes": ["sha256:bbb"], "index": "private"},
+})
+
+
+def _carry_forward(line, index=None):
+    requirement = requirementslib.Requirement.from_line(line)
+    requirement.index = index
+    _carry_forward_hashes([requirement], _get_pinned_hashes(LOCKFILE))
+    return requirement.hashes
+
+
+def test_get_pinned_hashes():
+    assert _get_pinned_hashes(LOCKFILE) == {
+        ("six", "1.11.0", None): {"sha256:aaa"},
+        ("foo", "1.0", "private"): {"sha256:bbb"},
+    }
+
+
+def test_carry_forward_unchanged_pin():
+    assert _carry_forward("six==1.11.0") == {"sha256:aaa"}
+    assert _carry_forward("foo==1.0", index="private") == {"sha256:bbb"}
+
+
+def test_carry_forward_version_changed():
+    assert not _carry_forward("six==1.12.0")
+
+
+def test_carry_forward_index_changed():
+    assert not _carry_forward("six==1.11.0", index="private")
+    assert not _carry_forward("foo==1.0")
+
+
+def test_carry_forward_keeps_existing_hashes():
+    requirement = requirementslib.Requirement.from_line("six==1.11.0")
+    requirement.hashes = {"sha256:ccc"}
+    _carry_forward_hashes([requirement], _get_pinned_hashes(LOCKFILE))
+    assert requirement.hashes == {"sha256:ccc"}
+
+
+@pytest.mark.parametrize("fails", [False, True])
+def test_lock_clears_page_entries(monkeypatch, tmpdir, fails):
+    monkeypatch.setattr(indexes, "_PAGE_ENTRIES", {"https://x/six/": []})
+
+    class Resolver(resolvelib.Resolver):
+        def resolve(self, requirements):
+            if fails:
+                raise resolvelib.ResolutionImpossible([])
+            return super(Resolver, self).resolve(requirements)
+
+    monkeypatch.setattr(lockers.resolvelib, "Resolver", Resolver)
+    tmpdir.join("Pipfile").write("[packages]\n")
+    locker = BasicLocker(Project(str(tmpdir)))
+    if fails:
+        with pytest.raises(resolvelib.ResolutionImpossible):
+            locker.lock()
+    else:
+        locker.lock()
+    assert indexes._PAGE_ENTRIES == {}
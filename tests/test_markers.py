@@ -1,6 +1,8 @@
 from packaging.markers import Marker
 
-from passa.internals.markers import get_without_extra
+from passa.internals.markers import (
+    ALWAYS, conjoin, disjoin, get_without_extra, parse_marker,
+)
 
 
 def test_strip_marker_extra_noop():
@@ -64,3 +66,40 @@ def test_strip_marker_extra_crazy_cancelled():
         '(extra == "huh" or extra == "bar")',
     ))
     assert marker is None
+
+
+def test_conjoin_merges_python_versions():
+    marker = conjoin([
+        'python_version >= "2.7"',
+        'sys_platform == "win32" and python_version >= "3.7"',
+        'python_version not in "3.0, 3.1, 3.2, 3.3, 3.4, 3.5, 3.6"',
+    ])
+    assert str(marker) == 'python_version >= "3.7" and sys_platform == "win32"'
+
+
+def test_conjoin_keeps_overlapping_exclusion():
+    marker = conjoin(['python_version >= "3.0"', 'python_version != "3.1"'])
+    assert str(marker) == 'python_version != "3.1" and python_version >= "3.0"'
+
+
+def test_disjoin_absorbs():
+    marker = disjoin([
+        'python_version < "3.8" and python_version >= "3.7"',
+        'python_version < "3.8" and python_version < "3.11" and '
+        'python_version >= "3.7"',
+        'os_name == "nt" and python_version >= "3.7" and '
+        'python_version < "3.8"',
+    ])
+    assert str(marker) == 'python_version < "3.8" and python_version >= "3.7"'
+
+
+def test_disjoin_covering_python_versions():
+    marker = disjoin(['python_version < "3"', 'python_version >= "3.0"'])
+    assert marker is ALWAYS
+
+
+def test_parse_marker_interned():
+    marker = parse_marker('os_name == "nt" and sys_platform == "win32"')
+    assert parse_marker(Marker(
+        "sys_platform == 'win32' and os_name == 'nt'",
+    )) is marker
@@ -0,0 +1,59 @@
+import collections
+
+from resolvelib.structs import DirectedGraph
+
+from passa.internals.traces import trace_graph
+from passa.models.metadata import set_metadata
+
+
+Dependency = collections.namedtuple("Dependency", ["markers"])
+
+
+class Candidate(object):
+    markers = None
+
+
+def _lock(edges, pythons=None):
+    graph = DirectedGraph()
+    graph.add(None)
+    dependencies = {}
+    for parent, child, markers in edges:
+        for vertex in (parent, child):
+            if vertex not in graph:
+                graph.add(vertex)
+        graph.connect(parent, child)
+        dependencies.setdefault(parent, {})[child] = Dependency(markers)
+    candidates = {key: Candidate() for key in graph if key is not None}
+    pythons = dict({key: "" for key in candidates}, **(pythons or {}))
+    set_metadata(candidates, trace_graph(graph), dependencies, pythons)
+    return {key: c.markers for key, c in candidates.items()}
+
+
+def test_set_metadata_multiple_parents():
+    markers = _lock([
+        (None, "a", 'sys_platform == "win32"'),
+        (None, "b", None),
+        ("a", "c", 'python_version < "3"'),
+        ("b", "c", 'os_name == "nt"'),
+    ], pythons={"c": ">=2.7"})
+    assert markers["a"] == 'sys_platform == "win32"'
+    assert markers["b"] is None
+    assert markers["c"] == (
+        '(os_name == "nt" and python_version >= "2.7") or '
+        '(python_version < "3" and python_version >= "2.7" and '
+        'sys_platform == "win32")'
+    )
+
+
+def test_set_metadata_cycle():
+    markers = _lock([
+        (None, "a", 'os_name == "nt"'),
+        ("a", "b", None),
+        ("b", "c", None),
+        ("c", "a", 'sys_platform == "win32"'),
+    ])
+    assert markers == {
+        "a": 'os_name == "nt"',
+        "b": 'os_name == "nt"',
+        "c": 'os_name == "nt"',
+    }
@@ -0,0 +1,40 @@
+import pytest
+
+from passa.internals import _pip
+
+
+PYPI = {"name": "pypi", "url": "https://pypi.org/simple", "verify_ssl": True}
+PRIVATE = {
+    "name": "private", "url": "http://example.com/simple",
+    "verify_ssl": False,
+}
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    sessions = {}
+    monkeypatch.setattr(_pip, "_SESSIONS", sessions)
+    return sessions
+
+
+def test_get_session_shared(sessions):
+    session = _pip.get_session([PYPI])
+    assert _pip.get_session([dict(PYPI)]) is session
+    other = _pip.get_session([PYPI, PRIVATE])
+    assert other is not session
+    assert _pip.get_session([PYPI, PRIVATE]) is other
+    assert len(sessions) == 2
+
+
+@pytest.mark.parametrize("value, maxsize", [
+    ("", 10),
+    ("invalid", 10),
+    ("32", 32),
+])
+def test_get_session_pool_maxsize(monkeypatch, sessions, value, maxsize):
+    monkeypatch.setenv("PASSA_MAX_CONNECTIONS_PER_HOST", value)
+    session = _pip.get_session([PYPI])
+    for prefix in ("https://", "http://"):
+        adapter = session.get_adapter(prefix + "pypi.org")
+        pool = adapter.poolmanager.connection_from_url(prefix + "pypi.org")
+        assert pool.pool.maxsize == maxsize
@@ -0,0 +1,28 @@
+from passa.internals.prefetch import Lookahead
+from passa.internals.requirements import parse_requirement_line
+
+
+class Requirement(object):
+    is_named = False
+    specifiers = None
+    name = "passa"
+
+
+class Provider(object):
+    def __init__(self):
+        self.fetched = []
+
+    def identify(self, requirement):
+        return requirement.name
+
+    def fetch_matches(self, requirement):
+        self.fetched.append(requirement.name)
+        return []
+
+
+def test_schedule_skips_non_named():
+    provider = Provider()
+    with Lookahead(provider, depth=1, max_workers=1) as lookahead:
+        lookahead.schedule([Requirement(), parse_requirement_line("six")])
+        lookahead.wait()
+    assert provider.fetched == ["six"]
@@ -0,0 +1,151 @@
+import packaging.version
+import requirementslib
+
+from resolvelib.resolvers import RequirementInformation
+
+from passa.internals import candidates, instruments
+from passa.internals.candidates import Candidate
+from passa.internals.indexes import IndexEntry, IndexPageError
+from passa.internals.prefetch import Lookahead
+from passa.internals.requirements import parse_requirement_line
+from passa.models.providers import (
+    BasicProvider, EagerUpgradeProvider, InstrumentedProvider,
+)
+
+
+def _make_candidate(version, name="foo"):
+    return Candidate(name, packaging.version.parse(version), (), None)
+
+
+def _get_preference(provider, line, versions, parents=1):
+    requirement = parse_requirement_line(line)
+    candidates = [_make_candidate(v, requirement.name) for v in versions]
+    information = [RequirementInformation(requirement, None)] * parents
+    return provider.get_preference(None, candidates, information)
+
+
+def test_is_satisfied_by():
+    provider = BasicProvider([], [], "3.7", False)
+    requirement = requirementslib.Requirement.from_line("foo>=1.0,!=1.2")
+    assert provider.is_satisfied_by(requirement, _make_candidate("1.1"))
+    assert not provider.is_satisfied_by(requirement, _make_candidate("1.2"))
+    assert not provider.is_satisfied_by(requirement, _make_candidate("0.9"))
+    assert not provider.is_satisfied_by(requirement, _make_candidate("2.0b1"))
+    assert provider.is_satisfied_by(requirement, _make_candidate("1.1"))
+    assert len(provider._specifiers) == 1
+    assert len(provider._satisfied) == 4
+
+
+def test_is_satisfied_by_invalid_version():
+    provider = BasicProvider([], [], "3.7", False)
+    requirement = requirementslib.Requirement.from_line("foo>=1.0")
+    candidate = _make_candidate("not-a-version")
+    assert not provider.is_satisfied_by(requirement, candidate)
+    assert provider.invalid_candidates == {"foo==not-a-version"}
+    unpinned = requirementslib.Requirement.from_line("foo")
+    assert provider.is_satisfied_by(unpinned, candidate)
+
+
+def test_get_preference():
+    provider = BasicProvider([], [], "3.7", False)
+    provider.preference_strategy = "heuristic"
+    exact = requirementslib.Requirement.from_line("foo==1.1")
+    loose = requirementslib.Requirement.from_line("bar>=1.0")
+    candidates = [_make_candidate("1.0"), _make_candidate("1.1")]
+    exact_preference = provider.get_preference(
+        None, candidates, [RequirementInformation(exact, None)],
+    )
+    loose_preference = provider.get_preference(
+        None, candidates, [RequirementInformation(loose, None)],
+    )
+    assert exact_preference < loose_preference
+
+    provider.conflicts["bar"] = 1
+    assert provider.get_preference(
+        None, candidates, [RequirementInformation(loose, None)],
+    ) < loose_preference
+
+
+def test_get_preference_parents():
+    provider = BasicProvider([], [], "3.7", False)
+    provider.preference_strategy = "heuristic"
+    assert (
+        _get_preference(provider, "foo>=1.0", ["1.0", "2.0"], parents=2) <
+        _get_preference(provider, "foo>=1.0", ["1.0", "2.0"])
+    )
+
+
+def test_get_preference_depths():
+    provider = BasicProvider([], [], "3.7", False)
+    provider.preference_strategy = "heuristic"
+    provider.depths.update({"foo": 1, "bar": 2})
+    assert (
+        _get_preference(provider, "foo>=1.0", ["1.0", "2.0", "3.0"]) <
+        _get_preference(provider, "bar>=1.0", ["1.0", "2.0"])
+    )
+    # Candidates only break ties.
+    provider.depths["bar"] = 1
+    assert (
+        _get_preference(provider, "bar>=1.0", ["1.0", "2.0"]) <
+        _get_preference(provider, "foo>=1.0", ["1.0", "2.0", "3.0"])
+    )
+
+
+def test_get_preference_eager_upgrade():
+    provider = EagerUpgradeProvider(["bar"], {}, [], [], "3.7", False)
+    provider.preference_strategy = "heuristic"
+    provider.conflicts["foo"] = 3
+    tracked = _get_preference(provider, "bar>=1.0", ["1.0", "2.0"])
+    untracked = _get_preference(provider, "foo==1.0", ["1.0"], parents=2)
+    assert tracked < untracked
+    assert tracked[0] is False and untracked[0] is True
+
+
+def test_failed_lookahead_is_not_cached(monkeypatch):
+    results = [
+        IndexPageError("unable to read project page"),
+        IndexPageError("unable to read project page"),
+        [IndexEntry(
+            "https://files/foo-1.0.tar.gz", "foo-1.0.tar.gz",
+            packaging.version.parse("1.0"), None, None, None,
+        )],
+    ]
+
+    def find_index_entries(name, sources):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(candidates, "find_index_entries", find_index_entries)
+    sources = [{"url": "https://pypi.org/simple", "name": "pypi"}]
+    provider = BasicProvider([], sources, "3.7", False)
+    requirement = parse_requirement_line("foo>=1.0")
+    with Lookahead(provider, depth=0, max_workers=1) as lookahead:
+        lookahead.schedule([requirement])
+        lookahead.wait()
+    assert provider.candidate_cache == {}
+
+    assert provider.find_matches(requirement) == []
+    assert provider.candidate_cache == {}
+
+    matches = provider.find_matches(requirement)
+    assert [c.as_line() for c in matches] == ["foo==1.0"]
+    assert len(provider.candidate_cache) == 1
+
+
+def test_instrumented_provider_counts_backtracks():
+    provider = BasicProvider([], [], "3.7", False)
+    old, new = _make_candidate("1.0"), _make_candidate("2.0")
+    for candidate in (old, new):
+        provider.dependency_results[candidate.as_line()] = ([], "")
+    instrumented = InstrumentedProvider(provider)
+
+    recorder = instruments.start()
+    try:
+        for candidate in (new, new, old, new):
+            instrumented.get_dependencies(candidate)
+    finally:
+        instruments.stop()
+    assert recorder.counts["backtracks"] == 2
+    assert provider.conflicts == {"foo": 2}
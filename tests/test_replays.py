@@ -0,0 +1,109 @@
+import pytest
+import resolvelib
+
+from passa.internals.prefetch import Lookahead
+from passa.internals.replays import _build_provider, replay_trace
+from passa.internals.requirements import parse_requirement_line
+from passa.models import providers
+from passa.models.providers import PREFERENCE_STRATEGIES
+
+
+def _make_versions(name, versions):
+    return {
+        "name": name, "sources": [], "requires_python": "3.7",
+        "allow_prereleases": False, "versions": versions,
+    }
+
+
+TRACE = {
+    "format": 1,
+    "sources": [],
+    "requires_python": "3.7",
+    "allow_prereleases": False,
+    "requirements": ["a", "b>=1.0"],
+    "versions": [
+        _make_versions("a", ["1.0", "2.0"]),
+        _make_versions("b", ["1.0", "2.0"]),
+        _make_versions("c", ["1.0"]),
+    ],
+    "dependencies": {
+        "a==1.0": {"dependencies": [], "requires_python": ""},
+        "a==2.0": {
+            "dependencies": ["b<2", "c==1.0"], "requires_python": "",
+        },
+        "b==1.0": {"dependencies": [], "requires_python": ""},
+        "b==2.0": {"dependencies": [], "requires_python": ""},
+        "c==1.0": {"dependencies": [], "requires_python": ""},
+    },
+    "pins": {"a": "a==2.0", "b": "b==1.0", "c": "c==1.0"},
+}
+
+
+@pytest.mark.parametrize("strategy", PREFERENCE_STRATEGIES)
+def test_replay_trace(strategy):
+    result = replay_trace(TRACE, strategy)
+    assert result["rounds"] == 3
+    assert result["misses"] == 0
+    assert result["changed"] == 0
+
+
+def test_replay_trace_misses():
+    trace = dict(TRACE, requirements=["a", "d"])
+    result = replay_trace(trace, PREFERENCE_STRATEGIES[0])
+    assert result["rounds"] is None
+    assert result["misses"] == 1
+
+
+def _resolve_in_order(monkeypatch, trace, prefetch):
+    requirements = [
+        parse_requirement_line(line) for line in trace["requirements"]
+    ]
+    provider = _build_provider(trace, requirements, "heuristic")
+
+    # Start with nothing fetched, and fetch from the recorded answers.
+    recorded, provider.dependency_results = provider.dependency_results, {}
+    monkeypatch.setattr(
+        providers, "get_dependencies",
+        lambda candidate, sources: recorded[
+            candidate.as_line(include_hashes=False)
+        ],
+    )
+
+    order = []
+    get_dependencies = provider.get_dependencies
+
+    def record(candidate):
+        order.append(candidate.as_line(include_hashes=False))
+        return get_dependencies(candidate)
+
+    provider.get_dependencies = record
+    with Lookahead(provider, depth=1, max_workers=2) as lookahead:
+        if prefetch:
+            # Only fetch some things ahead, so the resolver sees a mix.
+            lookahead.schedule(requirements[:1])
+            lookahead.wait()
+            provider.lookahead = lookahead
+        resolvelib.Resolver(provider, resolvelib.BaseReporter()).resolve(
+            requirements,
+        )
+    return order
+
+
+def test_lookahead_does_not_change_pin_order(monkeypatch):
+    trace = dict(
+        TRACE,
+        requirements=["a", "b"],
+        versions=[
+            _make_versions("a", ["1.0", "2.0", "3.0"]),
+            _make_versions("b", ["1.0", "2.0"]),
+        ],
+        dependencies={
+            "a==3.0": {"dependencies": ["c"], "requires_python": ""},
+            "b==2.0": {"dependencies": [], "requires_python": ""},
+            "c==1.0": {"dependencies": [], "requires_python": ""},
+        },
+    )
+    trace["versions"].append(_make_versions("c", ["1.0"]))
+    expected = _resolve_in_order(monkeypatch, trace, prefetch=False)
+    assert expected == ["b==2.0", "a==3.0", "c==1.0"]
+    assert _resolve_in_order(monkeypatch, trace, prefetch=True) == expected
@@ -0,0 +1,54 @@
+import collections
+
+from resolvelib.structs import DirectedGraph
+
+from passa.internals.reporters import StdOutReporter
+
+
+State = collections.namedtuple("State", ["mapping", "graph"])
+
+
+class Pin(object):
+    def __init__(self, name):
+        self.name = name
+
+    def as_line(self, include_hashes=True):
+        return "{0}==1.0".format(self.name)
+
+
+def _diamonds(count):
+    # x0 -> (lN, rN) -> xN+1, with 2 ** count paths from x0 to the last.
+    graph = DirectedGraph()
+    graph.add(None)
+    graph.add("x0")
+    graph.connect(None, "x0")
+    for i in range(count):
+        bottom = "x{0}".format(i + 1)
+        graph.add(bottom)
+        for side in ("l", "r"):
+            vertex = "{0}{1}".format(side, i)
+            graph.add(vertex)
+            graph.connect("x{0}".format(i), vertex)
+            graph.connect(vertex, bottom)
+    return State({k: Pin(k) for k in graph if k is not None}, graph)
+
+
+def test_ending_prints_routes(capsys):
+    state = _diamonds(20)
+    StdOutReporter([], max_paths=0).ending(state)
+    lines = capsys.readouterr().out.splitlines()
+    index = lines.index("x20==1.0")
+    assert lines[index + 1] == "    Required by x0==1.0"
+    assert lines[index + 2] != "    Required by x0==1.0"
+    assert lines[lines.index("x0==1.0") + 1] == "    User requirement"
+
+
+def test_ending_caps_paths(capsys):
+    state = _diamonds(20)
+    StdOutReporter([], max_paths=3).ending(state)
+    lines = capsys.readouterr().out.splitlines()
+    index = lines.index("x20==1.0")
+    paths = lines[index + 2:index + 6]
+    assert [line.endswith(" <= x0==1.0") for line in paths] == [
+        True, True, True, False,
+    ]
@@ -0,0 +1,92 @@
+import pytest
+import requirementslib
+
+from passa.internals.candidates import Candidate
+from passa.internals.requirements import (
+    NamedRequirement, _parse_named_line, get_specifier,
+    parse_requirement_line,
+)
+from passa.internals.utils import strip_extras
+
+
+@pytest.mark.parametrize("line, name, extras, specifier, markers", [
+    ("zope.interface", "zope-interface", "", "", None),
+    ("Foo_Bar[Sec, b] (>=1.0)", "foo-bar", "[b,sec]", ">=1.0", None),
+    (
+        'PyYAML>=3.1,<5; python_version >= "2.7"',
+        "pyyaml", "", "<5,>=3.1", 'python_version >= "2.7"',
+    ),
+])
+def test_parse_named_line(line, name, extras, specifier, markers):
+    requirement = parse_requirement_line(line)
+    assert isinstance(requirement, NamedRequirement)
+    assert requirement.normalized_name == name
+    assert requirement.extras_as_pip == extras
+    assert str(get_specifier(requirement)) == specifier
+    assert requirement.markers == markers
+    assert requirement._requirement is None
+
+
+@pytest.mark.parametrize("line", [
+    "requests @ https://example.com/requests-2.20.0.tar.gz",
+    "https://example.com/requests-2.20.0.tar.gz",
+    "requests==2.20.0 --hash=sha256:abcdef",
+    "-e git+https://github.com/sarugaku/passa.git#egg=passa",
+    "./requests-2.20.0-py2.py3-none-any.whl",
+    "requests-2.20.0-py2.py3-none-any.whl",
+])
+def test_parse_other_line(line):
+    # These are left to requirementslib.
+    assert _parse_named_line(line) is None
+
+
+def test_named_requirement_materialize():
+    requirement = parse_requirement_line('foo[bar]>=1.0; os_name == "nt"')
+    assert requirement.as_ireq().name == "foo"
+    materialized = requirement.as_requirement()
+    assert materialized.extras_as_pip == "[bar]"
+    assert materialized.markers == 'os_name == "nt"'
+
+    requirement.markers = None
+    assert requirement._requirement is None
+    stripped = strip_extras(requirement)
+    assert isinstance(stripped, NamedRequirement)
+    assert stripped.as_line() == "foo>=1.0"
+    assert requirement.extras == ("bar",)
+
+
+@pytest.mark.parametrize("line", [
+    "foo[bar baz]>=1.0",
+    "foo[bar]]>=1.0",
+    "foo[-bar]",
+    "foo>=1.0,~2",
+    'foo>=1.0; python_version >> "3"',
+    'foo>=1.0; os_name == "nt',
+    "foo @ https://example.com/foo-1.0.tar.gz",
+    "https://example.com/foo-1.0.tar.gz#egg=foo",
+])
+def test_parse_malformed_line(monkeypatch, line):
+    # Anything the fast path rejects is passed on to requirementslib as is,
+    # so it gets a chance to parse (or report) it.
+    lines = []
+
+    def from_line(value):
+        lines.append(value)
+        return value
+
+    monkeypatch.setattr(requirementslib.Requirement, "from_line", from_line)
+    assert parse_requirement_line(line) == line
+    assert lines == [line]
+
+
+def test_parse_line_with_hashes():
+    requirement = parse_requirement_line("foo==1.0 --hash=sha256:abcd")
+    assert isinstance(requirement, requirementslib.Requirement)
+    assert requirement.hashes == ["sha256:abcd"]
+
+
+def test_lazy_requirements_compare_by_type():
+    requirement = parse_requirement_line("foo")
+    assert requirement == parse_requirement_line("Foo")
+    assert requirement != Candidate("foo", "1.0", (), None)
+    assert repr(requirement) == "<NamedRequirement 'foo'>"
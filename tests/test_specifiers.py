@@ -2,7 +2,7 @@ import pytest
 
 from packaging.specifiers import SpecifierSet
 
-from passa.internals.specifiers import cleanup_pyspecs
+from passa.internals.specifiers import cleanup_pyspecs, parse_pyspecs
 
 
 @pytest.mark.parametrize("spec, cleaned", [
@@ -28,3 +28,26 @@ from passa.internals.specifiers import cleanup_pyspecs
 def test_cleanup_pyspecs(spec, cleaned):
     cleaned_specifierset = frozenset(s for s in cleaned)
     assert cleanup_pyspecs(SpecifierSet(spec)) == cleaned_specifierset
+
+
+def test_pyspecs_intersection_and_union():
+    py27 = parse_pyspecs(">=2.7,<2.8")
+    py3 = parse_pyspecs(">=3.4")
+    assert not (py27 & py3)
+    assert parse_pyspecs("!=3.0.*,!=3.1.*,>=2.7") & py3 == py3
+    assert str((py27 | py3).as_marker()) == (
+        'python_version == "2.7" or python_version >= "3.4"'
+    )
+
+
+def test_pyspecs_patch_releases_include_minor():
+    assert parse_pyspecs(">=2.7.9") == parse_pyspecs(">=2.7")
+    assert parse_pyspecs("<3.4.2") == parse_pyspecs("<3.5")
+
+
+def test_pyspecs_exclusions_not_matching_substrings():
+    versions = parse_pyspecs(">=3.0,!=3.5.*,!=3.10.*")
+    assert str(versions.as_marker()) == (
+        'python_version != "3.10" and python_version != "3.5" and '
+        'python_version >= "3.0"'
+    )
@@ -0,0 +1,42 @@
+import pytest
+
+from passa.internals import targets
+from passa.internals.targets import (
+    Targets, get_environment_mismatch, is_artifact_targeted,
+)
+
+
+TARGETS = Targets(platforms=("manylinux*_x86_64",), python_versions=("3.7",))
+
+
+@pytest.mark.parametrize("filename, targeted", [
+    ("PyYAML-6.0.1.tar.gz", True),
+    ("six-1.11.0-py2.py3-none-any.whl", True),
+    ("PyYAML-6.0.1-cp37-cp37m-manylinux_2_17_x86_64.manylinux2014_x86_64.whl", True),
+    ("PyYAML-6.0.1-cp38-cp38-manylinux_2_17_x86_64.manylinux2014_x86_64.whl", False),
+    ("PyYAML-6.0.1-cp37-cp37m-manylinux_2_17_aarch64.whl", False),
+    ("PyYAML-6.0.1-cp37-cp37m-win_amd64.whl", False),
+    ("cryptography-41.0.0-cp37-abi3-manylinux_2_28_x86_64.whl", True),
+    ("cryptography-41.0.0-cp39-abi3-manylinux_2_28_x86_64.whl", False),
+    ("foo-1.0-py2-none-any.whl", False),
+
+    # Not a valid wheel name; hashed in case it is needed.
+    ("foo-1.0.whl", True),
+])
+def test_is_artifact_targeted(filename, targeted):
+    assert is_artifact_targeted(filename, TARGETS) is targeted
+
+
+def test_no_targets_accepts_everything():
+    assert is_artifact_targeted("foo-1.0-cp27-cp27m-win32.whl", None)
+
+
+@pytest.mark.parametrize("platform, mismatch", [
+    ("linux-x86_64", False),
+    ("linux-aarch64", True),
+    ("win-amd64", True),
+])
+def test_get_environment_mismatch(monkeypatch, platform, mismatch):
+    monkeypatch.setattr(targets.sysconfig, "get_platform", lambda: platform)
+    declared = Targets(platforms=TARGETS.platforms, python_versions=())
+    assert bool(get_environment_mismatch(declared)) is mismatch
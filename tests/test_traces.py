@@ -0,0 +1,45 @@
+from resolvelib.structs import DirectedGraph
+
+from passa.internals.traces import trace_graph
+
+
+def _build_graph(edges):
+    graph = DirectedGraph()
+    graph.add(None)
+    for parent, child in edges:
+        for vertex in (parent, child):
+            if vertex not in graph:
+                graph.add(vertex)
+        graph.connect(parent, child)
+    return graph
+
+
+def test_trace_graph():
+    graph = _build_graph([
+        (None, "a"), (None, "b"),
+        ("a", "c"), ("a", "d"), ("b", "c"), ("c", "d"),
+    ])
+    traces = trace_graph(graph)
+    assert set(traces.order[:2]) == {"a", "b"}
+    assert traces.order.index("c") < traces.order.index("d")
+    assert traces.get_routes("a") == set()
+    assert traces.get_routes("d") == {"a", "b"}
+    assert traces.get_parents("a") == [None]
+    assert traces.get_parents("d") == ["a", "c"]
+    assert sorted(traces.iter_paths("d")) == [
+        [None, "a"], [None, "a", "c"], [None, "b", "c"],
+    ]
+
+
+def test_trace_graph_cycle():
+    graph = _build_graph([
+        (None, "a"), ("a", "b"), ("b", "c"), ("c", "b"), ("c", "a"),
+    ])
+    traces = trace_graph(graph)
+    assert traces.components == [["a", "b", "c"]]
+    assert traces.get_routes("a") == set()
+    assert traces.get_routes("c") == {"a"}
+    # "c" can only be reached through "b", so it is not a parent of "b".
+    assert traces.get_parents("b") == ["a"]
+    # "c" can only be reached through "a", so it is not a parent of "a".
+    assert traces.get_parents("a") == [None]